@@ -0,0 +1,90 @@
+'''
+Benchmark of the become plugins build_become_command on large module payloads,
+such as the ones of ANSIBLE_PIPELINING. Requires ansible to be installed.
+The capable plugin is timed writing a single policy, sharded policies and
+looking the tasks up in a discovery cache.
+
+Prints one JSON object per plugin, mode and payload size, e.g.:
+    python3 benchmarks/become_command.py --sizes 1000 100000 1000000
+'''
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import tempfile
+import importlib.util
+
+PLUGINS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scenario', 'become_plugins')
+
+def load_plugin(name):
+    spec = importlib.util.spec_from_file_location(f"become_{name}", os.path.join(PLUGINS_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def module_command(size, seed=0):
+    '''
+    Shell command running a module whose payload of size bytes is inlined in the command.
+    '''
+    payload = base64.b64encode(random.Random(seed).randbytes(size * 3 // 4)).decode()
+    tmpdir = "/tmp/ansible-tmp-1700000000.0-1234-567890123456789"
+    return (f"/bin/sh -c 'echo {payload} | /usr/bin/python3 {tmpdir}/AnsiballZ_apt.py "
+            f"&& rm -f -r {tmpdir}/ > /dev/null 2>&1 && sleep 0'")
+
+TASK_FLAGS = '-r playbooks/scenario.yml -t 00000000-0000-0000-0000-000000000000'
+
+def capable_plugins(cache_dir):
+    '''
+    The capable plugin, which reads the playbook from the CLI arguments when instantiated,
+    configured for each discovery mode.
+    '''
+    from ansible import context
+    context._init_global_context(argparse.Namespace(args=['playbooks/scenario.yml']))
+    module = load_plugin('capable')
+    common = {'become_exe': '/usr/bin/gensr', 'become_flags': TASK_FLAGS, 'untraced_become_exe': 'sudo -n',
+              'inventory_hostname': 'webserver', 'rootasrole_policy_output': '/tmp/capable_output.json',
+              'rootasrole_policy_shards_dir': '', 'rootasrole_discovery_cache_dir': ''}
+    modes = {
+        'single': {},
+        'sharded': {'rootasrole_policy_shards_dir': '/tmp/capable_output.d'},
+        'cached': {'rootasrole_policy_shards_dir': '/tmp/capable_output.d', 'rootasrole_discovery_cache_dir': cache_dir},
+    }
+    task_keys = {'name': 'Install apache2', 'action': 'ansible.builtin.apt',
+                 'args': {'name': 'apache2', 'state': 'present'}}
+    for mode, options in modes.items():
+        plugin = module.BecomeModule()
+        plugin.set_options(task_keys=task_keys, direct={**common, **options})
+        yield mode, plugin
+
+def main():
+    parser = argparse.ArgumentParser(description="build_become_command benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10**3, 10**5, 10**6])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    dosr = load_plugin('dosr').BecomeModule()
+    dosr.set_options(direct={'become_flags': TASK_FLAGS})
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        plugins = [('dosr', 'default', dosr)] + [('capable', mode, plugin) for mode, plugin in capable_plugins(cache_dir)]
+        for size in args.sizes:
+            cmd = module_command(size)
+            for name, mode, plugin in plugins:
+                best = float('inf')
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    plugin.build_become_command(cmd, None)
+                    best = min(best, time.perf_counter() - start)
+                print(json.dumps({
+                    "benchmark": "build_become_command",
+                    "plugin": name,
+                    "mode": mode,
+                    "cmd_bytes": len(cmd),
+                    "seconds": round(best, 6),
+                }))
+
+if __name__ == "__main__":
+    main()
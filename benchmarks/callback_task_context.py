@@ -0,0 +1,138 @@
+'''
+Benchmark of the task context hot path of the capable callback plugin: the callbacks
+run by the strategy for each task (v2_playbook_on_task_start) and each task on each host
+(v2_runner_on_start, v2_runner_on_ok), compared to the former per-task rewrite of a shared file.
+Requires ansible to be installed.
+
+Prints one JSON object per implementation and size, e.g.:
+    python3 benchmarks/callback_task_context.py --tasks 1000 5000 --hosts 10 50
+
+With --writers N, N processes also share a single task context log, as concurrent
+playbooks would, and the log is checked to hold every record, each on its own line.
+'''
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import multiprocessing
+import tempfile
+import importlib.util
+
+CALLBACKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scenario', 'callback_plugins')
+
+def load_callback(name):
+    spec = importlib.util.spec_from_file_location(f"callback_{name}", os.path.join(CALLBACKS_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class Host:
+    def __init__(self, name):
+        self.name = name
+
+    def get_name(self):
+        return self.name
+
+class Task:
+    def __init__(self, index):
+        self._uuid = f"task-{index}"
+        self.name = f"Task {index}"
+        self.action = "ansible.builtin.command"
+        self.become = True
+        self.become_method = "capable"
+        self.become_flags = f"-r playbooks/scenario.yml -t {uuid.UUID(int=index)}"
+
+    def get_name(self):
+        return self.name
+
+class Result:
+    def __init__(self, host, task):
+        self._host = host
+        self._task = task
+
+def legacy_task_start(task):
+    # former v2_playbook_on_task_start
+    import re
+    match = re.search(r'\[id:([a-f0-9\-]+)\]', task.name)
+    if match:
+        os.environ['ANSIBLE_CAPABLE_TASK_UUID'] = match.group(1)
+    with open(os.path.join(tempfile.gettempdir(), "ansible_capable_current_uuid_bench"), "w") as f:
+        f.write(task._uuid)
+
+def run_legacy(tasks, hosts):
+    for task in tasks:
+        legacy_task_start(task)
+
+def run_callback(module, tasks, hosts, log_path):
+    callback = module.CallbackModule()
+    callback.set_options(direct={'task_context_log': log_path, 'profile_output': ''})
+    for task in tasks:
+        callback.v2_playbook_on_task_start(task, False)
+        for host in hosts:
+            callback.v2_runner_on_start(host, task)
+        for host in hosts:
+            callback.v2_runner_on_ok(Result(host, task))
+    callback._context_log.close()
+
+def run_writer(args):
+    task_count, host_count, log_path = args
+    run_callback(load_callback('capable'), [Task(i) for i in range(task_count)],
+                 [Host(f"host{i}") for i in range(host_count)], log_path)
+
+def check_concurrent_writers(writers, task_count, host_count, log_path):
+    start = time.perf_counter()
+    with multiprocessing.Pool(writers) as pool:
+        pool.map(run_writer, [(task_count, host_count, log_path)] * writers)
+    seconds = time.perf_counter() - start
+    with open(log_path) as f:
+        records = [json.loads(line) for line in f]
+    return {
+        "benchmark": "callback_task_context",
+        "implementation": "task_context_concurrent",
+        "writers": writers,
+        "tasks": task_count,
+        "hosts": host_count,
+        "seconds": round(seconds, 6),
+        "records": len(records),
+        "lossless": len(records) == writers * task_count * host_count,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="capable callback task context benchmark")
+    parser.add_argument('--tasks', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--hosts', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--writers', type=int, default=0)
+    args = parser.parse_args()
+
+    module = load_callback('capable')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for task_count in args.tasks:
+            tasks = [Task(i) for i in range(task_count)]
+            for host_count in args.hosts:
+                hosts = [Host(f"host{i}") for i in range(host_count)]
+                log_path = os.path.join(tmp_dir, f"context-{task_count}-{host_count}.jsonl")
+                for name, run in (("legacy", lambda: run_legacy(tasks, hosts)),
+                                  ("task_context", lambda: run_callback(module, tasks, hosts, log_path))):
+                    start = time.perf_counter()
+                    run()
+                    seconds = time.perf_counter() - start
+                    result = {
+                        "benchmark": "callback_task_context",
+                        "implementation": name,
+                        "tasks": task_count,
+                        "hosts": host_count,
+                        "seconds": round(seconds, 6),
+                        "us_per_task_host": round(seconds / (task_count * host_count) * 1e6, 3),
+                    }
+                    if name == "task_context":
+                        with open(log_path) as f:
+                            result["records"] = sum(1 for _ in f)
+                    print(json.dumps(result))
+                if args.writers:
+                    print(json.dumps(check_concurrent_writers(args.writers, task_count, host_count,
+                                                              os.path.join(tmp_dir, f"shared-{task_count}-{host_count}.jsonl"))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+'''
+Benchmark of inject_uuids over synthetic playbook/role trees: a cold run, a warm run
+with an unchanged manifest and a run after editing a single file.
+
+Prints one JSON object per tree size and run, e.g.:
+    python3 benchmarks/inject_uuids.py --roles 10 100 --depth 3 --tasks-per-file 20 --jobs 4
+'''
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rootasansible.playbooks import inject_uuids  # noqa: E402
+from synthetic import synthetic_playbook_tree  # noqa: E402
+
+def touch_one_file(root):
+    path = os.path.join(root, "roles", "role0", "tasks", "main.yml")
+    with open(path, 'a') as f:
+        f.write("- name: Edited task\n  ansible.builtin.command: /usr/bin/true\n  become: true\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="inject_uuids benchmark")
+    parser.add_argument('--roles', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--depth', type=int, default=2, help="Depth of the import_tasks chain of each role")
+    parser.add_argument('--tasks-per-file', type=int, default=10)
+    parser.add_argument('--become-share', type=float, default=0.5)
+    parser.add_argument('--jobs', '-j', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    for roles in args.roles:
+        with tempfile.TemporaryDirectory() as root:
+            files, tasks = synthetic_playbook_tree(root, roles=roles, depth=args.depth,
+                                                   tasks_per_file=args.tasks_per_file,
+                                                   become_share=args.become_share, seed=args.seed)
+            manifest = os.path.join(root, ".cache", "uuid_manifest.json")
+            for run in ("cold", "warm", "one_file_changed"):
+                if run == "one_file_changed":
+                    touch_one_file(root)
+                start = time.perf_counter()
+                timings = inject_uuids(root, jobs=args.jobs, manifest_path=manifest)
+                total = time.perf_counter() - start
+                print(json.dumps({
+                    "benchmark": "inject_uuids",
+                    "run": run,
+                    "roles": roles,
+                    "depth": args.depth,
+                    "files": files,
+                    "tasks": tasks,
+                    "jobs": args.jobs,
+                    "seconds": round(total, 6),
+                    **{f"{phase}_seconds": round(value, 6) for phase, value in timings.items()},
+                }))
+
+if __name__ == "__main__":
+    main()
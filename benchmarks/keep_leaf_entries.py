@@ -0,0 +1,39 @@
+'''
+Micro-benchmark of keep_leaf_entries over synthetic path sets.
+
+Prints one JSON object per size, e.g.:
+    python3 benchmarks/keep_leaf_entries.py --sizes 1000 10000 100000 1000000
+'''
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rootasansible.policy import keep_leaf_entries  # noqa: E402
+from synthetic import synthetic_paths  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description="keep_leaf_entries micro-benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10**3, 10**4, 10**5, 10**6])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        data = synthetic_paths(size, depth=max(4, len(str(size))), fanout=max(4, round(size ** 0.25)))
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            leaves = keep_leaf_entries(data)
+            best = min(best, time.perf_counter() - start)
+        print(json.dumps({
+            "benchmark": "keep_leaf_entries",
+            "entries": len(data),
+            "leaves": len(leaves),
+            "seconds": round(best, 6),
+            "us_per_entry": round(best / len(data) * 1e6, 3),
+        }))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+'''
+Benchmark of merge_security_policies against synthetic generated policies.
+The base policy is the one of the scenario, the scenario and generated policies
+are synthetic and hold the given number of tasks.
+
+Prints one JSON object per size, e.g.:
+    python3 benchmarks/merge_security_policies.py --sizes 100 1000 10000 100000
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT_DIR)
+from rootasansible.policy import merge_security_policies  # noqa: E402
+from synthetic import synthetic_policies  # noqa: E402
+
+BASE_POLICY = os.path.join(ROOT_DIR, "scenario", "templates", "sr_rootasrole.json")
+
+def main():
+    parser = argparse.ArgumentParser(description="merge_security_policies benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10**2, 10**3, 10**4, 10**5])
+    parser.add_argument('--files-per-task', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-compact', action='store_true', help="Benchmark without the policy compaction")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as build_dir:
+            templates_dir = os.path.join(build_dir, "templates")
+            synthetic_policies(templates_dir, size, files_per_task=args.files_per_task, seed=args.seed)
+            shutil.copy(BASE_POLICY, templates_dir)
+
+            best = float('inf')
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                merge_security_policies(build_dir, compact=not args.no_compact)
+                best = min(best, time.perf_counter() - start)
+
+            merged_path = os.path.join(templates_dir, "result_sr_rootasrole.json")
+            with open(merged_path, 'r') as f:
+                merged_tasks = sum(len(role.get("tasks", [])) for role in json.load(f)["roles"])
+            print(json.dumps({
+                "benchmark": "merge_security_policies",
+                "tasks": size,
+                "compact": not args.no_compact,
+                "generated_bytes": os.path.getsize(os.path.join(templates_dir, "result.json")),
+                "merged_bytes": os.path.getsize(merged_path),
+                "merged_tasks": merged_tasks,
+                "seconds": round(best, 6),
+                "us_per_task": round(best / size * 1e6, 3),
+            }))
+
+if __name__ == "__main__":
+    main()
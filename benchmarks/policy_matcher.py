@@ -0,0 +1,87 @@
+'''
+Benchmark of the offline policy simulator: matching command lines against synthetic
+policies, with distinct command lines and with command logs repeating them.
+
+Prints one JSON object per policy size and log, e.g.:
+    python3 benchmarks/policy_matcher.py --tasks 100 10000 --lines 1000000
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rootasansible.matcher import PolicyMatcher  # noqa: E402
+
+EXECUTABLES = 64
+
+def synthetic_policy(tasks, seed=0):
+    '''
+    Policy of tasks tasks in roles of 50, each granting a few anchored regexes and literal
+    command lines over EXECUTABLES executables, one task in a hundred granting all commands
+    but one.
+    '''
+    rng = random.Random(seed)
+    roles = []
+    for t in range(tasks):
+        if t % 50 == 0:
+            roles.append({"name": f"role{t // 50}", "tasks": []})
+        if t % 100 == 99:
+            commands = {"default": "all", "del": [f"/usr/bin/app{rng.randrange(EXECUTABLES)} --task{t}"]}
+        else:
+            commands = {"default": "none", "add": [
+                f"/usr/bin/app{rng.randrange(EXECUTABLES)} '^--task{t} -f \"?/var/lib/app{t}/[^\"]*\"?$'",
+                f"/usr/bin/app{rng.randrange(EXECUTABLES)} --literal{t}",
+            ]}
+        roles[-1]["tasks"].append({"name": f"task{t}", "commands": commands})
+    return {"roles": roles}
+
+def command_lines(policy, count, distinct, seed=0):
+    rng = random.Random(seed)
+    lines = []
+    for task in (t for r in policy["roles"] for t in r["tasks"]):
+        for command in task["commands"].get("add", []):
+            exe, _, args = command.partition(' ')
+            if args.startswith("'"):
+                n = task["name"][4:]
+                args = f"--task{n} -f /var/lib/app{n}/file{rng.randrange(1000)}"
+            lines.append(f"{exe} {args}")
+    lines += [f"/usr/bin/app{rng.randrange(EXECUTABLES)} --unknown{i}" for i in range(len(lines) // 10 + 1)]
+    pool = [rng.choice(lines) for _ in range(distinct)]
+    return [rng.choice(pool) for _ in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description="PolicyMatcher benchmark")
+    parser.add_argument('--tasks', type=int, nargs='+', default=[10**2, 10**3, 10**4])
+    parser.add_argument('--lines', type=int, default=10**6, help="Command lines of the repeated log")
+    parser.add_argument('--distinct', type=int, default=10**4, help="Distinct command lines of the log")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for tasks in args.tasks:
+        policy = synthetic_policy(tasks, seed=args.seed)
+        start = time.perf_counter()
+        matcher = PolicyMatcher(policy)
+        compile_seconds = time.perf_counter() - start
+
+        lines = command_lines(policy, args.lines, args.distinct, seed=args.seed)
+        for log, sample in (("distinct", list(dict.fromkeys(lines))), ("repeated", lines)):
+            matcher._cache.clear()
+            start = time.perf_counter()
+            authorised = sum(1 for line in sample if matcher.match(line) is not None)
+            elapsed = time.perf_counter() - start
+            print(json.dumps({
+                "benchmark": "policy_matcher",
+                "tasks": tasks,
+                "log": log,
+                "lines": len(sample),
+                "authorised": authorised,
+                "compile_seconds": round(compile_seconds, 6),
+                "seconds": round(elapsed, 6),
+                "lines_per_second": round(len(sample) / elapsed),
+            }))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+'''
+Benchmark of the typed policy model against the dicts of json.load: memory held by a
+synthetic policy, lossless round trip, and inclusion check against a copy with one
+task less privileged.
+
+Prints one JSON object per size, e.g.:
+    python3 benchmarks/policy_model.py --sizes 1000 10000 100000
+'''
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rootasansible.model import Policy, PolicyInterner  # noqa: E402
+from synthetic import synthetic_policies  # noqa: E402
+
+def held_memory(load):
+    '''
+    Result of load and the memory it still holds once loaded.
+    '''
+    gc.collect()
+    tracemalloc.start()
+    value = load()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+def main():
+    parser = argparse.ArgumentParser(description="Policy model benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10**3, 10**4, 10**5])
+    parser.add_argument('--files-per-task', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as templates_dir:
+            synthetic_policies(templates_dir, size, files_per_task=args.files_per_task, seed=args.seed)
+            path = os.path.join(templates_dir, "sr_scenario.json")
+            with open(path, 'r') as f:
+                text = f.read()
+
+        data, dict_bytes = held_memory(lambda: json.loads(text))
+        policy, model_bytes = held_memory(lambda: Policy.load(json.loads(text)))
+        lossless = policy.to_json() == data
+        del policy
+        start = time.perf_counter()
+        Policy.load(json.loads(text))
+        load_seconds = time.perf_counter() - start
+
+        # last week's policy and the new one, where a task lost a capability
+        changed = json.loads(text)
+        task = next(t for r in reversed(changed["roles"]) for t in reversed(r["tasks"]) if t["cred"]["capabilities"])
+        task["cred"]["capabilities"] = task["cred"]["capabilities"][1:]
+        interner = PolicyInterner()
+        reference = Policy.load(data, interner)
+        new = Policy.load(changed, interner)
+        start = time.perf_counter()
+        less = new < reference
+        compare_seconds = time.perf_counter() - start
+
+        print(json.dumps({
+            "benchmark": "policy_model",
+            "tasks": size,
+            "dict_bytes": dict_bytes,
+            "model_bytes": model_bytes,
+            "memory_ratio": round(dict_bytes / model_bytes, 2),
+            "lossless": lossless,
+            "strictly_less": less,
+            "load_seconds": round(load_seconds, 6),
+            "seconds": round(compare_seconds, 6),
+        }))
+
+if __name__ == "__main__":
+    main()
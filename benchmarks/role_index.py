@@ -0,0 +1,62 @@
+'''
+Benchmark of the role resolution of inject_uuids over synthetic Galaxy-like trees: roles
+found through the roles_path of ansible.cfg and in collections, referenced from plays,
+include_role and import_role tasks, and chained by meta dependencies. Reports the time to
+build the role index and the share of role tasks that got an identifier.
+
+Prints one JSON object per tree size, e.g.:
+    python3 benchmarks/role_index.py --roles 100 1000 --chain 5
+'''
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rootasansible.playbooks import inject_uuids  # noqa: E402
+from synthetic import synthetic_role_tree  # noqa: E402
+
+def covered_tasks(task_files):
+    covered = 0
+    for path in task_files:
+        with open(path, 'r') as f:
+            covered += sum(1 for task in yaml.safe_load(f) if ' -t ' in task.get('become_flags', ''))
+    return covered
+
+def main():
+    parser = argparse.ArgumentParser(description="Role index benchmark")
+    parser.add_argument('--roles', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--chain', type=int, default=5, help="Roles of each meta dependency chain")
+    parser.add_argument('--collections', type=int, default=2)
+    parser.add_argument('--tasks-per-file', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    for roles in args.roles:
+        with tempfile.TemporaryDirectory() as root:
+            task_files, tasks = synthetic_role_tree(root, roles=roles, chain=args.chain, collections=args.collections,
+                                                    tasks_per_file=args.tasks_per_file, seed=args.seed)
+            start = time.perf_counter()
+            timings = inject_uuids(root)
+            total = time.perf_counter() - start
+            covered = covered_tasks(task_files)
+            print(json.dumps({
+                "benchmark": "role_index",
+                "roles": roles,
+                "chain": args.chain,
+                "collections": args.collections,
+                "role_tasks": tasks,
+                "covered_tasks": covered,
+                "coverage": round(covered / tasks, 4),
+                "seconds": round(total, 6),
+                **{f"{phase}_seconds": round(value, 6) for phase, value in timings.items()},
+            }))
+
+if __name__ == "__main__":
+    main()
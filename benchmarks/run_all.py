@@ -0,0 +1,104 @@
+'''
+Run the benchmark suite, write its results as JSON lines and compare them to a baseline.
+Runs offline and without Docker, the become plugins benchmark is skipped if ansible is not installed.
+
+Exits with a non-zero status if a result is slower than its baseline by more than the tolerance, e.g.:
+    python3 benchmarks/run_all.py --output .cache/benchmarks.jsonl
+    python3 benchmarks/run_all.py --baseline .cache/benchmarks.jsonl --tolerance 0.25
+'''
+import os
+import sys
+import json
+import argparse
+import subprocess
+import importlib.util
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SUITE = {
+    'quick': [
+        ['keep_leaf_entries.py', '--sizes', '1000', '10000', '100000'],
+        ['inject_uuids.py', '--roles', '10', '100'],
+        ['role_index.py', '--roles', '100', '1000'],
+        ['merge_security_policies.py', '--sizes', '100', '1000', '10000'],
+        ['become_command.py', '--sizes', '1000', '100000', '1000000'],
+        ['policy_matcher.py', '--tasks', '100', '1000', '--lines', '100000'],
+        ['policy_model.py', '--sizes', '1000', '10000'],
+    ],
+    'full': [
+        ['keep_leaf_entries.py', '--sizes', '1000', '10000', '100000', '1000000'],
+        ['inject_uuids.py', '--roles', '10', '100', '1000', '--depth', '3'],
+        ['role_index.py', '--roles', '100', '1000', '10000'],
+        ['merge_security_policies.py', '--sizes', '100', '1000', '10000', '100000'],
+        ['become_command.py', '--sizes', '1000', '100000', '1000000'],
+        ['policy_matcher.py', '--tasks', '100', '1000', '10000', '--lines', '1000000'],
+        ['policy_model.py', '--sizes', '1000', '10000', '100000'],
+    ],
+}
+
+TIMING_SUFFIX = "seconds"
+MEASURES = ("generated_bytes", "merged_bytes", "merged_tasks", "leaves", "authorised", "lines_per_second",
+            "dict_bytes", "model_bytes", "memory_ratio", "lossless", "strictly_less", "covered_tasks", "coverage")
+
+def result_key(result):
+    '''
+    Identify a result by its parameters, i.e. every field that is not a measure.
+    '''
+    return json.dumps({k: v for k, v in result.items()
+                       if not k.endswith(TIMING_SUFFIX) and not k.startswith("us_per_")
+                       and k not in MEASURES}, sort_keys=True)
+
+def run_benchmark(args):
+    if args[0] == 'become_command.py' and importlib.util.find_spec('ansible') is None:
+        print(f"Skipping {args[0]}: ansible is not installed", file=sys.stderr)
+        return []
+    out = subprocess.run([sys.executable, os.path.join(BENCHMARKS_DIR, args[0]), *args[1:]],
+                         check=True, stdout=subprocess.PIPE, text=True).stdout
+    return [json.loads(line) for line in out.splitlines() if line.strip()]
+
+def load_results(path):
+    with open(path, 'r') as f:
+        return {result_key(r): r for r in map(json.loads, f) if r}
+
+def compare(results, baseline, tolerance):
+    '''
+    Return the results whose total time exceeds the baseline one by more than tolerance.
+    '''
+    regressions = []
+    for result in results:
+        reference = baseline.get(result_key(result))
+        if not reference or not reference.get("seconds"):
+            continue
+        ratio = result["seconds"] / reference["seconds"]
+        if ratio > 1 + tolerance:
+            regressions.append({**result, "baseline_seconds": reference["seconds"], "ratio": round(ratio, 3)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite runner")
+    parser.add_argument('--suite', choices=SUITE.keys(), default='quick')
+    parser.add_argument('--output', help="Write the results to this JSON lines file")
+    parser.add_argument('--baseline', help="Compare the results to this JSON lines file")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown over the baseline")
+    args = parser.parse_args()
+
+    results = []
+    for benchmark in SUITE[args.suite]:
+        for result in run_benchmark(benchmark):
+            print(json.dumps(result))
+            results.append(result)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            f.writelines(json.dumps(result) + '\n' for result in results)
+
+    if args.baseline:
+        regressions = compare(results, load_results(args.baseline), args.tolerance)
+        for regression in regressions:
+            print(json.dumps({"regression": regression}), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
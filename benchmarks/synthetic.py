@@ -0,0 +1,167 @@
+'''
+Generators of synthetic inputs for the benchmarks: playbook/role trees, traced file
+policies and RootAsRole policies, all deterministic for a given seed.
+'''
+import os
+import json
+import random
+
+import yaml
+
+MODULES = [
+    ("ansible.builtin.apt", lambda i: {"name": f"package{i}", "state": "present"}),
+    ("ansible.builtin.file", lambda i: {"path": f"/var/lib/app{i}", "state": "directory", "mode": "0755"}),
+    ("ansible.builtin.copy", lambda i: {"src": f"files/app{i}.conf", "dest": f"/etc/app{i}.conf", "mode": "0644"}),
+    ("ansible.builtin.command", lambda i: {"cmd": f"/usr/bin/app{i} --init", "creates": f"/var/lib/app{i}/.init"}),
+    ("ansible.builtin.service", lambda i: {"name": f"app{i}", "state": "restarted"}),
+]
+
+CAPABILITIES = ["CHOWN", "DAC_OVERRIDE", "DAC_READ_SEARCH", "FOWNER", "FSETID", "KILL", "SETGID", "SETUID",
+                "NET_ADMIN", "NET_BIND_SERVICE", "SYS_ADMIN", "AUDIT_WRITE"]
+
+def synthetic_paths(count, depth=6, fanout=8, seed=0):
+    '''
+    Generate count distinct paths looking like a traced file policy: directories
+    and files mixed at random depths, so that many paths are parents of others.
+    '''
+    rng = random.Random(seed)
+    paths = {"/": "R"}
+    while len(paths) < count:
+        parts = [f"d{rng.randrange(fanout)}" for _ in range(rng.randint(1, depth))]
+        paths["/" + "/".join(parts)] = rng.choice(("R", "W", "RW", "WX"))
+    return paths
+
+def synthetic_task(rng, index, become_share):
+    module, args = MODULES[index % len(MODULES)]
+    task = {"name": f"Task {index}", module: args(index)}
+    if rng.random() < become_share:
+        task["become"] = True
+    return task
+
+def write_yaml(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        yaml.safe_dump(data, f, sort_keys=False)
+
+def synthetic_playbook_tree(root, roles=10, depth=2, tasks_per_file=10, become_share=0.5, seed=0):
+    '''
+    Write a playbook tree under root: playbooks/site.yml applies roles roles, each role
+    tasks/main.yml importing a chain of depth task files, and every file holding tasks_per_file
+    tasks, a become_share of which use become. Returns the number of files and tasks written.
+    '''
+    rng = random.Random(seed)
+    files = tasks = 0
+    index = 0
+
+    for r in range(roles):
+        role_dir = os.path.join(root, "roles", f"role{r}", "tasks")
+        for level in range(depth + 1):
+            name = "main.yml" if level == 0 else f"include{level}.yml"
+            data = []
+            for _ in range(tasks_per_file):
+                data.append(synthetic_task(rng, index, become_share))
+                index += 1
+            if level < depth:
+                data.append({"name": f"Import level {level + 1}",
+                             "ansible.builtin.import_tasks": f"include{level + 1}.yml"})
+            write_yaml(os.path.join(role_dir, name), data)
+            files += 1
+            tasks += tasks_per_file
+
+    plays = []
+    for r in range(roles):
+        play_tasks = []
+        for _ in range(tasks_per_file):
+            play_tasks.append(synthetic_task(rng, index, become_share))
+            index += 1
+        tasks += tasks_per_file
+        plays.append({"name": f"Play {r}", "hosts": "webserver", "become": rng.random() < become_share,
+                      "roles": [f"role{r}"], "tasks": play_tasks})
+    write_yaml(os.path.join(root, "playbooks", "site.yml"), plays)
+    files += 1
+    return files, tasks
+
+def synthetic_role_tree(root, roles=100, chain=5, collections=2, tasks_per_file=10, seed=0):
+    '''
+    Write a playbook tree under root resolving its roles like a Galaxy install: ansible.cfg sets
+    roles_path to galaxy_roles, every fourth role lives in one of collections collections, and
+    the roles form chains of chain roles, each depending on the next one in its meta/main.yml.
+    Only the head of each chain is referenced by playbooks/site.yml, alternately from the roles
+    of a become play, an include_role and an import_role task. Role tasks have no become of their
+    own. Returns the tasks files of the roles and the number of role tasks written.
+    '''
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, "ansible.cfg"), 'w') as f:
+        f.write("[defaults]\nroles_path = ./galaxy_roles\n")
+
+    refs = []
+    role_dirs = []
+    for r in range(roles):
+        if collections and r % 4 == 3:
+            collection = f"coll{r % collections}"
+            refs.append(f"bench.{collection}.role{r}")
+            role_dirs.append(os.path.join(root, "collections", "ansible_collections", "bench", collection, "roles", f"role{r}"))
+        else:
+            refs.append(f"role{r}")
+            role_dirs.append(os.path.join(root, "galaxy_roles", f"role{r}"))
+
+    for r, role_dir in enumerate(role_dirs):
+        write_yaml(os.path.join(role_dir, "tasks", "main.yml"),
+                   [synthetic_task(rng, r * tasks_per_file + i, 0) for i in range(tasks_per_file)])
+        dependencies = [{"role": refs[r + 1]}] if (r + 1) % chain and r + 1 < roles else []
+        write_yaml(os.path.join(role_dir, "meta", "main.yml"), {"dependencies": dependencies})
+
+    plays = []
+    for n, r in enumerate(range(0, roles, chain)):
+        play = {"name": f"Play {r}", "hosts": "webserver", "become": True}
+        if n % 3 == 0:
+            play["roles"] = [refs[r]]
+        else:
+            key = "ansible.builtin.include_role" if n % 3 == 1 else "ansible.builtin.import_role"
+            play["tasks"] = [{"name": f"Apply role {r}", key: {"name": refs[r]}}]
+        plays.append(play)
+    write_yaml(os.path.join(root, "playbooks", "site.yml"), plays)
+    return [os.path.join(d, "tasks", "main.yml") for d in role_dirs], roles * tasks_per_file
+
+def synthetic_task_rights(rng, files_per_task):
+    return {
+        "cred": {
+            "capabilities": sorted(rng.sample(CAPABILITIES, rng.randint(0, 4))),
+            "files": synthetic_paths(files_per_task, depth=4, fanout=4, seed=rng.randrange(1 << 30)),
+        },
+        "commands": [f"^/usr/bin/app{rng.randrange(64)} .*$" for _ in range(rng.randint(1, 3))],
+        "options": {"timeout": {"type": "ppid", "duration": "00:05:00"}},
+    }
+
+def synthetic_policies(templates_dir, tasks, tasks_per_role=50, files_per_task=20, seed=0):
+    '''
+    Write templates_dir/sr_scenario.json and the matching generated templates_dir/result.json
+    holding tasks tasks, grouped in roles of tasks_per_role tasks by purpose, plus as many roles
+    that do not match the scenario. A quarter of the tasks share the rights of another task,
+    so that the compaction has equivalent tasks to merge.
+    '''
+    rng = random.Random(seed)
+    scenario_roles = []
+    generated_roles = []
+    rights = []
+    for r in range((tasks + tasks_per_role - 1) // tasks_per_role):
+        purpose = f"roles/role{r}/tasks/main.yml"
+        scenario_tasks = []
+        generated_tasks = []
+        for t in range(min(tasks_per_role, tasks - r * tasks_per_role)):
+            task_rights = rng.choice(rights) if rights and rng.random() < 0.25 else synthetic_task_rights(rng, files_per_task)
+            rights.append(task_rights)
+            name = f"{r:08x}-0000-4000-8000-{t:012x}"
+            scenario_tasks.append({"purpose": f"Task {t}", **json.loads(json.dumps(task_rights))})
+            generated_tasks.append({"name": name, "purpose": f"Task {t}", **task_rights})
+        scenario_roles.append({"purpose": purpose, "actors": [{"type": "group", "groups": ["ansible"]}],
+                               "tasks": scenario_tasks})
+        generated_roles.append({"name": purpose, "purpose": purpose, "tasks": generated_tasks})
+        generated_roles.append({"name": f"unrelated{r}", "purpose": f"unrelated{r}", "tasks": generated_tasks[:1]})
+
+    os.makedirs(templates_dir, exist_ok=True)
+    with open(os.path.join(templates_dir, "sr_scenario.json"), 'w') as f:
+        json.dump({"roles": scenario_roles}, f)
+    with open(os.path.join(templates_dir, "result.json"), 'w') as f:
+        json.dump({"version": "3.3.1", "roles": generated_roles}, f)
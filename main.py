@@ -1,12 +1,20 @@
 import os
 import argparse
-from pathlib import PurePosixPath
 import shutil
-import uuid
 import subprocess
 import yaml
 import logging
 import json
+import asyncio
+
+from rootasansible.discovery import invalidate_discovery_cache, run_discovery_step, run_parallel_discovery_step
+from rootasansible.matcher import check_command_log
+from rootasansible.model import compare_policies
+from rootasansible.playbooks import inject_uuids
+from rootasansible.policy import TASK_ALIASES, merge_security_policies
+from rootasansible.sandbox import SANDBOX_CONTAINER, ask_become_pass, sandbox_container, sandbox_image_vars, sandbox_ip
+from rootasansible.steps import STEPS
+from rootasansible.vendoring import ARTIFACTS, TreeSync, VENDOR_MODES, fetch_artifacts, format_size
 
 class ColoredFormatter(logging.Formatter):
     grey = "\x1b[38;20m"
@@ -44,240 +52,13 @@ def setup_logger():
     handler.setFormatter(ColoredFormatter())
     logger.addHandler(handler)
 
-def inject_uuids(playbook_dir):
-    '''
-    Inject unique UUIDs into become_flags for each task in the playbook.
-    This allows for generating stable identifiers for RootAsRole tasks generation and execution.
-    The identifiers will be a sha224 of the playbook_path as a -r parameter and a uuid4 as -t parameter.
-    
-    Traverses playbooks, roles, and imports to handle 'become' inheritance correctly.
-    '''
-    
-    # Track processed files to avoid infinite loops and re-processing
-    # Map: absolute_path -> processed_with_become (bool)
-    # If we processed a file with become=False, and encounter it with become=True, we re-process.
-    processed_files = {}
-
-    def get_bool_attribute(item, key, default=False):
-        val = item.get(key, default)
-        if isinstance(val, str):
-            return val.lower() in ('yes', 'true')
-        return bool(val)
-
-    def process_file(file_path, inherited_become=False):
-        abs_path = os.path.abspath(file_path)
-
-        if abs_path in processed_files:
-            # If already processed with True, we are good (True includes False case effectively for modifications)
-            if processed_files[abs_path]:
-                return
-            # If processed with False, but now inherited_become is False, no need to upgrade
-            if not inherited_become:
-                return
-            # If processed with False, and now inherited_become is True, we proceed to re-scan
-        
-        if not os.path.exists(abs_path):
-            return
-
-        try:
-            with open(abs_path, 'r') as f:
-                data = yaml.safe_load(f)
-        except Exception as e:
-            logging.warning(f"Skipping {abs_path}: {e}")
-            return
-
-        if not isinstance(data, list):
-            # Mark simple files not containing list as processed to skip later
-            processed_files[abs_path] = inherited_become
-            return
-
-        # Determine if it is a playbook or a task list directly
-        is_playbook = False
-        import_playbook_keys = ['import_playbook', 'ansible.builtin.import_playbook']
-        for entry in data:
-            if isinstance(entry, dict):
-                if 'hosts' in entry:
-                    is_playbook = True
-                    break
-                # Check for any import_playbook variant
-                if any(k in entry for k in import_playbook_keys):
-                    is_playbook = True
-                    break
-        
-        modified = False
-        role_name = os.path.relpath(abs_path, os.path.abspath(playbook_dir))
-
-        def process_tasks(tasks, current_context_become):
-            task_modified = False
-            if not isinstance(tasks, list):
-                return False
-
-            for task in tasks:
-                if not isinstance(task, dict): continue
-
-                # Determine effective become for this task
-                task_become = get_bool_attribute(task, 'become', current_context_become)
-                
-                # Check for imports/includes
-                target_file = None
-                # Check standard and fully qualified names
-                import_keys = [
-                    'include', 'include_tasks', 'import_tasks',
-                    'ansible.builtin.include', 'ansible.builtin.include_tasks', 'ansible.builtin.import_tasks'
-                ]
-                
-                for key in import_keys:
-                    if key in task:
-                        val = task[key]
-                        if isinstance(val, dict): val = val.get('file')
-                        if isinstance(val, str) and '{{' not in val:
-                            target_file = val
-                        break
-                
-                if target_file:
-                    # Resolve path relative to current file
-                    child_path = os.path.join(os.path.dirname(abs_path), target_file)
-                    process_file(child_path, task_become)
-                
-                # Handling blocks (recursion within file)
-                if 'block' in task:
-                    if process_tasks(task['block'], task_become):
-                        task_modified = True
-                    if 'rescue' in task:
-                         if process_tasks(task['rescue'], task_become):
-                             task_modified = True
-                    if 'always' in task:
-                         if process_tasks(task['always'], task_become):
-                             task_modified = True
-
-                if task.get('become_method'):
-                    continue
-                
-                # We enforce injection if effective_become is True
-                if task_become:
-                    # Check if already injected
-                    current_flags = task.get('become_flags', '')
-                    if '-r ' in current_flags and '-t ' in current_flags:
-                        continue
-                        
-                    unique_id = str(uuid.uuid4())
-                    new_flags = f"{current_flags} -r {role_name} -t {unique_id}".strip()
-                    task['become_flags'] = new_flags
-                    task_modified = True
-            
-            return task_modified
-
-        if is_playbook:
-            for play in data:
-                if not isinstance(play, dict): continue
-                
-                if 'import_playbook' in play:
-                     val = play['import_playbook']
-                     if isinstance(val, str) and '{{' not in val:
-                         child_path = os.path.join(os.path.dirname(abs_path), val)
-                         process_file(child_path, False)
-                     continue
-
-                p_become = get_bool_attribute(play, 'become', False)
-                
-                if play.get('become_method'):
-                    pass 
-                
-                # Process roles
-                if 'roles' in play:
-                    for role in play['roles']:
-                        role_name = None
-                        role_become = p_become
-                        
-                        if isinstance(role, str):
-                            role_name = role
-                        elif isinstance(role, dict):
-                            role_name = role.get('role')
-                            role_become = get_bool_attribute(role, 'become', p_become)
-                            
-                        if role_name and '{{' not in role_name:
-                             # Search locations
-                             candidates = [
-                                 os.path.join(os.path.dirname(abs_path), 'roles', role_name),
-                                 os.path.join(playbook_dir, 'roles', role_name)
-                             ]
-                             for c in candidates:
-                                 if os.path.isdir(c):
-                                     role_tasks = os.path.join(c, 'tasks', 'main.yml')
-                                     process_file(role_tasks, role_become)
-                                     role_handlers = os.path.join(c, 'handlers', 'main.yml')
-                                     process_file(role_handlers, role_become)
-                                     break
-                
-                if not play.get('become_method'):
-                    for section in ['pre_tasks', 'tasks', 'post_tasks', 'handlers']:
-                        if section in play:
-                             if process_tasks(play[section], p_become):
-                                 modified = True
-
-        else:
-            # Direct task list
-            if process_tasks(data, inherited_become):
-                modified = True
-
-        if modified:
-            with open(abs_path, 'w') as f:
-                yaml.dump(data, f, default_flow_style=False, sort_keys=False)
-        
-        processed_files[abs_path] = inherited_become
-
-
-    files_to_visit = []
-    if os.path.isdir(playbook_dir):
-        for root, dirs, files in os.walk(playbook_dir):
-            for filename in files:
-                if filename.endswith(('.yml', '.yaml')):
-                    files_to_visit.append(os.path.join(root, filename))
-    else:
-        files_to_visit.append(playbook_dir)
-
-    for full_path in files_to_visit:
-        logging.debug(f"Processing {full_path}...")
-        process_file(full_path, False)
-
-def keep_leaf_entries(data: dict[str, str]) -> dict[str, str]:
-    paths = sorted(PurePosixPath(p) for p in data)
-    leaf_paths = set()
-
-    for i, p in enumerate(paths):
-        if not any(
-            q.parts[:len(p.parts)] == p.parts
-            for q in paths[i + 1:]
-        ):
-            leaf_paths.add(str(p))
-
-    return {p: data[p] for p in leaf_paths}
-
-def clone_and_reset_if_missing(path, url, commit, recursive=False):
-    if not os.path.exists(path):
-        logging.info(f"📥 Cloning {os.path.basename(path)} repository...")
-        cmd = ["git", "clone"]
-        if recursive:
-            cmd.append("--recursive")
-        cmd.extend([url, path])
-        subprocess.run(cmd, check=True)
-        subprocess.run(["git", "reset", "--hard", commit], cwd=path, check=True)
-
-def prepare_environment(workdir_scenario, build_dir):
+def prepare_environment(workdir_scenario, build_dir, jobs=1, cache_dir=None, vendor_mode='auto', mirror_dir=None,
+                        inject_ids=True):
     logging.info("🧪 Starting RootAsAnsible Demonstration...")
+
+    fetch_artifacts(ARTIFACTS, mirror_dir=mirror_dir)
     
-    # Define repositories
-    repos = [
-        ("scenario/artifacts/RootAsRole", "https://github.com/LeChatP/RootAsRole", "5dfa43ca6e2551cd961348664a075ca47b1644e5", False),
-        ("scenario/artifacts/RootAsRole-capable", "https://github.com/LeChatP/RootAsRole-capable", "8fb13559dc9698e2f181756aa6aaa2646e2a85f3", False),
-        ("scenario/artifacts/RootAsRole-gensr", "https://github.com/LeChatP/RootAsRole-gensr", "d8e4b2a943af8b000a6086bcc108a46124357671", False),
-        ("scenario/artifacts/bpftool", "https://github.com/libbpf/bpftool", "5386cfcc1361cec24d51c634f76564e0762d2e22", True)
-    ]
-
-    for path, url, commit, recursive in repos:
-        clone_and_reset_if_missing(path, url, commit, recursive)
-    
-    if os.path.exists(build_dir):
+    if vendor_mode == 'full' and os.path.exists(build_dir):
         shutil.rmtree(build_dir)
 
     logging.info("🚀 Welcome to the RootAsAnsible demonstration!")
@@ -285,69 +66,26 @@ def prepare_environment(workdir_scenario, build_dir):
     logging.info("   Goal: Generate a least-privilege policy based on observation of a \"sandbox\".")
     
     logging.info("📦 Vendoring 'scenario' directory to 'build'...")
-    shutil.copytree(workdir_scenario, build_dir)
-
-    logging.info("💉 Injecting UUIDs into playbooks for tracking...")
-    inject_uuids(build_dir)
-
-def run_discovery_step(build_dir):
-    logging.info("🏗️  Step 1: Running playbook with 'capable' to generate policy...")
-    logging.info("   (This involves building Docker images and compiling dependencies. Please provide sudo password when prompted.)")
-    vendored_playbook = os.path.join("playbooks", "main.yml")
-
-    # set pwd to build dir
-    os.environ['PWD'] = os.path.abspath(build_dir)
-    os.environ['ANSIBLE_BECOME_METHOD'] = "capable"
-    
-    cmd = ["ansible-playbook", vendored_playbook, "-i", "inventory/hosts.yml", "-e", "@vars/vars.yml", "--become-method", "capable"]
-    if not os.environ.get("GITHUB_ACTIONS") and not os.environ.get("CI"):
-        cmd.append("-K")
-
-    try:
-        subprocess.run(
-            cmd,
-            check=True,
-            cwd=build_dir
-        )
-        logging.info("🎉 Success! The RootAsRole policy was generated in 'templates/result.json'.")
-    except subprocess.CalledProcessError as e:
-        logging.error(f"❌ Playbook execution failed: {e}")
-        exit(1)
-
-def merge_security_policies(build_dir):
-    base_policy_path = os.path.join(build_dir, "templates", "sr_rootasrole.json")
-    generated_policy_path = os.path.join(build_dir, "templates", "result.json")
-    scenario_policy_path = os.path.join(build_dir, "templates", "sr_scenario.json")        
-    
-    with open(base_policy_path, 'r') as f:
-        base_policy = json.load(f)
-    with open(scenario_policy_path, 'r') as f:
-        scenario_policy = json.load(f)
-    with open(generated_policy_path, 'r') as f:
-        generated_policy = json.load(f)
-    
-    # Function to update names from generated policy
-    grole_map = {r["purpose"]: r for r in generated_policy["roles"]}
-
-    for role in scenario_policy["roles"]:
-        grole = grole_map.get(role["purpose"])
-        if not grole: continue
-        
-        role["name"] = grole["name"]
-        gtask_map = {t["purpose"]: t for t in grole["tasks"]}
-        
-        for task in role["tasks"]:
-            gtask = gtask_map.get(task["purpose"])
-            if gtask:
-                task["name"] = gtask["name"]
-    
-    base_policy["roles"].extend(scenario_policy["roles"])
-    
-    merged_policy_path = os.path.join(build_dir, "templates", "result_sr_rootasrole.json")
-    with open(merged_policy_path, 'w') as f:
-        json.dump(base_policy, f, indent=4)
+    tree_sync = None
+    if vendor_mode == 'full':
+        shutil.copytree(workdir_scenario, build_dir)
+    else:
+        tree_sync = TreeSync(workdir_scenario, build_dir, mode=vendor_mode)
+        stats = tree_sync.sync()
+        logging.info(f"   {stats['copied']} files copied ({format_size(stats['bytes_copied'])}), "
+                     f"{stats['linked']} linked ({format_size(stats['bytes_linked'])}), "
+                     f"{stats['unchanged']} unchanged, {stats['removed']} removed")
+
+    if inject_ids:
+        logging.info("💉 Injecting UUIDs into playbooks for tracking...")
+        manifest_path = os.path.join(cache_dir, "uuid_manifest.json") if cache_dir else None
+        inject_uuids(build_dir, jobs=jobs, manifest_path=manifest_path)
+    else:
+        logging.info("💉 Task identifiers are assigned in-process by the capable callback.")
+    if tree_sync:
+        tree_sync.save()
 
-def modify_mallory_task(build_dir, filename):
+def modify_mallory_task(build_dir, filename="{{ mallory_leak_file }}", source="{{ mallory_leak_source | default('/etc/shadow') }}"):
     mallory_playbook_path = os.path.join(build_dir, "roles", "mallory_net_input", "tasks", "main.yml")
     with open(mallory_playbook_path, 'r') as f:
         mallory_tasks = yaml.safe_load(f)
@@ -357,7 +95,7 @@ def modify_mallory_task(build_dir, filename):
         'become': True,
         'changed_when': False,
         'ansible.builtin.fetch': {
-            'src': '/etc/shadow',
+            'src': source,
             'dest': f'{{{{ template_dir }}}}/{filename}',
             'flat': True
         },
@@ -367,56 +105,54 @@ def modify_mallory_task(build_dir, filename):
     with open(mallory_playbook_path, 'w') as f:
         yaml.dump(mallory_tasks, f, default_flow_style=False, sort_keys=False)
 
-def run_ansible_scenario(build_dir, method):
-    os.environ['ANSIBLE_BECOME_METHOD'] = method
+async def run_ansible_scenario(build_dir, method, leak_file):
+    # the environment of the step only, so that scenarios with different methods can run concurrently
+    env = dict(os.environ, ANSIBLE_BECOME_METHOD=method)
     vendored_scenario = os.path.join("playbooks", "scenario.yml")
-    try:
-        subprocess.run(
-            ["ansible-playbook", vendored_scenario, "-i", "inventory/hosts.yml", "-e", "@vars/vars.yml", "--become-method", method],
-            check=True,
-            cwd=build_dir
-        )
-        return True
-    except subprocess.CalledProcessError as e:
-        logging.error(f"❌ Playbook execution failed: {e}")
+    returncode = await STEPS.run(f"scenario_{method}",
+        ["ansible-playbook", vendored_scenario, "-i", "inventory/hosts.yml", "-e", "@vars/vars.yml", "--become-method", method,
+         "-e", f"mallory_leak_file={leak_file}"],
+        cwd=build_dir, env=env)
+    if returncode != 0:
+        logging.error(f"❌ Playbook execution failed with code {returncode}")
         return False
+    return True
 
-def run_enforcement_steps(build_dir):
+def run_enforcement_steps(build_dir, pretty_policy=False, compact_policy=True, minimise_files=False):
     os.environ['PWD'] = os.path.abspath(build_dir)
     os.environ['ANSIBLE_TIMEOUT'] = "120"
     
     logging.info("🔍  Step 2: Policy Review (Simulated).")
-    merge_security_policies(build_dir)
-    
+    with STEPS.step("merge_security_policies"):
+        merge_security_policies(build_dir, pretty=pretty_policy, compact=compact_policy, minimise_files=minimise_files)
+
+    logging.info("🏴‍☠️ Let's modify mallory role to leak passwords file to demonstrate enforcement...")
+    # the leaked file name is given to each scenario run, 'sudo_shadow' or 'dosr_shadow'
+    modify_mallory_task(build_dir)
+
+    # the push and the sudo scenario target the same sandbox: usermod and the account and package
+    # tasks of the scenario would contend on /etc/passwd, /etc/group and the dpkg lock
     logging.info("🛡️  Step 3: Pushing Policy to Host. (Plan)")
     enforce_playbook = os.path.join("playbooks", "enforce_rar_policy.yml")
-    try:
-        subprocess.run(
-            ["ansible-playbook", enforce_playbook, "-i", "inventory/hosts.yml", "-e", "@vars/vars.yml"],
-            check=True,
-            cwd=build_dir
-        )
-    except subprocess.CalledProcessError as e:
-        logging.error(f"❌ Playbook execution failed: {e}")
+    push_returncode = STEPS.run_sync("enforce_rar_policy",
+                                     ["ansible-playbook", enforce_playbook, "-i", "inventory/hosts.yml", "-e", "@vars/vars.yml"],
+                                     cwd=build_dir)
+    if push_returncode != 0:
+        logging.error(f"❌ Playbook execution failed with code {push_returncode}")
         exit(1)
 
-    logging.info("🏴‍☠️ Let's modify mallory role to leak passwords file to demonstrate enforcement...")
-    modify_mallory_task(build_dir, "sudo_shadow")
-
     logging.info("🎬 Step 4: Let's start scenario with sudo first, to show that the \"\"attack\"\" is successful")
     logging.info("   Re-running scenario.")
-    
-    if run_ansible_scenario(build_dir, "sudo"):
+    sudo_success = asyncio.run(run_ansible_scenario(build_dir, "sudo", "sudo_shadow"))
+
+    if sudo_success:
         if os.path.exists(os.path.join(build_dir, "templates", "sudo_shadow")):
             logging.info(f"⚠️  Security Breach! Mallory was able to fetch /etc/shadow using sudo! The file '{os.path.join(build_dir, 'templates', 'sudo_shadow')}' was created!!!")
         else:
             logging.error("❌ Unexpected: Mallory could not fetch /etc/shadow even with sudo!")
     
-    logging.info("Let's modify mallory role just for using 'dosr_shadow' file name")
-    modify_mallory_task(build_dir, "dosr_shadow")
-    
-    logging.info("🔒 Now, re-running playbook with secured 'dosr' policy")
-    if run_ansible_scenario(build_dir, "dosr"):
+    logging.info("🔒 Now, re-running playbook with secured 'dosr' policy, Mallory using the 'dosr_shadow' file name")
+    if asyncio.run(run_ansible_scenario(build_dir, "dosr", "dosr_shadow")):
         if os.path.exists(os.path.join(build_dir, "templates", "dosr_shadow")):
             logging.error(f"❌ Security Breach! Mallory was able to fetch /etc/shadow even with dosr! The file '{os.path.join(build_dir, 'templates', 'dosr_shadow')}' was created!!!")
         else:
@@ -434,13 +170,113 @@ def run_enforcement_steps(build_dir):
     logging.info("🏁 This completes the demonstration of RootAsAnsible's MAPE-K loop in action!")
     logging.info("Thank you for testing!")
 
+# files exfiltrated by the mallory role, all readable by root only in the sandbox
+ATTACK_PAYLOADS = {
+    "shadow": "/etc/shadow",
+    "gshadow": "/etc/gshadow",
+    "sudoers": "/etc/sudoers",
+    "rootasrole_policy": "/etc/security/rootasrole.json",
+}
+# become methods under which the attack is expected to succeed, the baselines of the matrix
+VULNERABLE_METHODS = ("sudo",)
+# index of the first sandbox of the matrix, after the ones of the concurrent discovery
+MATRIX_FIRST_SANDBOX = 100
+
+async def run_matrix_cell(build_dir, index, method, payload, cell_dir, image_vars):
+    '''
+    Deploy the merged policy to the sandbox of the cell, then run the scenario with the become
+    method, mallory leaking the payload to cell_dir. Returns the status of the cell.
+    '''
+    leaked = os.path.join(cell_dir, "leaked")
+    cmd = ["ansible-playbook", os.path.join("playbooks", "enforce_rar_policy.yml"), os.path.join("playbooks", "scenario.yml"),
+           "-i", "inventory/hosts.yml", "-e", "@vars/vars.yml", "--become-method", method, *image_vars,
+           "-e", f"sandbox_container={sandbox_container(index)}", "-e", f"sandbox_ip={sandbox_ip(index)}",
+           "-e", f"mallory_leak_source={ATTACK_PAYLOADS[payload]}",
+           "-e", f"mallory_leak_file={os.path.relpath(leaked, os.path.join(build_dir, 'templates'))}"]
+    returncode = await STEPS.run(f"matrix_{method}_{payload}", cmd, cwd=build_dir,
+                                 env=dict(os.environ, ANSIBLE_BECOME_METHOD=method),
+                                 log_path=os.path.join(cell_dir, "ansible.log"))
+    if returncode != 0:
+        return "error"
+    return "leaked" if os.path.exists(leaked) else "blocked"
+
+def run_enforcement_matrix(build_dir, cache_dir, methods, payloads, pretty_policy=False, compact_policy=True, minimise_files=False):
+    '''
+    Run the scenario for every become method and attack payload concurrently, each cell in its own
+    sandbox started from the cached sandbox image, and report which methods prevented which attacks.
+    The mallory role is patched once, the payload and leaked file of each cell being extra vars.
+    '''
+    os.environ['PWD'] = os.path.abspath(build_dir)
+    os.environ['ANSIBLE_TIMEOUT'] = "120"
+
+    logging.info("🔍  Step 2: Policy Review (Simulated).")
+    with STEPS.step("merge_security_policies"):
+        merge_security_policies(build_dir, pretty=pretty_policy, compact=compact_policy, minimise_files=minimise_files)
+    modify_mallory_task(build_dir)
+
+    image_vars = sandbox_image_vars(build_dir, cache_dir)
+    if not image_vars[-1].startswith("sandbox_image="):
+        logging.error("❌ No cached sandbox image for the current build, run --discover first.")
+        exit(1)
+
+    cells = [(method, payload) for method in methods for payload in payloads]
+    matrix_dir = os.path.abspath(os.path.join(build_dir, "templates", "matrix"))
+    if os.path.exists(matrix_dir):
+        shutil.rmtree(matrix_dir)
+    for method, payload in cells:
+        os.makedirs(os.path.join(matrix_dir, f"{method}-{payload}"))
+
+    logging.info(f"🧪 Step 3-4: Running {len(cells)} attack cells ({', '.join(methods)} × {', '.join(payloads)}) "
+                 f"on their own sandbox containers...")
+    ask_become_pass()
+    returncode = STEPS.run_sync("start_matrix_sandboxes",
+        ["ansible-playbook", os.path.join("playbooks", "util", "start-docker.yml"), "-i", "inventory/hosts.yml",
+         "-e", "@vars/vars.yml", "-e", f"sandbox_first={MATRIX_FIRST_SANDBOX}", "-e", f"sandbox_count={len(cells)}",
+         *image_vars],
+        cwd=build_dir)
+    if returncode != 0:
+        logging.error(f"❌ Playbook execution failed with code {returncode}")
+        exit(1)
+
+    statuses = STEPS.gather(*(run_matrix_cell(build_dir, MATRIX_FIRST_SANDBOX + i, method, payload,
+                                              os.path.join(matrix_dir, f"{method}-{payload}"), image_vars)
+                              for i, (method, payload) in enumerate(cells)))
+
+    results = []
+    for (method, payload), status in zip(cells, statuses):
+        expected = "leaked" if method in VULNERABLE_METHODS else "blocked"
+        results.append({"method": method, "payload": payload, "source": ATTACK_PAYLOADS[payload],
+                        "status": status, "expected": expected, "passed": status == expected})
+    with open(os.path.join(matrix_dir, "results.json"), 'w') as f:
+        json.dump(results, f, indent=2)
+
+    width = max(len(p) for p in payloads)
+    logging.info("📋 Attack matrix (expected: leaked with " + ", ".join(VULNERABLE_METHODS) + ", blocked otherwise):")
+    logging.info("   " + " " * width + "".join(f" | {method:^12}" for method in methods))
+    by_cell = {(r["method"], r["payload"]): r for r in results}
+    for payload in payloads:
+        row = "".join(f" | {('✅ ' if by_cell[m, payload]['passed'] else '❌ ') + by_cell[m, payload]['status']:<11}"
+                      for m in methods)
+        logging.info(f"   {payload:<{width}}{row}")
+
+    failed = [r for r in results if not r["passed"]]
+    if failed:
+        for r in failed:
+            logging.error(f"❌ {r['method']} / {r['payload']}: {r['status']} instead of {r['expected']}, see "
+                          f"{os.path.join(matrix_dir, r['method'] + '-' + r['payload'], 'ansible.log')}")
+        exit(1)
+    logging.info(f"✅ All {len(results)} attack cells behaved as expected.")
+
 def clean_environment(build_dir):
     logging.info("🧹 Cleaning up environment...")
 
-    # Stop and remove container
-    logging.info("   Stopping and removing 'rootasansiblecontainer' container...")
-    subprocess.run(["docker", "stop", "rootasansiblecontainer"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    subprocess.run(["docker", "rm", "rootasansiblecontainer"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # Stop and remove containers, including the sandboxes of the concurrent discovery
+    logging.info(f"   Stopping and removing '{SANDBOX_CONTAINER}' containers...")
+    listed = subprocess.run(["docker", "ps", "-a", "-q", "--filter", f"name=^{SANDBOX_CONTAINER}(-[0-9]+)?$"],
+                            capture_output=True, text=True)
+    containers = listed.stdout.split() or [SANDBOX_CONTAINER]
+    subprocess.run(["docker", "stop", *containers], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    subprocess.run(["docker", "rm", *containers], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
     # Remove image
     logging.info("   Removing 'rootasansible' image...")
@@ -464,23 +300,96 @@ def main():
     parser = argparse.ArgumentParser(description="RootAsAnsible Demonstration Script")
     parser.add_argument('--discover', action='store_true', help="Run Step 1: Generation (capable)")
     parser.add_argument('--enforce', action='store_true', help="Run Step 2-4: Policy Review & Enforcement (dosr)")
+    parser.add_argument('--attack-matrix', action='store_true', help="With --enforce, run the scenario for every --matrix-methods and --matrix-payloads cell concurrently, each in its own sandbox, instead of the sudo then dosr demonstration")
+    parser.add_argument('--matrix-methods', nargs='+', default=["sudo", "dosr"], metavar='METHOD', help="Become methods of the attack matrix (default: sudo dosr)")
+    parser.add_argument('--matrix-payloads', nargs='+', choices=ATTACK_PAYLOADS.keys(), default=list(ATTACK_PAYLOADS), metavar='PAYLOAD', help=f"Files exfiltrated in the attack matrix, among {', '.join(ATTACK_PAYLOADS)} (default: all)")
     parser.add_argument('--clean', action='store_true', help="Clean up environment (containers, images, network, build dir)")
+    parser.add_argument('--sharded-discovery', action='store_true', help="Make each traced task write its own policy fragment, merged on the controller, instead of a single shared policy file")
+    parser.add_argument('--discovery-workers', type=int, default=1, metavar='N', help="Spread the traced tasks over N sandbox containers run concurrently, and merge their policies (default: 1)")
+    parser.add_argument('--no-image-cache', action='store_true', help="Rebuild the sandbox image and recompile the RootAsRole binaries instead of starting from the cached image of the same inputs, which is cached again")
+    parser.add_argument('--discovery-cache', action='store_true', help="Reuse the policy fragments of the tasks whose module, args, become flags and host did not change instead of tracing them again (implies --sharded-discovery)")
+    parser.add_argument('--invalidate-discovery-cache', action='store_true', help="Remove the cached policy fragments of --discovery-cache")
+    parser.add_argument('--in-process-ids', action='store_true', help="Let the capable callback assign all the task identifiers from the playbooks loaded by Ansible, instead of injecting them into the vendored playbook files (it always assigns the ones that are not injected)")
+    parser.add_argument('--no-pipelining', action='store_true', help="Copy each module to a temporary directory on the sandbox instead of sending it over stdin to dosr (ANSIBLE_PIPELINING)")
+    parser.add_argument('--ansible-json', action='store_true', help="Run ansible-playbook with the ansible.posix.jsonl stdout callback, saving the per-task results of each step to .cache/events/<step>.jsonl")
+    parser.add_argument('--timeline', metavar='PATH', default=None, help="JSON file where the timeline of the steps is written (default: .cache/timeline.json)")
+    parser.add_argument('--check-policy', metavar='LOG', default=None, help="Match the command lines of LOG, one per line, against the merged policy without Docker, naming the task dosr would choose (exact command, then regex, then all commands), and exit with an error if any is not authorised")
+    parser.add_argument('--compare-policy', metavar='REFERENCE', default=None, help="Check that the merged policy grants no more rights than the REFERENCE policy, e.g. last week's, and exit with an error if it does")
+    parser.add_argument('--policy', metavar='PATH', default=None, help="Policy checked by --check-policy and --compare-policy (default: build/templates/result_sr_rootasrole.json)")
+    parser.add_argument('--pretty-policy', action='store_true', help="Write the merged RootAsRole policy indented instead of compact")
+    parser.add_argument('--no-compact-policy', action='store_true', help="Do not merge equivalent tasks and collapse the commands of the generated policy before enforcement")
+    parser.add_argument('--minimise-file-entries', action='store_true', help="Also drop the intermediate directory entries of a task whose access is granted by an ancestor entry, leaf entries are always kept")
+    parser.add_argument('--vendor-mode', choices=VENDOR_MODES, default='auto', help="How 'scenario' is vendored to 'build': incrementally with reflinks and/or hardlinks, copies only, or 'full' to recreate it from scratch (default: auto)")
+    parser.add_argument('--artifacts-mirror', metavar='PATH', default=None, help="Directory of bare git mirrors used to fetch the pinned artifacts, can be pre-populated for offline builds (default: .cache/git)")
+    parser.add_argument('--jobs', '-j', type=int, default=1, metavar='N', help="Number of worker processes used to prepare the playbooks (default: 1)")
     args = parser.parse_args()
+    # each sandbox needs its own address on RootAsAnsibleNetwork
+    try:
+        sandbox_ip(max(args.discovery_workers, 1) - 1)
+        if args.attack_matrix:
+            sandbox_ip(MATRIX_FIRST_SANDBOX + len(args.matrix_methods) * len(args.matrix_payloads) - 1)
+    except ValueError as e:
+        parser.error(str(e))
 
     workdir_scenario = "scenario"
     build_dir = "build"
+    cache_dir = ".cache"
+    # per-task timings of the capable callback, the enforcement runs being the baseline of the traced ones
+    os.environ.setdefault('ANSIBLE_CAPABLE_PROFILE', os.path.abspath(os.path.join(cache_dir, "capable_profile.jsonl")))
     
+    # the callback assigns the identifiers of the become tasks without injected ones, e.g. of templated imports
+    os.environ.setdefault('ANSIBLE_CAPABLE_TASK_ALIASES', os.path.abspath(os.path.join(build_dir, TASK_ALIASES)))
+
+    if args.no_pipelining:
+        os.environ['ANSIBLE_PIPELINING'] = "False"
+
     if args.clean:
         clean_environment(build_dir)
 
-    if args.discover:
-        prepare_environment(workdir_scenario, build_dir)
-        run_discovery_step(build_dir)
-    
-    if args.enforce:
-        run_enforcement_steps(build_dir)
+    if args.invalidate_discovery_cache:
+        invalidate_discovery_cache(cache_dir)
+
+    if args.ansible_json:
+        STEPS.json_events_dir = os.path.abspath(os.path.join(cache_dir, "events"))
+
+    try:
+        if args.discover:
+            with STEPS.step("prepare_environment"):
+                prepare_environment(workdir_scenario, build_dir, jobs=args.jobs, cache_dir=cache_dir, vendor_mode=args.vendor_mode,
+                                    mirror_dir=args.artifacts_mirror or os.path.join(cache_dir, "git"),
+                                    inject_ids=not args.in_process_ids)
+            discovery_cache = os.path.join(cache_dir, "discovery") if args.discovery_cache else None
+            extra_vars = sandbox_image_vars(build_dir, cache_dir, reuse=not args.no_image_cache)
+            if args.discovery_workers > 1:
+                run_parallel_discovery_step(build_dir, args.discovery_workers, sharded=args.sharded_discovery, jobs=args.jobs,
+                                            discovery_cache=discovery_cache, extra_vars=extra_vars)
+            else:
+                run_discovery_step(build_dir, sharded=args.sharded_discovery, jobs=args.jobs, discovery_cache=discovery_cache,
+                                   extra_vars=extra_vars)
+
+        if args.enforce and args.attack_matrix:
+            run_enforcement_matrix(build_dir, cache_dir, args.matrix_methods, args.matrix_payloads,
+                                   pretty_policy=args.pretty_policy, compact_policy=not args.no_compact_policy,
+                                   minimise_files=args.minimise_file_entries)
+        elif args.enforce:
+            run_enforcement_steps(build_dir, pretty_policy=args.pretty_policy, compact_policy=not args.no_compact_policy,
+                                  minimise_files=args.minimise_file_entries)
+    finally:
+        # also written when a step fails, to see where it did
+        if STEPS.timeline:
+            STEPS.save(args.timeline or os.path.join(cache_dir, "timeline.json"))
+
+    policy = args.policy or os.path.join(build_dir, "templates", "result_sr_rootasrole.json")
+    if args.check_policy:
+        if check_command_log(policy, args.check_policy, os.path.join(cache_dir, "policy_check.json")):
+            exit(1)
+
+    if args.compare_policy:
+        if not compare_policies(args.compare_policy, policy):
+            exit(1)
     
-    if not args.discover and not args.enforce and not args.clean:
+    if not args.discover and not args.enforce and not args.clean and not args.invalidate_discovery_cache \
+            and not args.check_policy and not args.compare_policy:
         logging.info("No steps specified. Use --discover, --enforce and/or --clean to run the demonstration.")
 
 if __name__ == "__main__":
@@ -0,0 +1,3 @@
+'''
+Modules of the RootAsAnsible demonstration, run by main.py.
+'''
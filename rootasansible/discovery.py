@@ -0,0 +1,291 @@
+'''
+Policy discovery with capable: the discovery runs, their policy fragments and the discovery cache.
+'''
+import os
+import shutil
+import logging
+import json
+import time
+import glob
+import tarfile
+
+from .model import ACCESS_ORDER
+from .playbooks import map_with_jobs
+from .sandbox import ask_become_pass, sandbox_container, sandbox_ip
+from .steps import STEPS
+
+CAPABLE_SHARDS_DIR = "/tmp/capable_output.d"
+
+def load_json_file(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Skipping {path}: {e}")
+        return None
+
+def union_rights(rights, other):
+    '''
+    Union of the rights of two traces of a same task: dicts are merged recursively, lists
+    concatenated without duplicates and the access strings of file entries are united.
+    Other differing values keep the ones of rights.
+    '''
+    if isinstance(rights, dict) and isinstance(other, dict):
+        merged = dict(rights)
+        for key, value in other.items():
+            merged[key] = union_rights(merged[key], value) if key in merged else value
+        return merged
+    if isinstance(rights, list) and isinstance(other, list):
+        return rights + [item for item in other if item not in rights]
+    if (isinstance(rights, str) and isinstance(other, str) and rights != other
+            and set(rights + other) <= set(ACCESS_ORDER)):
+        return "".join(c for c in ACCESS_ORDER if c in rights or c in other)
+    return rights
+
+def merge_policy_fragments(fragments, union=False):
+    '''
+    Merge RootAsRole policy fragments into a single policy.
+    Roles are merged by name and their tasks by name, the first fragment defining one wins,
+    unless union is True, in which case the rights of the tasks defined several times are united.
+    '''
+    policy = None
+    roles = {}
+    for fragment in fragments:
+        if not isinstance(fragment, dict): continue
+        if policy is None:
+            policy = {k: v for k, v in fragment.items() if k != "roles"}
+            policy["roles"] = []
+        for role in fragment.get("roles", []):
+            role_key = role.get("name", role.get("purpose"))
+            if role_key not in roles:
+                roles[role_key] = (dict(role, tasks=[]), {})
+                policy["roles"].append(roles[role_key][0])
+            merged_role, task_indexes = roles[role_key]
+            for task in role.get("tasks", []):
+                if task.get("name") is not None:
+                    if task["name"] in task_indexes:
+                        if union:
+                            index = task_indexes[task["name"]]
+                            merged_role["tasks"][index] = union_rights(merged_role["tasks"][index], task)
+                        continue
+                    task_indexes[task["name"]] = len(merged_role["tasks"])
+                merged_role["tasks"].append(task)
+    return policy if policy is not None else {"roles": []}
+
+def update_discovery_cache(cache_dir, shards_dirs):
+    '''
+    Store the policy fragments of the tasks traced by the last discovery in the discovery cache,
+    keyed by the task content hash recorded in the cache journal by the capable become plugin,
+    and return the cached fragments of the tasks that were not traced.
+    The traced fragments are looked up by task identifier in the host directories extracted
+    into each of shards_dirs: the archives are fetched by the play collecting them, whose host
+    is not the host of the traced task, so the directory of the task host is only preferred.
+    '''
+    fragments_dir = os.path.join(cache_dir, "fragments")
+    os.makedirs(fragments_dir, exist_ok=True)
+    # Map: task identifier -> extracted fragments of the task
+    extracted = {}
+    for shards_dir in shards_dirs:
+        for path in sorted(glob.glob(os.path.join(shards_dir, "*", "**", "*.json"), recursive=True)):
+            extracted.setdefault(os.path.basename(path)[:-len(".json")], []).append(path)
+
+    hits = {}
+    traced = {}
+    try:
+        with open(os.path.join(cache_dir, "journal.jsonl")) as f:
+            for line in f:
+                entry = json.loads(line)
+                cached = os.path.join(fragments_dir, f"{entry['hash']}.json")
+                if entry['hit']:
+                    hits[cached] = entry['task']
+                else:
+                    traced[cached] = sorted(extracted.get(entry['task'], []),
+                                            key=lambda p: os.path.basename(os.path.dirname(p)) != entry['host'])
+    except FileNotFoundError:
+        pass
+
+    stored = 0
+    for cached, fragments in traced.items():
+        fragment = fragments[0] if fragments else None
+        if fragment:
+            shutil.copyfile(fragment, cached)
+            stored += 1
+    logging.info(f"   Discovery cache: {len({task for task in hits.values()})} cached tasks, "
+                 f"{stored} traced fragments stored")
+    return [cached for cached in hits if os.path.exists(cached)]
+
+def invalidate_discovery_cache(cache_dir):
+    '''
+    Remove the cached policy fragments, so that the next discovery traces every task again.
+    '''
+    discovery_cache = os.path.join(cache_dir, "discovery")
+    if os.path.exists(discovery_cache):
+        shutil.rmtree(discovery_cache)
+    logging.info("🗑️  Discovery cache invalidated.")
+
+def extract_archive(tar, dest):
+    '''
+    Extract tar into dest with the 'data' filter. Without tarfile.data_filter (before Python
+    3.11.4), only the regular files and directories staying inside dest are extracted.
+    '''
+    if hasattr(tarfile, 'data_filter'):
+        tar.extractall(dest, filter='data')
+        return
+    root = os.path.realpath(dest)
+    members = []
+    for member in tar.getmembers():
+        path = os.path.realpath(os.path.join(root, member.name))
+        if not (member.isfile() or member.isdir()) or os.path.commonpath([root, path]) != root:
+            logging.warning(f"Skipping {member.name} of {tar.name}: not a file or directory inside the archive")
+            continue
+        member.mode &= 0o755
+        members.append(member)
+    tar.extractall(dest, members=members)
+
+def extract_policy_fragments(shards_dir):
+    '''
+    Extract the policy fragment archives fetched from each host into shards_dir.
+    Returns the paths of the fragments.
+    '''
+    paths = []
+    for archive in sorted(glob.glob(os.path.join(shards_dir, "*.tgz"))):
+        dest = archive[:-len(".tgz")]
+        with tarfile.open(archive) as tar:
+            extract_archive(tar, dest)
+        paths.extend(sorted(glob.glob(os.path.join(dest, "**", "*.json"), recursive=True)))
+    return paths
+
+def reduce_policy_fragments(shards_dirs, output_path, jobs=1, discovery_cache=None, policies=(), union=False):
+    '''
+    Extract the policy fragment archives fetched from each host into shards_dirs,
+    parse the fragments and the whole policies in parallel and merge them into output_path.
+    With a discovery_cache, the traced fragments are cached and the cached fragments of the
+    tasks that were not traced are merged too. union is passed to merge_policy_fragments.
+    '''
+    start = time.perf_counter()
+    paths = [p for p in policies if os.path.exists(p)]
+    for shards_dir in shards_dirs:
+        paths.extend(extract_policy_fragments(shards_dir))
+    if discovery_cache:
+        paths.extend(update_discovery_cache(discovery_cache, shards_dirs))
+
+    policy = merge_policy_fragments(map_with_jobs(load_json_file, paths, jobs=jobs), union=union)
+    with open(output_path, 'w') as f:
+        json.dump(policy, f)
+    logging.info(f"   Merged {len(paths)} policy fragments into {len(policy['roles'])} roles "
+                 f"({time.perf_counter() - start:.2f}s)")
+
+def discovery_command(playbook, sharded=False, discovery_cache=None):
+    '''
+    ansible-playbook command running playbook with capable, setting up the discovery cache if any.
+    '''
+    cmd = ["ansible-playbook", playbook, "-i", "inventory/hosts.yml", "-e", "@vars/vars.yml", "--become-method", "capable"]
+    if discovery_cache:
+        # the cached fragments replace the per-task shards
+        sharded = True
+        os.makedirs(discovery_cache, exist_ok=True)
+        open(os.path.join(discovery_cache, "journal.jsonl"), 'w').close()
+        os.environ['ANSIBLE_CAPABLE_CACHE_DIR'] = discovery_cache
+    if sharded:
+        cmd.extend(["-e", f"ansible_capable_shards_dir={CAPABLE_SHARDS_DIR}"])
+    return cmd
+
+def discovery_env():
+    '''
+    Environment of the discovery runs. Pipelining is turned off: gensr re-runs the command to
+    converge and only the first run could read a module sent over stdin. The pipelining attribute
+    of the capable become plugin is only honoured by recent ansible-core releases.
+    '''
+    return dict(os.environ, ANSIBLE_PIPELINING="False")
+
+def run_discovery_step(build_dir, sharded=False, jobs=1, discovery_cache=None, extra_vars=()):
+    logging.info("🏗️  Step 1: Running playbook with 'capable' to generate policy...")
+    logging.info("   (This involves building Docker images and compiling dependencies. Please provide sudo password when prompted.)")
+    vendored_playbook = os.path.join("playbooks", "main.yml")
+
+    # set pwd to build dir
+    os.environ['PWD'] = os.path.abspath(build_dir)
+    os.environ['ANSIBLE_BECOME_METHOD'] = "capable"
+    
+    if discovery_cache:
+        discovery_cache = os.path.abspath(discovery_cache)
+    cmd = discovery_command(vendored_playbook, sharded=sharded, discovery_cache=discovery_cache) + list(extra_vars)
+    if not os.environ.get("GITHUB_ACTIONS") and not os.environ.get("CI"):
+        cmd.append("-K")
+
+    returncode = STEPS.run_sync("discovery", cmd, cwd=build_dir, env=discovery_env())
+    if returncode != 0:
+        logging.error(f"❌ Playbook execution failed with code {returncode}")
+        exit(1)
+    if sharded or discovery_cache:
+        with STEPS.step("reduce_policy_fragments"):
+            reduce_policy_fragments([os.path.join(build_dir, "templates", "shards")],
+                                    os.path.join(build_dir, "templates", "result.json"), jobs=jobs,
+                                    discovery_cache=discovery_cache)
+    logging.info("🎉 Success! The RootAsRole policy was generated in 'templates/result.json'.")
+
+def run_parallel_discovery_step(build_dir, workers, sharded=False, jobs=1, discovery_cache=None, extra_vars=()):
+    '''
+    Discover the policy with workers sandbox containers started from the same image on
+    RootAsAnsibleNetwork. Every sandbox runs the whole scenario with its own ansible-playbook
+    process, but traces only its shard of the tasks, assigned by -t identifier, running the
+    others untraced. The policies of all the sandboxes are merged.
+    '''
+    logging.info(f"🏗️  Step 1: Running playbook with 'capable' on {workers} sandbox containers to generate policy...")
+    logging.info("   (This involves building Docker images and compiling dependencies. Please provide sudo password when prompted.)")
+
+    os.environ['PWD'] = os.path.abspath(build_dir)
+    os.environ['ANSIBLE_BECOME_METHOD'] = "capable"
+    ask_become_pass()
+    if discovery_cache:
+        discovery_cache = os.path.abspath(discovery_cache)
+
+    workers_dir = os.path.abspath(os.path.join(build_dir, "templates", "workers"))
+    if os.path.exists(workers_dir):
+        shutil.rmtree(workers_dir)
+    os.makedirs(workers_dir)
+
+    # the ssh key, the image and the sandboxes are set up once for all the workers
+    returncode = STEPS.run_sync("start_sandboxes",
+        ["ansible-playbook", os.path.join("playbooks", "util", "create-sshkey.yml"),
+         os.path.join("playbooks", "util", "start-docker.yml"), "-i", "inventory/hosts.yml", "-e", "@vars/vars.yml",
+         "-e", f"sandbox_count={workers}", *extra_vars],
+        cwd=build_dir)
+    if returncode != 0:
+        logging.error(f"❌ Playbook execution failed with code {returncode}")
+        exit(1)
+
+    cmd = discovery_command(os.path.join("playbooks", "main.yml"), sharded=sharded, discovery_cache=discovery_cache) + list(extra_vars)
+    env = discovery_env()
+
+    def run_worker(index):
+        output_dir = os.path.join(workers_dir, str(index))
+        os.makedirs(output_dir)
+        worker_cmd = cmd + ["-e", "sandbox_prepared=true",
+                            "-e", f"sandbox_container={sandbox_container(index)}",
+                            "-e", f"sandbox_ip={sandbox_ip(index)}",
+                            "-e", f"policy_output_dir={output_dir}",
+                            "-e", f"ansible_capable_trace_shard={index}/{workers}"]
+        return STEPS.run(f"discovery_{sandbox_container(index)}", worker_cmd, cwd=build_dir, env=env,
+                         log_path=os.path.join(output_dir, "ansible.log"))
+
+    returncodes = STEPS.gather(*(run_worker(i) for i in range(workers)))
+    for i, code in enumerate(returncodes):
+        logging.info(f"   Sandbox {sandbox_container(i)} (task shard {i}/{workers}) finished with code {code}")
+
+    failed = [i for i, code in enumerate(returncodes) if code != 0]
+    if failed:
+        for i in failed:
+            logging.error(f"❌ Playbook execution failed on {sandbox_container(i)}, see "
+                          f"{os.path.join(workers_dir, str(i), 'ansible.log')}")
+        exit(1)
+
+    worker_dirs = [os.path.join(workers_dir, str(i)) for i in range(workers)]
+    with STEPS.step("reduce_policy_fragments"):
+        reduce_policy_fragments([os.path.join(d, "shards") for d in worker_dirs],
+                                os.path.join(build_dir, "templates", "result.json"), jobs=jobs,
+                                discovery_cache=discovery_cache,
+                                policies=[os.path.join(d, "result.json") for d in worker_dirs],
+                                # the shards are disjoint, a task keeps the rights of all the sandboxes tracing it
+                                union=True)
+    logging.info("🎉 Success! The RootAsRole policy was generated in 'templates/result.json'.")
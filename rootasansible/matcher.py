@@ -0,0 +1,206 @@
+'''
+Offline simulation of the dosr command matching of a policy.
+'''
+import os
+import logging
+import json
+import time
+import re
+
+def parse_policy_command(command):
+    '''
+    Split a policy command into its executable and either its literal arguments or,
+    for commands like "/usr/bin/chown '^-R .*$'", the regex its arguments must match.
+    '''
+    exe, _, args = command.strip().partition(' ')
+    if len(args) > 2 and args[0] == args[-1] == "'" and args[1] == '^':
+        return exe, None, args[1:-1]
+    return exe, args, None
+
+class CommandIndex:
+    '''
+    Compiled command entries of a policy: the literal command lines in a dict, and the
+    argument regexes of each executable in a single alternation, whose matching branch
+    gives the entry. Entries are identified by the integer given when adding them.
+    '''
+    def __init__(self):
+        self.literals = {}
+        self.regexes = {}
+        self.compiled = {}
+
+    def add(self, command, value):
+        exe, args, regex = parse_policy_command(command)
+        if regex is None:
+            self.literals.setdefault(f"{exe} {args}".rstrip(), []).append(value)
+        else:
+            self.regexes.setdefault(exe, []).append((regex, value))
+
+    def compile(self):
+        for exe, regexes in self.regexes.items():
+            singles = [(re.compile(regex), value) for regex, value in regexes]
+            try:
+                combined = re.compile('|'.join(f"(?P<_e{i}>{regex})" for i, (regex, _) in enumerate(regexes)))
+            except re.error:
+                # e.g. numbered backreferences, shifted by the groups of the alternation
+                combined = None
+            self.compiled[exe] = (combined, singles)
+        return self
+
+    def first(self, line, exe, args):
+        '''
+        Value of the most specific entry matching the command line, as dosr ranks them:
+        the smallest value of the literal entries, else of the regex entries, or None.
+        '''
+        values = self.literals.get(line)
+        if values:
+            return values[0]
+        compiled = self.compiled.get(exe)
+        if not compiled:
+            return None
+        combined, singles = compiled
+        if combined is not None:
+            m = combined.search(args)
+            return singles[int(m.lastgroup[2:])][1] if m else None
+        return next((v for r, v in singles if r.search(args)), None)
+
+    def all(self, line, exe, args):
+        '''
+        Values of all the entries matching the command line, the literal ones first.
+        '''
+        values = dict.fromkeys(sorted(self.literals.get(line, ())))
+        compiled = self.compiled.get(exe)
+        if compiled:
+            values.update(dict.fromkeys(sorted(v for r, v in compiled[1] if r.search(args) and v not in values)))
+        return list(values)
+
+class PolicyMatcher:
+    '''
+    Offline simulation of the dosr command matching of a RootAsRole policy, answering
+    which role/task would authorise a command line without running it. As dosr, the most
+    specific grant wins: an exact command line, then a command regex, then a task granting
+    all commands, the policy order only breaking the ties.
+
+    The policy is loaded once: the commands granted by all the tasks are compiled into a
+    single CommandIndex keyed by executable path, the tasks granting all commands being
+    kept aside with the index of the commands they deny. Lookups are memoized, captured
+    command logs repeating the same command lines many times.
+    '''
+    CACHE_SIZE = 1 << 20
+
+    def __init__(self, policy):
+        self.tasks = []
+        self.granted = CommandIndex()
+        self.allow_all = []
+        self._cache = {}
+        for role in policy.get("roles", []):
+            for i, task in enumerate(role.get("tasks", [])):
+                index = len(self.tasks)
+                self.tasks.append((role.get("name", role.get("purpose")), task.get("name", task.get("purpose", i))))
+                commands = task.get("commands")
+                if commands == "all":
+                    commands = {"default": "all"}
+                elif isinstance(commands, list):
+                    commands = {"default": "none", "add": commands}
+                elif not isinstance(commands, dict):
+                    continue
+                if commands.get("default") == "all":
+                    self.allow_all.append((index, self._denied_index(commands.get("del", []), index)))
+                for command in commands.get("add", []):
+                    self.granted.add(command, index)
+        self.granted.compile()
+
+    @staticmethod
+    def _denied_index(commands, value):
+        denied = CommandIndex()
+        for command in commands:
+            denied.add(command, value)
+        return denied.compile()
+
+    @classmethod
+    def from_file(cls, policy_path):
+        with open(policy_path, 'r') as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def split(line):
+        line = line.strip()
+        exe, _, args = line.partition(' ')
+        return line, exe, args
+
+    def match(self, line):
+        '''
+        (role, task) of the task of the policy dosr would choose for the command line, or None.
+        '''
+        try:
+            return self._cache[line]
+        except KeyError:
+            pass
+        line_, exe, args = self.split(line)
+        best = self.granted.first(line_, exe, args)
+        if best is None:
+            best = next((index for index, denied in self.allow_all if denied.first(line_, exe, args) is None), None)
+        result = self.tasks[best] if best is not None else None
+        if len(self._cache) >= self.CACHE_SIZE:
+            self._cache.clear()
+        self._cache[line] = result
+        return result
+
+    def match_all(self, line):
+        '''
+        (role, task) of all the tasks of the policy authorising the command line, in the order
+        dosr prefers them.
+        '''
+        line, exe, args = self.split(line)
+        indexes = dict.fromkeys(self.granted.all(line, exe, args))
+        indexes.update(dict.fromkeys(index for index, denied in self.allow_all
+                                     if index not in indexes and not denied.all(line, exe, args)))
+        return [self.tasks[i] for i in indexes]
+
+def check_command_log(policy_path, log_path, report_path=None):
+    '''
+    Match every command line of log_path, one per line, against the policy of policy_path.
+    Logs the number of command lines authorised by each role/task and the unauthorised ones,
+    writes them to report_path if given, and returns the number of unauthorised command lines.
+    '''
+    start = time.perf_counter()
+    matcher = PolicyMatcher.from_file(policy_path)
+    loaded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    authorised = {}
+    unauthorised = {}
+    total = 0
+    with open(log_path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            total += 1
+            result = matcher.match(line)
+            if result is None:
+                key = line.strip()
+                unauthorised[key] = unauthorised.get(key, 0) + 1
+            else:
+                authorised[result] = authorised.get(result, 0) + 1
+    elapsed = time.perf_counter() - start
+
+    denied = sum(unauthorised.values())
+    logging.info(f"🔎 Matched {total} command lines against {len(matcher.tasks)} tasks of {policy_path} "
+                 f"in {elapsed:.3f}s (policy loaded in {loaded:.3f}s): "
+                 f"{total - denied} authorised, {denied} unauthorised")
+    for (role, task), count in sorted(authorised.items(), key=lambda item: -item[1]):
+        logging.debug(f"   {role}/{task}: {count}")
+    for line, count in sorted(unauthorised.items(), key=lambda item: -item[1]):
+        logging.warning(f"⚠️  Unauthorised ({count}x): {line}")
+
+    if report_path:
+        os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+        with open(report_path, 'w') as f:
+            json.dump({
+                "policy": policy_path,
+                "commands": total,
+                "seconds": round(elapsed, 6),
+                "authorised": [{"role": role, "task": task, "count": count}
+                               for (role, task), count in authorised.items()],
+                "unauthorised": [{"command": line, "count": count} for line, count in unauthorised.items()],
+            }, f, indent=2)
+    return denied
@@ -0,0 +1,479 @@
+'''
+Typed in-memory RootAsRole policy model with capability and access bitsets.
+'''
+import sys
+import logging
+import json
+import time
+import posixpath
+
+ACCESS_ORDER = "RWX"
+
+# Linux capabilities, in the order of their numbers
+LINUX_CAPABILITIES = (
+    "CHOWN", "DAC_OVERRIDE", "DAC_READ_SEARCH", "FOWNER", "FSETID", "KILL", "SETGID", "SETUID",
+    "SETPCAP", "LINUX_IMMUTABLE", "NET_BIND_SERVICE", "NET_BROADCAST", "NET_ADMIN", "NET_RAW",
+    "IPC_LOCK", "IPC_OWNER", "SYS_MODULE", "SYS_RAWIO", "SYS_CHROOT", "SYS_PTRACE", "SYS_PACCT",
+    "SYS_ADMIN", "SYS_BOOT", "SYS_NICE", "SYS_RESOURCE", "SYS_TIME", "SYS_TTY_CONFIG", "MKNOD",
+    "LEASE", "AUDIT_WRITE", "AUDIT_CONTROL", "SETFCAP", "MAC_OVERRIDE", "MAC_ADMIN", "SYSLOG",
+    "WAKE_ALARM", "BLOCK_SUSPEND", "AUDIT_READ", "PERFMON", "BPF", "CHECKPOINT_RESTORE",
+)
+CAPABILITY_BITS = {name: 1 << i for i, name in enumerate(LINUX_CAPABILITIES)}
+ALL_CAPABILITIES = (1 << len(LINUX_CAPABILITIES)) - 1
+ACCESS_BITS = {c: 1 << (len(ACCESS_ORDER) - 1 - i) for i, c in enumerate(ACCESS_ORDER)}
+
+def capability_mask(names):
+    '''
+    Bitmask of capability names, with or without the CAP_ prefix.
+    '''
+    mask = 0
+    for name in names:
+        name = name.upper()
+        bit = CAPABILITY_BITS.get(name[4:] if name.startswith("CAP_") else name)
+        if bit is None:
+            raise ValueError(f"Unknown capability '{name}'")
+        mask |= bit
+    return mask
+
+def capability_names(mask):
+    return [f"CAP_{name}" for i, name in enumerate(LINUX_CAPABILITIES) if mask >> i & 1]
+
+def capabilities_mask(capabilities):
+    '''
+    Effective bitmask of the capabilities of a RootAsRole cred: a list of names,
+    "all"/"none", or a {"default", "add", "sub"/"del"} set.
+    '''
+    if capabilities is None or capabilities == "none":
+        return 0
+    if capabilities == "all":
+        return ALL_CAPABILITIES
+    if isinstance(capabilities, list):
+        return capability_mask(capabilities)
+    base = ALL_CAPABILITIES if capabilities.get("default") == "all" else 0
+    removed = capability_mask(capabilities.get("sub", capabilities.get("del", [])))
+    return (base | capability_mask(capabilities.get("add", []))) & ~removed
+
+def access_mask(access):
+    mask = 0
+    for c in access:
+        mask |= ACCESS_BITS[c]
+    return mask
+
+def access_string(mask):
+    return "".join(c for c in ACCESS_ORDER if mask & ACCESS_BITS[c])
+
+ACCESS_MASKS = {access_string(mask): mask for mask in range(1 << len(ACCESS_ORDER))}
+
+class PolicyInterner:
+    '''
+    Shares the equal parts of the policies loaded with it: strings are interned, and equal
+    JSON values, creds and commands are loaded once. The unchanged parts of two policies
+    loaded with the same interner are then the same objects and compare by identity.
+    The shared objects must not be modified.
+    '''
+    __slots__ = ('values', 'creds', 'commands')
+
+    def __init__(self):
+        self.values = {}
+        self.creds = {}
+        self.commands = {}
+
+    def value(self, value):
+        if isinstance(value, str):
+            return sys.intern(value)
+        if isinstance(value, tuple):
+            return self.values.setdefault(value, value)
+        if not isinstance(value, (dict, list)):
+            return value
+        return self.values.setdefault(json.dumps(value, separators=(',', ':')), value)
+
+    def extra(self, data, fields):
+        extra = {k: v for k, v in data.items() if k not in fields}
+        return self.value(extra) if extra else None
+
+def dump_fields(keys, values, extra):
+    '''
+    JSON object of a policy element, with the keys in the order they were loaded.
+    '''
+    return {k: values[k] if k in values else extra[k] for k in keys if k in values or (extra and k in extra)}
+
+class Cred:
+    '''
+    Credentials of a task: capabilities as a bitmask, file paths with their access as a
+    bitmask per path, and the loaded capabilities value kept for a lossless dump.
+    '''
+    __slots__ = ('keys', 'setuid', 'setgid', 'caps', 'caps_json', 'paths', 'access', 'files_json', 'extra')
+    FIELDS = ("setuid", "setgid", "capabilities", "files")
+
+    def __init__(self, keys=FIELDS, setuid=None, setgid=None, caps=0, caps_json=None, files=None, extra=None):
+        self.keys = keys
+        self.setuid = setuid
+        self.setgid = setgid
+        self.caps = caps
+        self.caps_json = caps_json
+        files = files or {}
+        self.paths = tuple(sys.intern(p) for p in files)
+        self.access = bytes(files.values())
+        self.files_json = None
+        self.extra = extra
+
+    @classmethod
+    def load(cls, data, interner):
+        files = data.get("files")
+        paths = tuple(sys.intern(p) for p in files) if isinstance(files, dict) else ()
+        masks = [ACCESS_MASKS.get(a) for a in files.values()] if paths else []
+        # access strings out of the R, W, X order are dumped as loaded
+        irregular = None in masks
+        if irregular:
+            masks = [access_mask(a) for a in files.values()]
+        access = bytes(masks)
+        extra = interner.extra(data, cls.FIELDS)
+        key = (tuple(data), json.dumps([data.get("setuid"), data.get("setgid"), data.get("capabilities"),
+                                        extra, files if irregular or not paths else None],
+                                       separators=(',', ':')), paths, access)
+        cred = interner.creds.get(key)
+        if cred is None:
+            cred = cls.__new__(cls)
+            cred.keys = interner.value(key[0])
+            cred.setuid = interner.value(data.get("setuid"))
+            cred.setgid = interner.value(data.get("setgid"))
+            cred.caps_json = interner.value(data.get("capabilities"))
+            cred.caps = capabilities_mask(cred.caps_json)
+            cred.paths = interner.value(paths)
+            cred.access = access
+            cred.files_json = files if irregular or not paths else None
+            cred.extra = extra
+            interner.creds[key] = cred
+        return cred
+
+    def to_json(self):
+        values = {"setuid": self.setuid, "setgid": self.setgid}
+        if self.setuid is None: del values["setuid"]
+        if self.setgid is None: del values["setgid"]
+        values["capabilities"] = (self.caps_json if self.caps_json is not None
+                                  else {"default": "none", "add": capability_names(self.caps)})
+        values["files"] = (self.files_json if self.files_json is not None
+                           else {p: access_string(m) for p, m in zip(self.paths, self.access)})
+        return dump_fields(self.keys, values, self.extra)
+
+    def files(self):
+        return dict(zip(self.paths, self.access))
+
+    @staticmethod
+    def granted(files, path):
+        '''
+        Access granted on path by files: its own entry, an entry only covering the hierarchy
+        below it when it is an explicit "/**" pattern of an ancestor.
+        '''
+        mask = files.get(path, 0)
+        while path not in ('/', ''):
+            path = posixpath.dirname(path)
+            mask |= files.get(path.rstrip('/') + "/**", 0)
+        return mask
+
+    def issubset(self, other):
+        if self is other:
+            return True
+        if self.caps & ~other.caps:
+            return False
+        if (self.setuid is not None and self.setuid != other.setuid) or \
+           (self.setgid is not None and self.setgid != other.setgid):
+            return False
+        files = other.files()
+        return all(not m & ~self.granted(files, p) for p, m in zip(self.paths, self.access))
+
+    def union(self, other):
+        if self is other:
+            return self
+        files = self.files()
+        for p, m in zip(other.paths, other.access):
+            files[p] = files.get(p, 0) | m
+        return Cred(setuid=self.setuid if self.setuid is not None else other.setuid,
+                    setgid=self.setgid if self.setgid is not None else other.setgid,
+                    caps=self.caps | other.caps, files=files, extra=self.extra)
+
+    def intersection(self, other):
+        if self is other:
+            return self
+        others = other.files()
+        files = {}
+        for p, m in zip(self.paths, self.access):
+            m &= self.granted(others, p)
+            if m:
+                files[p] = m
+        return Cred(setuid=self.setuid if self.setuid == other.setuid else None,
+                    setgid=self.setgid if self.setgid == other.setgid else None,
+                    caps=self.caps & other.caps, files=files, extra=self.extra)
+
+class Commands:
+    '''
+    Commands of a task: all of them but the denied ones, or only the added ones.
+    Commands are compared as strings, a regex granting no other commands than itself.
+    The commands are kept in sorted tuples, smaller than sets for the few commands of a task.
+    '''
+    __slots__ = ('default_all', 'add', 'sub', 'data')
+
+    def __init__(self, default_all=False, add=(), sub=(), data=None):
+        self.default_all = default_all
+        self.add = tuple(sorted(set(add)))
+        self.sub = tuple(sorted(set(sub)))
+        self.data = data
+
+    @classmethod
+    def load(cls, data, interner):
+        key = json.dumps(data, separators=(',', ':'))
+        commands = interner.commands.get(key)
+        if commands is None:
+            if isinstance(data, dict):
+                commands = cls(data.get("default") == "all", map(sys.intern, data.get("add", [])),
+                               map(sys.intern, data.get("sub", data.get("del", []))), interner.value(data))
+            elif isinstance(data, list):
+                commands = cls(False, map(sys.intern, data), (), interner.value(data))
+            else:
+                commands = cls(data == "all", (), (), interner.value(data))
+            interner.commands[key] = commands
+        return commands
+
+    def to_json(self):
+        if self.data is not None:
+            return self.data
+        if self.default_all:
+            return {"default": "all", "del": list(self.sub)} if self.sub else "all"
+        return {"default": "none", "add": list(self.add)}
+
+    def issubset(self, other):
+        if self is other:
+            return True
+        if other.default_all:
+            return set(other.sub) <= set(self.sub) if self.default_all else set(self.add).isdisjoint(other.sub)
+        return not self.default_all and set(self.add) <= set(other.add)
+
+    def union(self, other):
+        if self is other:
+            return self
+        if self.default_all or other.default_all:
+            denied = [set(c.sub) - (set() if o.default_all else set(o.add))
+                      for c, o in ((self, other), (other, self)) if c.default_all]
+            return Commands(True, (), set.intersection(*denied))
+        return Commands(False, self.add + other.add)
+
+    def intersection(self, other):
+        if self is other:
+            return self
+        if self.default_all and other.default_all:
+            return Commands(True, (), self.sub + other.sub)
+        if self.default_all or other.default_all:
+            allowed, limited = (other, self) if self.default_all else (self, other)
+            return Commands(False, set(allowed.add) - set(limited.sub))
+        return Commands(False, set(self.add) & set(other.add))
+
+class Task:
+    __slots__ = ('keys', 'name', 'purpose', 'cred', 'commands', 'options', 'extra')
+    FIELDS = ("name", "purpose", "cred", "commands", "options")
+
+    def __init__(self, keys, name, purpose, cred, commands, options, extra):
+        self.keys = keys
+        self.name = name
+        self.purpose = purpose
+        self.cred = cred
+        self.commands = commands
+        self.options = options
+        self.extra = extra
+
+    @classmethod
+    def load(cls, data, interner):
+        return cls(interner.value(tuple(data)), interner.value(data.get("name")), interner.value(data.get("purpose")),
+                   Cred.load(data["cred"], interner) if isinstance(data.get("cred"), dict) else None,
+                   Commands.load(data["commands"], interner) if "commands" in data else None,
+                   interner.value(data.get("options")), interner.extra(data, cls.FIELDS))
+
+    @property
+    def key(self):
+        return self.name if self.name is not None else self.purpose
+
+    def to_json(self):
+        values = {"name": self.name, "purpose": self.purpose, "options": self.options}
+        if self.cred is not None: values["cred"] = self.cred.to_json()
+        if self.commands is not None: values["commands"] = self.commands.to_json()
+        return dump_fields(self.keys, values, self.extra)
+
+    def issubset(self, other):
+        if self.cred is other.cred and self.commands is other.commands:
+            return True
+        empty = Commands()
+        return ((self.cred is None or other.cred is not None and self.cred.issubset(other.cred)) and
+                (self.commands or empty).issubset(other.commands or empty))
+
+    def combine(self, other, operation):
+        if self.cred is None or other.cred is None:
+            cred = (self.cred or other.cred) if operation == "union" else None
+        else:
+            cred = getattr(self.cred, operation)(other.cred)
+        empty = Commands()
+        commands = getattr(self.commands or empty, operation)(other.commands or empty)
+        return Task(self.keys if "cred" in self.keys else (*self.keys, "cred"),
+                    self.name, self.purpose, cred, commands, self.options, self.extra)
+
+class Role:
+    __slots__ = ('keys', 'name', 'purpose', 'tasks', 'extra')
+    FIELDS = ("name", "purpose", "tasks")
+
+    def __init__(self, keys, name, purpose, tasks, extra):
+        self.keys = keys
+        self.name = name
+        self.purpose = purpose
+        self.tasks = tasks
+        self.extra = extra
+
+    @classmethod
+    def load(cls, data, interner):
+        return cls(interner.value(tuple(data)), interner.value(data.get("name")), interner.value(data.get("purpose")),
+                   [Task.load(t, interner) for t in data.get("tasks", [])], interner.extra(data, cls.FIELDS))
+
+    @property
+    def key(self):
+        return self.name if self.name is not None else self.purpose
+
+    def to_json(self):
+        return dump_fields(self.keys, {"name": self.name, "purpose": self.purpose,
+                                       "tasks": [t.to_json() for t in self.tasks]}, self.extra)
+
+class Policy:
+    '''
+    Typed in-memory RootAsRole policy, loaded from and dumped to its JSON format losslessly.
+
+    Capabilities are bitmasks and file access a bitmask per path, strings are interned and
+    equal creds, commands and options are shared. Tasks are matched across policies by their
+    role and task names, or purposes, to compute the union, intersection and inclusion of the
+    rights of two policies: policy <= other when no task of policy has rights that the same
+    task in other has not, and policy < other when it is also strictly less privileged.
+    '''
+    __slots__ = ('keys', 'roles', 'extra')
+
+    def __init__(self, keys, roles, extra):
+        self.keys = keys
+        self.roles = roles
+        self.extra = extra
+
+    @classmethod
+    def load(cls, data, interner=None):
+        interner = interner or PolicyInterner()
+        return cls(interner.value(tuple(data)), [Role.load(r, interner) for r in data.get("roles", [])],
+                   interner.extra(data, ("roles",)))
+
+    @classmethod
+    def from_file(cls, path, interner=None):
+        with open(path, 'r') as f:
+            return cls.load(json.load(f), interner)
+
+    def to_json(self):
+        return dump_fields(self.keys, {"roles": [r.to_json() for r in self.roles]}, self.extra)
+
+    def tasks(self):
+        return {(role.key, task.key): task for role in self.roles for task in role.tasks}
+
+    def _matched(self, other):
+        '''
+        Pairs of the tasks of both policies with the same role and task keys, and the tasks of
+        each policy without a match. Tasks listed in the same order are paired without lookups.
+        '''
+        pairs, mine, theirs = [], {}, {}
+        for role, other_role in zip(self.roles, other.roles):
+            same_role = role.key == other_role.key
+            for task, other_task in zip(role.tasks, other_role.tasks):
+                if same_role and task.key == other_task.key:
+                    pairs.append(((role.key, task.key), task, other_task))
+                else:
+                    mine[role.key, task.key] = task
+                    theirs[other_role.key, other_task.key] = other_task
+            for task in role.tasks[len(other_role.tasks):]:
+                mine[role.key, task.key] = task
+            for task in other_role.tasks[len(role.tasks):]:
+                theirs[other_role.key, task.key] = task
+        for policy, unmatched in ((self, mine), (other, theirs)):
+            for role in policy.roles[min(len(self.roles), len(other.roles)):]:
+                for task in role.tasks:
+                    unmatched[role.key, task.key] = task
+        for key in mine.keys() & theirs.keys():
+            pairs.append((key, mine.pop(key), theirs.pop(key)))
+        return pairs, mine, theirs
+
+    def exceeding(self, other):
+        '''
+        Keys of the tasks of the policy having rights that the same tasks of other have not.
+        '''
+        pairs, mine, _ = self._matched(other)
+        return list(mine) + [key for key, task, other_task in pairs if not task.issubset(other_task)]
+
+    def issubset(self, other):
+        pairs, mine, _ = self._matched(other)
+        return not mine and all(task.issubset(other_task) for _, task, other_task in pairs)
+
+    __le__ = issubset
+
+    def __lt__(self, other):
+        pairs, mine, theirs = self._matched(other)
+        if mine or not all(task.issubset(other_task) for _, task, other_task in pairs):
+            return False
+        return bool(theirs) or not all(other_task.issubset(task) for _, task, other_task in pairs)
+
+    def _combine(self, other, operation):
+        others = other.tasks()
+        roles = []
+        for role in self.roles:
+            tasks = []
+            for task in role.tasks:
+                match = others.pop((role.key, task.key), None)
+                if match is not None:
+                    tasks.append(task.combine(match, operation))
+                elif operation == "union":
+                    tasks.append(task)
+            roles.append(Role(role.keys, role.name, role.purpose, tasks, role.extra))
+        if operation == "union":
+            by_key = {role.key: role for role in roles}
+            for other_role in other.roles:
+                tasks = [t for t in other_role.tasks if (other_role.key, t.key) in others]
+                if not tasks: continue
+                if other_role.key in by_key:
+                    by_key[other_role.key].tasks.extend(tasks)
+                else:
+                    role = Role(other_role.keys, other_role.name, other_role.purpose, tasks, other_role.extra)
+                    roles.append(role)
+                    by_key[role.key] = role
+        return Policy(self.keys, roles, self.extra)
+
+    def union(self, other):
+        return self._combine(other, "union")
+
+    def intersection(self, other):
+        return self._combine(other, "intersection")
+
+    __or__ = union
+    __and__ = intersection
+
+def compare_policies(reference_path, policy_path):
+    '''
+    Log whether the policy of policy_path is less privileged than the one of reference_path,
+    and the tasks having more rights. Returns True if it has no more rights than the reference.
+    '''
+    start = time.perf_counter()
+    interner = PolicyInterner()
+    reference = Policy.from_file(reference_path, interner)
+    policy = Policy.from_file(policy_path, interner)
+    loaded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    exceeding = policy.exceeding(reference)
+    less = not exceeding and policy < reference
+    elapsed = time.perf_counter() - start
+
+    logging.info(f"⚖️  Compared {policy_path} with {reference_path} in {elapsed * 1000:.1f}ms (loaded in {loaded:.3f}s)")
+    if exceeding:
+        logging.warning(f"⚠️  {len(exceeding)} task(s) of {policy_path} have more rights than in {reference_path}:")
+        for role, task in exceeding:
+            logging.warning(f"   {role}/{task}")
+    elif less:
+        logging.info(f"✅ {policy_path} is strictly less privileged than {reference_path}")
+    else:
+        logging.info(f"✅ {policy_path} grants the same rights as {reference_path}")
+    return not exceeding
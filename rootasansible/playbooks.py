@@ -0,0 +1,618 @@
+'''
+Task identifier injection: the include/import/role graph of a playbook tree and its role index.
+'''
+import os
+import uuid
+import yaml
+import logging
+import json
+import time
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import configparser
+
+# Prefer the libyaml bindings when available, they are an order of magnitude faster
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+IMPORT_TASKS_KEYS = (
+    'include', 'include_tasks', 'import_tasks',
+    'ansible.builtin.include', 'ansible.builtin.include_tasks', 'ansible.builtin.import_tasks'
+)
+IMPORT_PLAYBOOK_KEYS = ('import_playbook', 'ansible.builtin.import_playbook')
+IMPORT_ROLE_KEYS = (
+    'include_role', 'import_role',
+    'ansible.builtin.include_role', 'ansible.builtin.import_role'
+)
+PLAY_TASK_SECTIONS = ('pre_tasks', 'tasks', 'post_tasks', 'handlers')
+
+def get_bool_attribute(item, key, default=False):
+    val = item.get(key, default)
+    if isinstance(val, str):
+        return val.lower() in ('yes', 'true')
+    return bool(val)
+
+def is_playbook(data):
+    '''
+    Determine if a parsed YAML document is a playbook or a task list directly.
+    '''
+    for entry in data:
+        if isinstance(entry, dict):
+            if 'hosts' in entry:
+                return True
+            # Check for any import_playbook variant
+            if any(k in entry for k in IMPORT_PLAYBOOK_KEYS):
+                return True
+    return False
+
+def load_yaml_file(abs_path):
+    if not os.path.exists(abs_path):
+        return None
+    try:
+        with open(abs_path, 'r') as f:
+            return yaml.load(f, Loader=SafeLoader)
+    except Exception as e:
+        logging.warning(f"Skipping {abs_path}: {e}")
+        return None
+
+def dump_yaml_file(abs_path, data):
+    '''
+    Write data to abs_path and return the digest of the written content.
+    '''
+    content = yaml.dump(data, Dumper=SafeDumper, default_flow_style=False, sort_keys=False)
+    with open(abs_path, 'w') as f:
+        f.write(content)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def file_digest(abs_path):
+    try:
+        with open(abs_path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+def map_with_jobs(func, *iterables, jobs=1):
+    '''
+    Map func over iterables, in a process pool if jobs > 1.
+    '''
+    items = list(zip(*iterables))
+    if jobs <= 1 or len(items) <= 1:
+        return [func(*item) for item in items]
+    chunksize = max(1, len(items) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(func, *zip(*items), chunksize=chunksize))
+
+def task_key(task):
+    '''
+    Content hash of a task, ignoring the become_flags injected into it or its sub-tasks.
+    '''
+    def strip(value):
+        if isinstance(value, dict):
+            return {k: strip(v) for k, v in value.items() if k != 'become_flags'}
+        if isinstance(value, list):
+            return [strip(v) for v in value]
+        return value
+    return hashlib.sha256(json.dumps(strip(task), sort_keys=True, default=str).encode()).hexdigest()
+
+def load_manifest(manifest_path, roles=None):
+    '''
+    Entries of the UUID manifest. If the role index fingerprint roles differs from the one
+    recorded, their digests are dropped: every file is scanned again, reusing its identifiers.
+    '''
+    if not manifest_path or not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r') as f:
+            data = json.load(f)
+        files = data.get("files", {})
+    except (OSError, ValueError, AttributeError) as e:
+        logging.warning(f"Ignoring UUID manifest {manifest_path}: {e}")
+        return {}
+    if roles is not None and data.get("roles") != roles:
+        logging.debug("Role index changed since the previous run, scanning every file")
+        return {path: {**entry, "digest": None} for path, entry in files.items()}
+    return files
+
+def save_manifest(manifest_path, files, roles=None):
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump({"version": 1, "roles": roles, "files": files}, f, sort_keys=True)
+
+DEFAULT_ROLES_PATH = "~/.ansible/roles:/usr/share/ansible/roles:/etc/ansible/roles"
+DEFAULT_COLLECTIONS_PATH = "~/.ansible/collections:/usr/share/ansible/collections"
+
+def ansible_search_path(playbook_dir, keys, env_keys, default):
+    '''
+    Colon-separated search path of the [defaults] section as ansible-playbook run from
+    playbook_dir reads it: environment first, then ANSIBLE_CONFIG or playbook_dir/ansible.cfg,
+    relative entries being relative to the configuration file.
+    '''
+    base_dir = os.path.abspath(playbook_dir)
+    value = next((os.environ[k] for k in env_keys if os.environ.get(k)), None)
+    if value is None:
+        config_path = os.environ.get('ANSIBLE_CONFIG') or os.path.join(base_dir, 'ansible.cfg')
+        config = configparser.ConfigParser(interpolation=None, strict=False)
+        try:
+            config.read(config_path)
+        except configparser.Error as e:
+            logging.warning(f"Ignoring {config_path}: {e}")
+        value = next((config.get('defaults', k) for k in keys if config.has_option('defaults', k)), default)
+        base_dir = os.path.dirname(os.path.abspath(config_path))
+    return [os.path.normpath(os.path.join(base_dir, os.path.expandvars(os.path.expanduser(p.strip()))))
+            for p in value.split(':') if p.strip()]
+
+def list_dirs(path):
+    try:
+        return sorted(e.name for e in os.scandir(path) if e.is_dir())
+    except OSError:
+        return []
+
+class RoleIndex:
+    '''
+    Index of the roles a playbook tree can reference, built once per run: the roles of the
+    roles_path directories (and of playbook_dir/roles), and the roles of the collections
+    installed in the collections paths (and in playbook_dir/collections).
+
+    Lookups follow the ansible-playbook search order and are memoized, as are the task and
+    handler files of each role and the transitive expansion of its meta/main.yml dependencies.
+    Every lookup is recorded, so that the coverage of the role references can be reported.
+    '''
+
+    def __init__(self, playbook_dir):
+        self.playbook_dir = os.path.abspath(playbook_dir)
+        self.roles_path = ansible_search_path(playbook_dir, ('roles_path',), ('ANSIBLE_ROLES_PATH',), DEFAULT_ROLES_PATH)
+        self.roles_path.append(os.path.join(self.playbook_dir, 'roles'))
+        self.collections_path = [os.path.join(self.playbook_dir, 'collections')] + ansible_search_path(
+            playbook_dir, ('collections_path', 'collections_paths'),
+            ('ANSIBLE_COLLECTIONS_PATH', 'ANSIBLE_COLLECTIONS_PATHS'), DEFAULT_COLLECTIONS_PATH)
+
+        # Map: role name -> role directory, the first search path holding it wins
+        self.roles = {}
+        for search_dir in self.roles_path:
+            for name in list_dirs(search_dir):
+                self.roles.setdefault(name, os.path.join(search_dir, name))
+        # Map: namespace.collection.role -> role directory
+        self.collection_roles = {}
+        for search_dir in self.collections_path:
+            root = os.path.join(search_dir, 'ansible_collections')
+            for namespace in list_dirs(root):
+                for collection in list_dirs(os.path.join(root, namespace)):
+                    roles_dir = os.path.join(root, namespace, collection, 'roles')
+                    for name in list_dirs(roles_dir):
+                        self.collection_roles.setdefault(f"{namespace}.{collection}.{name}", os.path.join(roles_dir, name))
+        # Map: role directory -> namespace.collection it belongs to
+        self.collection_of = {path: fqcn.rsplit('.', 1)[0] for fqcn, path in self.collection_roles.items()}
+
+        self._resolved = {}
+        self._files = {}
+        self._dependencies = {}
+        # Map: role reference -> 'resolved', 'missing' or 'templated'
+        self.references = {}
+        # Role directories resolved outside playbook_dir, left untouched
+        self.external = set()
+
+    def fingerprint(self):
+        '''
+        Digest of the search paths and the indexed roles, recorded in the UUID manifest.
+        '''
+        return hashlib.sha256(json.dumps(
+            [self.roles_path, self.collections_path, self.roles, self.collection_roles], sort_keys=True
+        ).encode()).hexdigest()
+
+    def resolve(self, base_dir, ref, collections=()):
+        '''
+        Directory of the role ref referenced from a file of base_dir, within the collections
+        of the play, or None.
+        '''
+        if not isinstance(ref, str) or not ref:
+            return None
+        key = (base_dir, ref, collections)
+        if key not in self._resolved:
+            if '{{' in ref:
+                role_dir = None
+                self.references[ref] = 'templated'
+            else:
+                role_dir = self.lookup(base_dir, ref, collections)
+                self.references[ref] = 'resolved' if role_dir else 'missing'
+            self._resolved[key] = role_dir
+        return self._resolved[key]
+
+    def lookup(self, base_dir, ref, collections=()):
+        if ref.startswith('ansible.legacy.'):
+            ref = ref[len('ansible.legacy.'):]
+            collections = ()
+        if '/' in ref:
+            path = os.path.normpath(os.path.join(base_dir, os.path.expanduser(ref)))
+            return path if os.path.isdir(path) else None
+        if ref.count('.') >= 2:
+            return self.collection_roles.get(ref)
+        for collection in collections:
+            if f"{collection}.{ref}" in self.collection_roles:
+                return self.collection_roles[f"{collection}.{ref}"]
+        for candidate in (os.path.join(base_dir, 'roles', ref), self.roles.get(ref), os.path.join(base_dir, ref)):
+            if candidate and os.path.isdir(candidate):
+                return candidate
+        return None
+
+    def entry_file(self, role_dir, section, name=None):
+        key = (role_dir, section, name)
+        if key not in self._files:
+            base = os.path.join(role_dir, section, name or 'main')
+            self._files[key] = next((base + ext for ext in ('.yml', '.yaml', '') if os.path.isfile(base + ext)),
+                                    base + '.yml')
+        return self._files[key]
+
+    def entry_files(self, role_dir, tasks_from=None, handlers_from=None):
+        if os.path.commonpath([role_dir, self.playbook_dir]) != self.playbook_dir:
+            self.external.add(role_dir)
+            return []
+        return [self.entry_file(role_dir, 'tasks', tasks_from), self.entry_file(role_dir, 'handlers', handlers_from)]
+
+    def dependencies(self, role_dir):
+        '''
+        Transitive meta/main.yml dependencies of role_dir in execution order, as (role_dir,
+        become) pairs, become being None where it is inherited from the dependent role.
+        '''
+        if role_dir in self._dependencies:
+            return self._dependencies[role_dir]
+        # Dependency cycles stop at the role being expanded
+        self._dependencies[role_dir] = []
+        meta = load_yaml_file(self.entry_file(role_dir, 'meta'))
+        deps = meta.get('dependencies') if isinstance(meta, dict) else None
+        collection = self.collection_of.get(role_dir)
+        collections = (collection,) if collection else ()
+
+        expanded = []
+        for dep in deps if isinstance(deps, list) else []:
+            mode = None
+            if isinstance(dep, dict):
+                if 'become' in dep:
+                    mode = get_bool_attribute(dep, 'become')
+                dep = dep.get('role') or dep.get('name')
+            # Sibling roles are found from the parent directory of the dependent role
+            dep_dir = self.resolve(os.path.dirname(role_dir), dep, collections)
+            if dep_dir is None:
+                continue
+            expanded += [(d, mode if m is None else m) for d, m in self.dependencies(dep_dir)]
+            expanded.append((dep_dir, mode))
+        self._dependencies[role_dir] = expanded
+        return expanded
+
+    def role_files(self, base_dir, ref, collections=(), tasks_from=None, handlers_from=None):
+        '''
+        Task and handler files run by a reference to the role ref from a file of base_dir,
+        dependencies first, as (path, become) pairs, become being None where it is inherited
+        from the reference.
+        '''
+        role_dir = self.resolve(base_dir, ref, collections)
+        if role_dir is None:
+            return []
+        files = []
+        for dep_dir, mode in self.dependencies(role_dir):
+            files += [(path, mode) for path in self.entry_files(dep_dir)]
+        files += [(path, None) for path in self.entry_files(role_dir, tasks_from, handlers_from)]
+        return files
+
+    def coverage(self):
+        statuses = list(self.references.values())
+        return {
+            "indexed": len(self.roles) + len(self.collection_roles),
+            "references": len(statuses),
+            "resolved": statuses.count('resolved'),
+            "missing": sorted(r for r, s in self.references.items() if s == 'missing'),
+            "templated": sorted(r for r, s in self.references.items() if s == 'templated'),
+            "external": sorted(self.external),
+        }
+
+class PlaybookGraph:
+    '''
+    In-memory include/import/role graph of the YAML files of a playbook tree.
+
+    Every file is parsed exactly once. The effective 'become' of each file is the
+    disjunction of the 'become' of all the places it is included from, computed
+    with a fixed-point pass over the graph before anything is written back.
+
+    If a manifest from a previous run is given, files whose content still matches it
+    are neither parsed nor rewritten, their edges are taken from the manifest, and
+    tasks whose content did not change keep their previous identifiers.
+    '''
+
+    def __init__(self, playbook_dir, manifest=None, roles=None):
+        self.playbook_dir = os.path.abspath(playbook_dir)
+        self.roles = roles or RoleIndex(playbook_dir)
+        # Map: relative_path -> {digest, become, edges, ids} from the previous run
+        self.manifest = manifest or {}
+        # Map: absolute_path -> parsed YAML data (None if missing or unreadable)
+        self.documents = {}
+        # Map: absolute_path -> effective inherited become (bool)
+        self.become = {}
+        # Map: absolute_path -> sha256 of the current content
+        self.digests = {}
+
+    def relpath(self, abs_path):
+        return os.path.relpath(abs_path, self.playbook_dir)
+
+    def entry(self, abs_path):
+        '''
+        Manifest entry of abs_path if its content did not change since the previous run.
+        '''
+        entry = self.manifest.get(self.relpath(abs_path))
+        if entry is None:
+            return None
+        if abs_path not in self.digests:
+            self.digests[abs_path] = file_digest(abs_path)
+        return entry if entry.get("digest") == self.digests[abs_path] else None
+
+    def load(self, abs_path):
+        if abs_path not in self.documents:
+            self.documents[abs_path] = load_yaml_file(abs_path)
+        return self.documents[abs_path]
+
+    def load_all(self, abs_paths, jobs=1):
+        pending = [p for p in abs_paths if p not in self.documents and self.entry(p) is None]
+        for abs_path, data in zip(pending, map_with_jobs(load_yaml_file, pending, jobs=jobs)):
+            self.documents[abs_path] = data
+        return len(pending)
+
+    def scan(self, abs_path, inherited_become, inject=False, reuse_ids=None, assigned_ids=None):
+        '''
+        Walk the in-memory document of abs_path as if it was included with inherited_become.
+        Returns the list of (child_path, child_become) edges and whether the document
+        was modified. Task become_flags are only injected if inject is True, reusing the
+        identifiers of reuse_ids for known task keys and recording them in assigned_ids.
+        '''
+        data = self.documents.get(abs_path)
+        edges = []
+        if not isinstance(data, list):
+            return edges, False
+
+        base_dir = os.path.dirname(abs_path)
+        role_name = self.relpath(abs_path)
+        reuse_ids = reuse_ids or {}
+        assigned_ids = {} if assigned_ids is None else assigned_ids
+        occurrences = {}
+
+        def process_tasks(tasks, current_context_become, collections=()):
+            task_modified = False
+            if not isinstance(tasks, list):
+                return False
+
+            for task in tasks:
+                if not isinstance(task, dict): continue
+
+                # Determine effective become for this task
+                task_become = get_bool_attribute(task, 'become', current_context_become)
+
+                # Check for imports/includes
+                for key in IMPORT_TASKS_KEYS:
+                    if key in task:
+                        val = task[key]
+                        if isinstance(val, dict): val = val.get('file')
+                        if isinstance(val, str) and '{{' not in val:
+                            # Resolve path relative to current file
+                            edges.append((os.path.abspath(os.path.join(base_dir, val)), task_become))
+                        break
+
+                # Roles included or imported as a task, 'apply' passing become to an include_role
+                role_key = next((k for k in IMPORT_ROLE_KEYS if k in task), None)
+                if role_key and isinstance(task[role_key], dict):
+                    spec = task[role_key]
+                    apply = spec.get('apply') if isinstance(spec.get('apply'), dict) else {}
+                    role_become = get_bool_attribute(apply, 'become', task_become)
+                    for role_file, mode in self.roles.role_files(base_dir, spec.get('name'), collections,
+                                                                 spec.get('tasks_from'), spec.get('handlers_from')):
+                        edges.append((role_file, role_become if mode is None else mode))
+
+                # Handling blocks (recursion within file)
+                if 'block' in task:
+                    for section in ('block', 'rescue', 'always'):
+                        if section in task and process_tasks(task[section], task_become, collections):
+                            task_modified = True
+
+                if task.get('become_method'):
+                    continue
+
+                # We enforce injection if effective_become is True
+                if inject and task_become:
+                    # Identical tasks in a file are told apart by their occurrence
+                    content_key = task_key(task)
+                    occurrences[content_key] = occurrences.get(content_key, 0) + 1
+                    key = f"{content_key}:{occurrences[content_key]}"
+
+                    # Check if already injected
+                    current_flags = task.get('become_flags', '')
+                    if '-r ' in current_flags and '-t ' in current_flags:
+                        assigned_ids[key] = current_flags.split('-t ', 1)[1].split()[0]
+                        continue
+
+                    unique_id = reuse_ids.get(key) or str(uuid.uuid4())
+                    assigned_ids[key] = unique_id
+                    task['become_flags'] = f"{current_flags} -r {role_name} -t {unique_id}".strip()
+                    task_modified = True
+
+            return task_modified
+
+        if not is_playbook(data):
+            # Direct task list
+            return edges, process_tasks(data, inherited_become)
+
+        modified = False
+        for play in data:
+            if not isinstance(play, dict): continue
+
+            import_key = next((k for k in IMPORT_PLAYBOOK_KEYS if k in play), None)
+            if import_key:
+                val = play[import_key]
+                if isinstance(val, str) and '{{' not in val:
+                    edges.append((os.path.abspath(os.path.join(base_dir, val)), False))
+                continue
+
+            p_become = get_bool_attribute(play, 'become', False)
+            collections = play.get('collections')
+            collections = tuple(c for c in collections if isinstance(c, str)) if isinstance(collections, list) else ()
+
+            # Process roles
+            for role in play.get('roles') or []:
+                role_ref = None
+                role_become = p_become
+
+                if isinstance(role, str):
+                    role_ref = role
+                elif isinstance(role, dict):
+                    role_ref = role.get('role') or role.get('name')
+                    role_become = get_bool_attribute(role, 'become', p_become)
+
+                for role_file, mode in self.roles.role_files(base_dir, role_ref, collections):
+                    edges.append((role_file, role_become if mode is None else mode))
+
+            if not play.get('become_method'):
+                for section in PLAY_TASK_SECTIONS:
+                    if section in play and process_tasks(play[section], p_become, collections):
+                        modified = True
+
+        return edges, modified
+
+    def edges(self, abs_path, inherited_become):
+        if abs_path not in self.documents:
+            entry = self.entry(abs_path)
+            if entry is not None:
+                # Edge modes recorded in the manifest: True, False or None to inherit
+                return [
+                    (os.path.normpath(os.path.join(self.playbook_dir, child)),
+                     inherited_become if mode is None else mode)
+                    for child, mode in entry.get("edges", [])
+                ]
+        return self.scan(abs_path, inherited_become)[0]
+
+    def edge_modes(self, abs_path):
+        edges_without, _ = self.scan(abs_path, False)
+        edges_with, _ = self.scan(abs_path, True)
+        return [
+            [self.relpath(child), without if without == with_ else None]
+            for (child, without), (_, with_) in zip(edges_without, edges_with)
+        ]
+
+    def propagate(self, roots):
+        '''
+        Fixed-point propagation of the effective become from the root files.
+        A file is re-scanned at most once more, when it is upgraded from False to True.
+        '''
+        worklist = deque((root, False) for root in roots)
+        while worklist:
+            abs_path, inherited_become = worklist.popleft()
+            known = self.become.get(abs_path)
+            # True includes False case effectively for modifications
+            if known is not None and (known or not inherited_become):
+                continue
+            if self.entry(abs_path) is None and not os.path.isfile(abs_path):
+                continue
+            self.become[abs_path] = inherited_become
+            worklist.extend(self.edges(abs_path, inherited_become))
+
+    def write(self, jobs=1):
+        '''
+        Inject the identifiers with the effective become of each file and
+        write back only the files that changed. Returns the number of written files.
+        '''
+        modified_paths = []
+        for abs_path, inherited_become in self.become.items():
+            entry = self.entry(abs_path)
+            if entry is not None and entry.get("become") == inherited_become:
+                continue
+            self.load(abs_path)
+            assigned_ids = {}
+            # Injection stays serial as it mutates the documents held by this process
+            _, modified = self.scan(abs_path, inherited_become, inject=True,
+                                    reuse_ids=(self.manifest.get(self.relpath(abs_path)) or {}).get("ids"),
+                                    assigned_ids=assigned_ids)
+            if modified:
+                modified_paths.append(abs_path)
+            else:
+                self.digests[abs_path] = file_digest(abs_path)
+            self.manifest[self.relpath(abs_path)] = {
+                "become": inherited_become,
+                "edges": self.edge_modes(abs_path),
+                "ids": assigned_ids,
+            }
+
+        digests = map_with_jobs(dump_yaml_file, modified_paths, [self.documents[p] for p in modified_paths], jobs=jobs)
+        self.digests.update(zip(modified_paths, digests))
+        for abs_path in self.become:
+            if self.relpath(abs_path) in self.manifest:
+                self.manifest[self.relpath(abs_path)]["digest"] = self.digests.get(abs_path)
+        return len(modified_paths)
+
+    def export_manifest(self):
+        return {self.relpath(p): self.manifest[self.relpath(p)] for p in self.become if self.relpath(p) in self.manifest}
+
+def find_yaml_files(playbook_dir):
+    files_to_visit = []
+    if os.path.isdir(playbook_dir):
+        for root, dirs, files in os.walk(playbook_dir):
+            for filename in files:
+                if filename.endswith(('.yml', '.yaml')):
+                    files_to_visit.append(os.path.abspath(os.path.join(root, filename)))
+    else:
+        files_to_visit.append(os.path.abspath(playbook_dir))
+    return files_to_visit
+
+def inject_uuids(playbook_dir, jobs=1, manifest_path=None):
+    '''
+    Inject unique UUIDs into become_flags for each task in the playbook.
+    This allows for generating stable identifiers for RootAsRole tasks generation and execution.
+    The identifiers will be the path of the file relative to playbook_dir as a -r parameter and a uuid4 as -t parameter.
+    
+    Traverses playbooks, roles, and imports to handle 'become' inheritance correctly.
+    Each file is parsed once, 'become' is propagated over the resulting graph,
+    then only modified files are written back. Returns the timings of each phase.
+    Parsing and writing are spread over jobs worker processes.
+
+    If manifest_path is given, the content hash and assigned identifiers of each file are
+    persisted there, so that unchanged files are skipped and unchanged tasks keep their
+    -t identifiers across runs.
+
+    Roles are resolved with a RoleIndex of the roles_path and collections paths of the
+    tree, following include_role/import_role tasks and meta dependencies, and the role
+    references that could not be resolved are reported.
+    '''
+    timings = {}
+
+    start = time.perf_counter()
+    roles = RoleIndex(playbook_dir)
+    fingerprint = roles.fingerprint()
+    graph = PlaybookGraph(playbook_dir, load_manifest(manifest_path, fingerprint), roles)
+    timings['roles'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    files_to_visit = find_yaml_files(playbook_dir)
+    logging.debug(f"Parsing {len(files_to_visit)} files with {jobs} job(s)...")
+    parsed = graph.load_all(files_to_visit, jobs=jobs)
+    timings['parse'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    graph.propagate(files_to_visit)
+    timings['propagate'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    written = graph.write(jobs=jobs)
+    if manifest_path:
+        save_manifest(manifest_path, graph.export_manifest(), fingerprint)
+    timings['write'] = time.perf_counter() - start
+
+    coverage = roles.coverage()
+    logging.info(f"   Indexed {coverage['indexed']} roles in {timings['roles']:.3f}s, "
+                 f"parsed {parsed}/{len(files_to_visit)} files in {timings['parse']:.3f}s, "
+                 f"propagated become in {timings['propagate']:.3f}s, "
+                 f"rewrote {written} files in {timings['write']:.3f}s")
+    if coverage['references']:
+        logging.info(f"   Resolved {coverage['resolved']}/{coverage['references']} role references of the parsed files")
+    if coverage['missing']:
+        logging.warning(f"Roles not found, their become tasks get no identifier: {', '.join(coverage['missing'])}")
+    if coverage['templated']:
+        logging.warning(f"Templated role names cannot be resolved: {', '.join(coverage['templated'])}")
+    if coverage['external']:
+        logging.info(f"   Left {len(coverage['external'])} roles outside of {playbook_dir} untouched")
+    return timings
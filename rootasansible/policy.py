@@ -0,0 +1,330 @@
+'''
+Streaming merge of the generated policy into the base policy, and its compaction.
+'''
+import os
+from pathlib import PurePosixPath
+import logging
+import json
+import hashlib
+import re
+
+from .playbooks import find_yaml_files
+from .vendoring import format_size
+
+def leaf_path_index(paths) -> tuple[list[str], dict[str, list[str]]]:
+    '''
+    Split paths into leaves (paths that are not a parent of another path) and a
+    parent -> children mapping of the collapsed paths, children being the nearest
+    descendants of the parent among paths.
+
+    Once sorted by components, the descendants of a path immediately follow it, so a
+    single sweep with a stack of the open ancestors is enough: O(n log n) overall.
+    '''
+    entries = sorted((PurePosixPath(p).parts, p) for p in paths)
+    leaves = []
+    collapsed = {}
+    ancestors = []
+
+    for i, (parts, path) in enumerate(entries):
+        while ancestors and parts[:len(ancestors[-1][0])] != ancestors[-1][0]:
+            ancestors.pop()
+        if ancestors:
+            collapsed.setdefault(ancestors[-1][1], []).append(path)
+
+        next_parts = entries[i + 1][0] if i + 1 < len(entries) else None
+        if next_parts is not None and next_parts[:len(parts)] == parts:
+            ancestors.append((parts, path))
+        else:
+            leaves.append(path)
+
+    return leaves, collapsed
+
+def keep_leaf_entries(data: dict[str, str]) -> dict[str, str]:
+    leaves, _ = leaf_path_index(data)
+    return {p: data[p] for p in leaves}
+
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+def iter_json_array(f, key, chunk_size=1 << 16):
+    '''
+    Incrementally yield the items of the array at key of the top-level JSON object read from f.
+    Only the item being decoded is held in memory, other top-level values are skipped.
+    '''
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill(min_size):
+        nonlocal buf, pos, eof
+        chunk = f.read(max(chunk_size, min_size))
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def peek():
+        nonlocal pos
+        while True:
+            pos = JSON_WHITESPACE.match(buf, pos).end()
+            if pos < len(buf) or eof:
+                return buf[pos:pos + 1]
+            fill(0)
+
+    def expect(*chars):
+        nonlocal pos
+        c = peek()
+        if c not in chars:
+            raise ValueError(f"Expected {' or '.join(chars)} but got {c!r} in JSON stream")
+        pos += 1
+        return c
+
+    def decode():
+        nonlocal pos
+        while True:
+            peek()
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # A number at the end of the buffer may be truncated, read more to be sure
+                if eof or (end < len(buf) and buf[end] not in '0123456789.eE+-'):
+                    pos = end
+                    return value
+            except ValueError:
+                if eof:
+                    raise
+            # Grow the buffer geometrically so that large items are decoded in linear time
+            fill(len(buf) - pos)
+
+    expect('{')
+    if peek() == '}':
+        return
+    while True:
+        current_key = decode()
+        expect(':')
+        if current_key == key:
+            expect('[')
+            if peek() == ']':
+                pos += 1
+            else:
+                while True:
+                    yield decode()
+                    if expect(',', ']') == ']':
+                        break
+        else:
+            decode()
+        if expect(',', '}') == '}':
+            return
+
+ANCHORED_COMMAND = re.compile(r"^(\S+) '\^([^']*)\$'$")
+TASK_FLAG = re.compile(r'(?<=-t )(\S+)')
+
+def minimise_file_entries(files: dict[str, str]) -> dict[str, str]:
+    '''
+    Drop the intermediate directory entries whose access is a subset of the access of
+    their nearest ancestor entry. As in keep_leaf_entries, the most specific paths are
+    what the tracer recorded the task using: leaf entries are always kept, and file
+    rules are not assumed to apply to the hierarchy below them.
+    '''
+    leaves, collapsed = leaf_path_index(files)
+    leaves = set(leaves)
+    redundant = {
+        child
+        for parent, children in collapsed.items()
+        for child in children
+        if child not in leaves and set(files[child]) <= set(files[parent])
+    }
+    return {p: files[p] for p in files if p not in redundant}
+
+def mergeable_regex(regex):
+    '''
+    True if regex keeps its meaning as a branch of an alternation: it has no group other than
+    non-capturing ones, whose numbering and backreferences would shift, no inline flags and
+    no top-level '|', which would escape the anchors. Character classes nesting '[' are
+    ambiguous between the regex dialects and not merged either.
+    '''
+    depth = 0
+    i = 0
+    while i < len(regex):
+        c = regex[i]
+        if c == '\\':
+            if regex[i + 1:i + 2] in tuple("123456789gk"):
+                return False
+            i += 2
+            continue
+        if c == '[':
+            i += 1
+            if regex[i:i + 1] == '^':
+                i += 1
+            if regex[i:i + 1] == ']':
+                i += 1
+            while i < len(regex) and regex[i] != ']':
+                if regex[i] == '[':
+                    return False
+                i += 2 if regex[i] == '\\' else 1
+            if i >= len(regex):
+                return False
+        elif c == '(':
+            if regex[i + 1:i + 3] != '?:':
+                return False
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth < 0:
+                return False
+        elif c == '|' and depth == 0:
+            return False
+        i += 1
+    return depth == 0
+
+def collapse_commands(commands):
+    '''
+    Remove duplicate commands and merge the anchored regexes of a same executable
+    into a single alternation, e.g. "/bin/a '^x$'" and "/bin/a '^y$'" into "/bin/a '^(?:x|y)$'".
+    Only the regexes accepted by mergeable_regex are merged, the others are kept as they are.
+    '''
+    if not isinstance(commands, dict) or not isinstance(commands.get("add"), list):
+        return commands
+    regexes = {}
+    collapsed = []
+    for command in dict.fromkeys(commands["add"]):
+        match = ANCHORED_COMMAND.match(command) if isinstance(command, str) else None
+        if match is None or not mergeable_regex(match.group(2)):
+            collapsed.append(command)
+            continue
+        exe, regex = match.groups()
+        if exe not in regexes:
+            regexes[exe] = []
+            # placeholder of the merged command, distinct from any command of the policy
+            collapsed.append((exe,))
+        regexes[exe].append(regex)
+    commands = dict(commands)
+    commands["add"] = [
+        (f"{c[0]} '^{regexes[c[0]][0]}$'" if len(regexes[c[0]]) == 1 else f"{c[0]} '^(?:{'|'.join(regexes[c[0]])})$'")
+        if isinstance(c, tuple) else c
+        for c in collapsed
+    ]
+    return commands
+
+def compact_roles(roles, minimise_files=False):
+    '''
+    Collapse the commands of every task, and minimise its file entries if minimise_files is
+    True, then merge the tasks of a role having identical credentials, commands and options
+    into the first of them.
+    Returns the map of the merged task names to the name of the task they were merged into.
+    '''
+    aliases = {}
+    for role in roles:
+        kept = {}
+        tasks = []
+        for task in role.get("tasks", []):
+            cred = task.get("cred")
+            if minimise_files and isinstance(cred, dict) and isinstance(cred.get("files"), dict):
+                cred["files"] = minimise_file_entries(cred["files"])
+            if "commands" in task:
+                task["commands"] = collapse_commands(task["commands"])
+            key = hashlib.sha256(json.dumps(
+                [task.get("cred"), task.get("commands"), task.get("options")], sort_keys=True
+            ).encode()).hexdigest()
+            if key in kept and "name" in task and "name" in kept[key]:
+                aliases[task["name"]] = kept[key]["name"]
+                continue
+            kept.setdefault(key, task)
+            tasks.append(task)
+        role["tasks"] = tasks
+    return aliases
+
+TASK_ALIASES = os.path.join("templates", "task_aliases.json")
+
+def rewrite_task_flags(build_dir, aliases):
+    '''
+    Replace the -t identifiers of the merged tasks in the playbooks of build_dir.
+    Returns the number of rewritten files.
+    '''
+    if not aliases:
+        return 0
+    rewritten = 0
+    for path in find_yaml_files(build_dir):
+        with open(path, 'r') as f:
+            content = f.read()
+        new_content = TASK_FLAG.sub(lambda m: aliases.get(m.group(1), m.group(1)), content)
+        if new_content != content:
+            with open(path, 'w') as f:
+                f.write(new_content)
+            rewritten += 1
+    return rewritten
+
+def merge_security_policies(build_dir, pretty=False, compact=True, minimise_files=False):
+    '''
+    Merge the scenario policy into the base policy, naming its roles and tasks after the
+    roles and tasks of the generated policy that have the same purpose.
+
+    The generated policy is streamed role by role and only the names of the roles matching
+    a scenario role are kept. Duplicate purposes are matched by order of appearance.
+
+    If compact is True, the equivalent tasks of the scenario roles are merged and the
+    -t flags of the playbooks in build_dir are rewritten accordingly. The merged identifiers
+    are also written to TASK_ALIASES, for the identifiers assigned in-process by the callback.
+    minimise_files is passed to compact_roles.
+    '''
+    base_policy_path = os.path.join(build_dir, "templates", "sr_rootasrole.json")
+    generated_policy_path = os.path.join(build_dir, "templates", "result.json")
+    scenario_policy_path = os.path.join(build_dir, "templates", "sr_scenario.json")        
+    
+    with open(base_policy_path, 'r') as f:
+        base_policy = json.load(f)
+    with open(scenario_policy_path, 'r') as f:
+        scenario_policy = json.load(f)
+
+    # Index the scenario roles by purpose once
+    scenario_roles = {}
+    for role in scenario_policy["roles"]:
+        scenario_roles.setdefault(role["purpose"], []).append(role)
+
+    # Map: role purpose -> [(role name, {task purpose -> [task names]})] in generated order
+    generated_roles = {}
+    with open(generated_policy_path, 'r') as f:
+        for grole in iter_json_array(f, "roles"):
+            if grole.get("purpose") not in scenario_roles:
+                continue
+            gtasks = {}
+            for gtask in grole.get("tasks", []):
+                gtasks.setdefault(gtask.get("purpose"), []).append(gtask["name"])
+            generated_roles.setdefault(grole["purpose"], []).append((grole["name"], gtasks))
+
+    for purpose, roles in scenario_roles.items():
+        groles = generated_roles.get(purpose)
+        if not groles: continue
+        if len(groles) != len(roles):
+            logging.warning(f"⚠️  {len(groles)} generated role(s) for {len(roles)} scenario role(s) with purpose '{purpose}'")
+
+        for i, role in enumerate(roles):
+            role["name"], gtasks = groles[min(i, len(groles) - 1)]
+            occurrences = {}
+            for task in role["tasks"]:
+                names = gtasks.get(task["purpose"])
+                if not names: continue
+                n = occurrences.get(task["purpose"], 0)
+                occurrences[task["purpose"]] = n + 1
+                task["name"] = names[min(n, len(names) - 1)]
+    
+    aliases = {}
+    if compact:
+        tasks_before = sum(len(r.get("tasks", [])) for r in scenario_policy["roles"])
+        size_before = len(json.dumps(scenario_policy["roles"], separators=(',', ':')))
+        aliases = compact_roles(scenario_policy["roles"], minimise_files=minimise_files)
+        rewritten = rewrite_task_flags(build_dir, aliases)
+        tasks_after = sum(len(r.get("tasks", [])) for r in scenario_policy["roles"])
+        size_after = len(json.dumps(scenario_policy["roles"], separators=(',', ':')))
+        logging.info(f"🗜️  Policy compaction: {tasks_before} -> {tasks_after} tasks, "
+                     f"{format_size(size_before)} -> {format_size(size_after)}, "
+                     f"{len(aliases)} task identifiers rewritten in {rewritten} playbooks")
+    with open(os.path.join(build_dir, TASK_ALIASES), 'w') as f:
+        json.dump(aliases, f)
+
+    base_policy["roles"].extend(scenario_policy["roles"])
+    
+    merged_policy_path = os.path.join(build_dir, "templates", "result_sr_rootasrole.json")
+    with open(merged_policy_path, 'w') as f:
+        if pretty:
+            json.dump(base_policy, f, indent=4)
+        else:
+            json.dump(base_policy, f, separators=(',', ':'))
@@ -0,0 +1,86 @@
+'''
+Sandbox containers: the cached sandbox image and the addresses of the sandboxes.
+'''
+import os
+import shutil
+import subprocess
+import logging
+import json
+import hashlib
+import getpass
+import ipaddress
+
+from .vendoring import ARTIFACTS
+
+SANDBOX_IMAGE_CACHE = "rootasansible-cache"
+SANDBOX_KEY = os.path.join("inventory", "ansible_rsa")
+# vendored files, besides the Dockerfile and the artifacts, that define what the cached sandbox image contains
+SANDBOX_IMAGE_INPUTS = [os.path.join("roles", "rootasrole", "tasks", name) for name in
+                        ("install.yml", "install_rust.yml", "install_bpftool.yml", "install_capable.yml", "install_gensr.yml")]
+
+def restore_sandbox_key(build_dir, cache_dir):
+    '''
+    Copy the ssh key pair of the sandbox from cache_dir into the vendored inventory, generating it
+    on first use. The public key is baked into the image, so it must outlive the build directory.
+    '''
+    cached_key = os.path.join(cache_dir, "sandbox", "ansible_rsa")
+    if not os.path.exists(cached_key):
+        os.makedirs(os.path.dirname(cached_key), exist_ok=True)
+        subprocess.run(["ssh-keygen", "-q", "-t", "rsa", "-b", "2048", "-N", "", "-f", cached_key], check=True)
+    for suffix in ("", ".pub"):
+        shutil.copy2(cached_key + suffix, os.path.join(build_dir, SANDBOX_KEY) + suffix)
+
+def sandbox_image_key(build_dir):
+    '''
+    Content hash of what the sandbox image is built from: the pinned artifact commits, the rendered
+    Dockerfile, the public key it authorizes and the install tasks of the RootAsRole binaries.
+    '''
+    from jinja2 import Template  # installed with ansible
+
+    with open(os.path.join(build_dir, "templates", "Dockerfile.j2")) as f:
+        dockerfile = Template(f.read()).render(ansible_user=os.environ.get("USER", ""))
+    digest = hashlib.sha256()
+    digest.update(json.dumps([(path, commit) for path, _, commit, _ in ARTIFACTS]).encode())
+    digest.update(dockerfile.encode())
+    for rel in [SANDBOX_KEY + ".pub", *SANDBOX_IMAGE_INPUTS]:
+        with open(os.path.join(build_dir, rel), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def sandbox_image_vars(build_dir, cache_dir, reuse=True):
+    '''
+    Extra vars starting the sandboxes from the cached image of the current build inputs if it
+    exists and reuse is True, or else asking main.yml to commit it once the binaries are installed.
+    '''
+    restore_sandbox_key(build_dir, cache_dir)
+    image = f"{SANDBOX_IMAGE_CACHE}:{sandbox_image_key(build_dir)[:16]}"
+    inspected = subprocess.run(["docker", "image", "inspect", image], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if reuse and inspected.returncode == 0:
+        logging.info(f"📦 Sandbox image cache hit: {image}, skipping the image build and the compilations.")
+        return ["-e", f"sandbox_image={image}"]
+    logging.info(f"📦 Sandbox image cache miss: {image} will be committed once the binaries are installed.")
+    return ["-e", f"sandbox_cache_image={image}"]
+
+SANDBOX_CONTAINER = "rootasansiblecontainer"
+SANDBOX_IP = "172.21.0.2"
+# RootAsAnsibleNetwork, ansible_network/ansible_netmask of the inventory
+SANDBOX_NETWORK = ipaddress.ip_network("172.21.0.0/16")
+
+def sandbox_container(index):
+    return SANDBOX_CONTAINER if index == 0 else f"{SANDBOX_CONTAINER}-{index}"
+
+def sandbox_ip(index):
+    '''
+    Address of the sandbox index, counted from SANDBOX_IP within SANDBOX_NETWORK.
+    '''
+    ip = ipaddress.ip_address(SANDBOX_IP) + index
+    if index < 0 or ip not in SANDBOX_NETWORK or ip == SANDBOX_NETWORK.broadcast_address:
+        raise ValueError(f"No address for sandbox {index} in {SANDBOX_NETWORK}")
+    return str(ip)
+
+def ask_become_pass():
+    '''
+    Ask the sudo password once for the ansible-playbook processes run concurrently, which cannot prompt.
+    '''
+    if not os.environ.get("GITHUB_ACTIONS") and not os.environ.get("CI") and 'ANSIBLE_BECOME_PASS' not in os.environ:
+        os.environ['ANSIBLE_BECOME_PASS'] = getpass.getpass("BECOME password: ")
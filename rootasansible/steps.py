@@ -0,0 +1,122 @@
+'''
+Asynchronous runner of the steps of the demonstration and their timeline.
+'''
+import os
+import logging
+import json
+import time
+import asyncio
+import contextlib
+
+def describe_ansible_event(event):
+    '''
+    One-line summary of an event of the ansible.posix.jsonl callback, None for the events not worth logging.
+    '''
+    kind = event.get('_event', '')
+    task = (event.get('task') or {}).get('name', '')
+    if kind.startswith('v2_runner_on_') or kind.startswith('v2_runner_item_on_'):
+        status = kind.rsplit('_on_', 1)[1]
+        return f"{status}: [{', '.join(event.get('hosts') or {})}] {task}"
+    if kind == 'v2_playbook_on_play_start':
+        return f"PLAY [{(event.get('play') or {}).get('name', '')}]"
+    if kind == 'v2_playbook_on_stats':
+        return f"STATS {json.dumps(event.get('stats') or {})}"
+    return None
+
+class StepRunner:
+    '''
+    Run the steps of the demonstration as asyncio subprocesses, streaming their output line by
+    line into the logger, so that independent steps can run concurrently, and record the timeline
+    of all the steps (start, end, duration, exit code).
+
+    If json_events_dir is set, ansible-playbook steps use the ansible.posix.jsonl stdout callback:
+    their per-task results are saved to json_events_dir/<step>.jsonl and summarised in the log.
+    '''
+    def __init__(self, json_events_dir=None):
+        self.json_events_dir = json_events_dir
+        self.timeline = []
+
+    def record(self, name, start, end, returncode, **details):
+        self.timeline.append({"step": name, "start": round(start, 3), "end": round(end, 3),
+                              "duration": round(end - start, 3), "returncode": returncode, **details})
+
+    @contextlib.contextmanager
+    def step(self, name):
+        '''
+        Time an in-process step.
+        '''
+        start = time.time()
+        returncode = 1
+        try:
+            yield
+            returncode = 0
+        finally:
+            self.record(name, start, time.time(), returncode)
+
+    async def run(self, name, cmd, cwd=None, env=None, log_path=None):
+        '''
+        Run cmd, logging each line of its output prefixed with name, and also writing it to log_path if given.
+        Returns its exit code.
+        '''
+        env = dict(os.environ if env is None else env)
+        events = None
+        counts = {}
+        if self.json_events_dir and cmd[0] == "ansible-playbook":
+            env['ANSIBLE_STDOUT_CALLBACK'] = "ansible.posix.jsonl"
+            os.makedirs(self.json_events_dir, exist_ok=True)
+            events = open(os.path.join(self.json_events_dir, f"{name}.jsonl"), 'w')
+        log = open(log_path, 'w') if log_path else None
+
+        start = time.time()
+        # results of the JSON callback can be long lines
+        process = await asyncio.create_subprocess_exec(*cmd, cwd=cwd, env=env, stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.STDOUT, limit=1 << 26)
+        try:
+            async for raw in process.stdout:
+                line = raw.decode(errors='replace').rstrip()
+                if log:
+                    log.write(line + "\n")
+                if events is not None and line.startswith('{'):
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        event = None
+                    if isinstance(event, dict):
+                        events.write(line + "\n")
+                        kind = event.get('_event', '')
+                        if kind.startswith('v2_runner_on_'):
+                            status = kind[len('v2_runner_on_'):]
+                            counts[status] = counts.get(status, 0) + max(1, len(event.get('hosts') or {}))
+                        line = describe_ansible_event(event)
+                        if line is None:
+                            continue
+                logging.info(f"   [{name}] {line}")
+            returncode = await process.wait()
+        finally:
+            if log:
+                log.close()
+            if events is not None:
+                events.close()
+        details = {"results": counts} if events is not None else {}
+        self.record(name, start, time.time(), returncode, **details)
+        return returncode
+
+    def run_sync(self, name, cmd, cwd=None, env=None, log_path=None):
+        return asyncio.run(self.run(name, cmd, cwd=cwd, env=env, log_path=log_path))
+
+    def gather(self, *runs):
+        '''
+        Run the given self.run(...) coroutines concurrently and return their exit codes.
+        '''
+        async def run_all():
+            return await asyncio.gather(*runs)
+        return asyncio.run(run_all())
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({"steps": self.timeline}, f, indent=2)
+        total = sum(step["duration"] for step in self.timeline)
+        logging.info(f"⏱️  Step timeline ({len(self.timeline)} steps, {total:.1f}s of step time) written to '{path}'.")
+
+STEPS = StepRunner()
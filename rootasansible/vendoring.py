@@ -0,0 +1,276 @@
+'''
+Pinned artifacts and the incremental vendoring of the scenario into the build directory.
+'''
+import os
+import shutil
+import subprocess
+import logging
+import json
+import time
+import errno
+import fcntl
+from concurrent.futures import ThreadPoolExecutor
+import posixpath
+
+from .playbooks import file_digest
+
+# Pinned artifacts: (path, url, commit, recursive)
+ARTIFACTS = [
+    ("scenario/artifacts/RootAsRole", "https://github.com/LeChatP/RootAsRole", "5dfa43ca6e2551cd961348664a075ca47b1644e5", False),
+    ("scenario/artifacts/RootAsRole-capable", "https://github.com/LeChatP/RootAsRole-capable", "8fb13559dc9698e2f181756aa6aaa2646e2a85f3", False),
+    ("scenario/artifacts/RootAsRole-gensr", "https://github.com/LeChatP/RootAsRole-gensr", "d8e4b2a943af8b000a6086bcc108a46124357671", False),
+    ("scenario/artifacts/bpftool", "https://github.com/libbpf/bpftool", "5386cfcc1361cec24d51c634f76564e0762d2e22", True)
+]
+
+def git(*args, cwd=None, check=True):
+    result = subprocess.run(["git", *args], cwd=cwd, check=check, stdout=subprocess.PIPE,
+                            stderr=None if check else subprocess.DEVNULL, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+def git_head(path):
+    if not os.path.exists(os.path.join(path, ".git")):
+        return None
+    return git("rev-parse", "HEAD", cwd=path, check=False)
+
+def mirror_commit(url, commit, mirror_dir):
+    '''
+    Ensure commit is in the bare mirror of url inside mirror_dir and return the mirror path.
+    Only the pinned commit is fetched, under refs/pinned/<commit> to protect it from gc.
+    '''
+    name = posixpath.basename(url.rstrip('/'))
+    mirror = os.path.abspath(os.path.join(mirror_dir, name if name.endswith('.git') else name + '.git'))
+    if not os.path.isdir(mirror):
+        os.makedirs(mirror_dir, exist_ok=True)
+        git("init", "-q", "--bare", mirror)
+    if git("cat-file", "-e", f"{commit}^{{commit}}", cwd=mirror, check=False) is None:
+        logging.info(f"📥 Fetching {name} {commit[:12]} into the artifacts mirror...")
+        git("fetch", "-q", "--depth", "1", url, f"+{commit}:refs/pinned/{commit}", cwd=mirror)
+    return mirror
+
+def fetch_artifact(path, url, commit, recursive=False, mirror_dir=None):
+    '''
+    Check out the pinned commit of url in path, fetching only that commit.
+    Existing checkouts are verified rather than reset. Submodules are fetched the same way
+    at the commit recorded in the superproject if recursive.
+    Returns True if something was fetched.
+    '''
+    head = git_head(path)
+    if head == commit:
+        logging.debug(f"{path} is already at {commit}")
+        fetched = False
+    elif os.path.exists(path) and head is None and os.listdir(path):
+        logging.warning(f"⚠️  {path} exists but is not a git checkout, keeping it as is.")
+        return False
+    else:
+        if head is None:
+            git("init", "-q", path)
+            git("remote", "add", "origin", url, cwd=path)
+        if mirror_dir:
+            source, ref = mirror_commit(url, commit, mirror_dir), f"refs/pinned/{commit}"
+        else:
+            logging.info(f"📥 Fetching {os.path.basename(path)} {commit[:12]}...")
+            source, ref = url, commit
+        git("fetch", "-q", "--depth", "1", source, ref, cwd=path)
+        git("-c", "advice.detachedHead=false", "checkout", "-q", "--force", "--detach", "FETCH_HEAD", cwd=path)
+        if git_head(path) != commit:
+            raise RuntimeError(f"{path} is at {git_head(path)} instead of {commit}")
+        fetched = True
+
+    if recursive and os.path.exists(os.path.join(path, ".gitmodules")):
+        submodules = git("config", "-f", ".gitmodules", "--get-regexp", r"^submodule\..*\.path$", cwd=path, check=False) or ""
+        for line in submodules.splitlines():
+            key, sub_path = line.split(" ", 1)
+            name = key[len("submodule."):-len(".path")]
+            sub_url = git("config", "-f", ".gitmodules", f"submodule.{name}.url", cwd=path)
+            if sub_url.startswith("../") or sub_url.startswith("./"):
+                sub_url = posixpath.normpath(posixpath.join(url.rstrip('/'), sub_url)).replace(":/", "://", 1)
+            sub_commit = git("rev-parse", f"HEAD:{sub_path}", cwd=path)
+            if fetch_artifact(os.path.join(path, sub_path), sub_url, sub_commit, True, mirror_dir):
+                fetched = True
+    return fetched
+
+def fetch_artifacts(artifacts, mirror_dir=None):
+    '''
+    Fetch all the pinned artifacts concurrently.
+    '''
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, len(artifacts))) as executor:
+        futures = {
+            executor.submit(fetch_artifact, path, url, commit, recursive, mirror_dir): path
+            for path, url, commit, recursive in artifacts
+        }
+    errors = []
+    fetched = 0
+    for future, path in futures.items():
+        try:
+            fetched += bool(future.result())
+        except (subprocess.CalledProcessError, RuntimeError) as e:
+            logging.error(f"❌ Failed to fetch {path}: {e}")
+            errors.append(path)
+    if errors:
+        raise RuntimeError(f"Could not fetch artifacts: {', '.join(errors)}")
+    logging.info(f"   {fetched} artifacts fetched, {len(artifacts) - fetched} already at their pinned commit ({time.perf_counter() - start:.1f}s)")
+
+# ioctl request to share the extents of a file (copy-on-write clone), from <linux/fs.h>
+FICLONE = 0x40049409
+VENDOR_STATE = ".vendor_state.json"
+VENDOR_MODES = ('auto', 'reflink', 'hardlink', 'copy', 'full')
+
+def file_signature(st):
+    return [st.st_size, st.st_mtime_ns]
+
+def reflink_file(src, dst):
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+class TreeSync:
+    '''
+    Incremental mirror of a source directory into a build directory.
+
+    Files are compared by size and mtime, then by content hash if those differ. Unchanged
+    files are left untouched, other files are reflinked or hardlinked depending on the mode,
+    except YAML files which are always copied as they are rewritten in place by inject_uuids.
+    Files of the build directory that are not part of the source are removed, and files
+    modified in the build directory since the last save() are restored from the source.
+    '''
+
+    def __init__(self, src_dir, dst_dir, mode='auto'):
+        self.src_dir = os.path.abspath(src_dir)
+        self.dst_dir = os.path.abspath(dst_dir)
+        self.mode = mode
+        self.state_path = os.path.join(self.dst_dir, VENDOR_STATE)
+        self.state = {}
+        self.stats = {'copied': 0, 'linked': 0, 'unchanged': 0, 'removed': 0, 'bytes_copied': 0, 'bytes_linked': 0}
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r') as f:
+                    self.state = json.load(f).get("files", {})
+            except (OSError, ValueError, AttributeError) as e:
+                logging.warning(f"Ignoring vendoring state {self.state_path}: {e}")
+
+    def is_unchanged(self, rel, src, dst, src_st):
+        entry = self.state.get(rel)
+        if entry is None:
+            return False
+        try:
+            dst_st = os.lstat(dst)
+        except OSError:
+            return False
+        if 'link' in entry:
+            return os.path.islink(dst) and os.readlink(dst) == entry['link'] == os.readlink(src)
+        if file_signature(dst_st) != entry.get('dst'):
+            return False
+        if file_signature(src_st) == entry.get('src'):
+            return True
+        # Touched but maybe not modified, compare the content hash, or the untouched build file
+        # that is still a copy of the source before the hash was first recorded
+        digest = file_digest(src)
+        known = entry.get('digest')
+        if known is None and not src.endswith(('.yml', '.yaml')):
+            known = file_digest(dst)
+        if digest is not None and digest == known:
+            entry['digest'] = digest
+            entry['src'] = file_signature(src_st)
+            return True
+        entry['digest'] = digest
+        return False
+
+    def transfer(self, src, dst, size):
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        if not src.endswith(('.yml', '.yaml')):
+            if self.mode in ('auto', 'reflink'):
+                try:
+                    reflink_file(src, dst)
+                    self.stats['linked'] += 1
+                    self.stats['bytes_linked'] += size
+                    return
+                except OSError as e:
+                    if e.errno not in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY):
+                        raise
+                    if os.path.exists(dst):
+                        os.unlink(dst)
+            if self.mode in ('auto', 'hardlink'):
+                try:
+                    os.link(src, dst)
+                    self.stats['linked'] += 1
+                    self.stats['bytes_linked'] += size
+                    return
+                except OSError as e:
+                    if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                        raise
+        shutil.copy2(src, dst)
+        self.stats['copied'] += 1
+        self.stats['bytes_copied'] += size
+
+    def sync(self):
+        seen = set()
+        for root, dirs, files in os.walk(self.src_dir):
+            rel_root = os.path.relpath(root, self.src_dir)
+            dst_root = os.path.normpath(os.path.join(self.dst_dir, rel_root))
+            if os.path.islink(dst_root) or (os.path.exists(dst_root) and not os.path.isdir(dst_root)):
+                os.unlink(dst_root)
+            os.makedirs(dst_root, exist_ok=True)
+            # Symbolic links to directories are not followed by os.walk, mirror them as links
+            entries = files + [d for d in dirs if os.path.islink(os.path.join(root, d))]
+            for name in entries:
+                rel = os.path.normpath(os.path.join(rel_root, name))
+                src = os.path.join(root, name)
+                dst = os.path.join(dst_root, name)
+                seen.add(rel)
+                src_st = os.lstat(src)
+                if self.is_unchanged(rel, src, dst, src_st):
+                    self.stats['unchanged'] += 1
+                    continue
+                if os.path.islink(src):
+                    if os.path.lexists(dst):
+                        os.unlink(dst)
+                    os.symlink(os.readlink(src), dst)
+                    self.state[rel] = {'link': os.readlink(src)}
+                    continue
+                if os.path.isdir(dst):
+                    shutil.rmtree(dst)
+                self.transfer(src, dst, src_st.st_size)
+                self.state[rel] = {
+                    'src': file_signature(src_st),
+                    'digest': self.state.get(rel, {}).get('digest'),
+                }
+        self.remove_extraneous(seen)
+        return self.stats
+
+    def remove_extraneous(self, seen):
+        for root, dirs, files in os.walk(self.dst_dir, topdown=False):
+            rel_root = os.path.relpath(root, self.dst_dir)
+            for name in files + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+                rel = os.path.normpath(os.path.join(rel_root, name))
+                if rel == VENDOR_STATE or rel in seen:
+                    continue
+                os.unlink(os.path.join(root, name))
+                self.state.pop(rel, None)
+                self.stats['removed'] += 1
+            if rel_root != '.' and not os.path.isdir(os.path.join(self.src_dir, rel_root)):
+                os.rmdir(root)
+        for rel in [rel for rel in self.state if rel not in seen]:
+            del self.state[rel]
+
+    def save(self):
+        '''
+        Record the current signature of the build files, so that later changes are detected.
+        Must be called once the build files have been rewritten.
+        '''
+        for rel, entry in self.state.items():
+            if 'link' in entry:
+                continue
+            try:
+                entry['dst'] = file_signature(os.lstat(os.path.join(self.dst_dir, rel)))
+            except OSError:
+                entry['dst'] = None
+        with open(self.state_path, 'w') as f:
+            json.dump({"version": 1, "files": self.state}, f)
+
+def format_size(size):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
@@ -8,6 +8,7 @@ DOCUMENTATION = """
     description:
         - This become plugin run repeatitively commands to detect all rights needed to execute a command
         - This might not work with all commands, please check that your command is repeatable and idempotent
+        - It does not support pipelining, as the repeated runs of the command could not read the module from stdin again.
     author: Eddie Billoir
     version_added: "2.8"
     options:
@@ -61,6 +62,55 @@ DOCUMENTATION = """
             required: False
             default: "/tmp/capable_output.json"
             type: str
+        rootasrole_policy_shards_dir:
+            description:
+                - Directory where each task writes its own policy fragment, named after its -t identifier, instead of the shared output file.
+                - The fragments are merged on the controller, so that tasks do not contend on a single growing policy file.
+            required: False
+            default: ''
+            type: str
+            vars:
+              - name: ansible_capable_shards_dir
+            env:
+              - name: ANSIBLE_CAPABLE_SHARDS_DIR
+        rootasrole_discovery_cache_dir:
+            description:
+                - Controller directory of the discovery cache. Tasks whose content hash (module, resolved args, become flags and host) has a cached policy fragment are run without tracing.
+                - Only used together with rootasrole_policy_shards_dir, as the cached fragments replace the per-task shards.
+            required: False
+            default: ''
+            type: str
+            vars:
+              - name: ansible_capable_cache_dir
+            env:
+              - name: ANSIBLE_CAPABLE_CACHE_DIR
+        rootasrole_trace_shard:
+            description:
+                - Trace only the tasks of shard I out of N, given as "I/N", and run the other tasks with untraced_become_exe.
+                - Tasks are assigned to a shard by their -t identifier, so that sandboxes discovering the policy concurrently trace disjoint tasks.
+            required: False
+            default: ''
+            type: str
+            vars:
+              - name: ansible_capable_trace_shard
+            env:
+              - name: ANSIBLE_CAPABLE_TRACE_SHARD
+        untraced_become_exe:
+            description: Command used to run the tasks whose policy fragment is cached or which are traced by another shard, without tracing them
+            required: False
+            default: "sudo -n"
+            type: str
+            vars:
+              - name: ansible_capable_untraced_exe
+            env:
+              - name: ANSIBLE_CAPABLE_UNTRACED_EXE
+        inventory_hostname:
+            description: Host of the task, part of its content hash
+            required: False
+            default: ''
+            type: str
+            vars:
+              - name: inventory_hostname
         gensr_exe:
             description: The executable to run to detect rights
             required: False
@@ -68,17 +118,25 @@ DOCUMENTATION = """
             type: str
 """
 
+import hashlib
+import json
 import os
+import re
 
 from ansible.plugins.become import BecomeBase
 from ansible.context import CLIARGS
 
 DOSR_EXE = '/usr/bin/dosr'
+TASK_FLAG = re.compile(r'(?:^|\s)-t\s+(\S+)')
 
 class BecomeModule(BecomeBase):
 
     name = 'gensr'
 
+    # gensr re-runs the command to converge, only the first run could read a module sent over stdin.
+    # Only a hint: older ansible-core releases ignore it, the discovery runs set ANSIBLE_PIPELINING=False
+    pipelining = False
+
     # messages for detecting prompted password issues
     fail = ('Permission denied')
     missing = ('Permission denied')
@@ -87,6 +145,8 @@ class BecomeModule(BecomeBase):
         super(BecomeModule, self).__init__()
         self.playbook_name = os.path.realpath(CLIARGS.get('args', None)[0])
         self.task_name = None
+        self.task_action = None
+        self.task_args = None
         self.rootasrole_policy_output = None
 
     def set_options(self, task_keys=None, var_options=None, direct=None):
@@ -94,6 +154,9 @@ class BecomeModule(BecomeBase):
         # Retrieve the task name from the task keys
         if task_keys and 'name' in task_keys:
             self.task_name = task_keys['name']
+        if task_keys:
+            self.task_action = task_keys.get('action')
+            self.task_args = task_keys.get('args')
         self.rootasrole_policy_output = self.get_option('rootasrole_policy_output')
 
     def build_become_command(self, cmd, shell):
@@ -105,11 +168,67 @@ class BecomeModule(BecomeBase):
             return cmd
 
         becomecmd = '/usr/bin/dosr -r rar_ansible -t generate_rar'
+        prologue = ''
+        output = self.get_option('rootasrole_policy_output') or self.rootasrole_policy_output or '/tmp/capable_output.json'
+
+        shards_dir = self.get_option('rootasrole_policy_shards_dir')
+        if not self._in_trace_shard() or (shards_dir and self._cached_fragment()):
+            return ' '.join([self.get_option('untraced_become_exe'), self._build_success_command(cmd, shell)])
+        if shards_dir:
+            output = '{}/{}.json'.format(shards_dir.rstrip('/'), self._shard_name())
+            prologue = 'mkdir -p "{}" && '.format(shards_dir)
 
         gensr_cmd = '{} generate {} -p "{}" -c "{}"'.format(
             self.get_option("become_exe"), 
             self.get_option('become_flags') or '', 
             self.task_name,
-            self.get_option('rootasrole_policy_output') or self.rootasrole_policy_output or '/tmp/capable_output.json' )
+            output )
         
-        return ' '.join([ becomecmd, gensr_cmd, "--", self._build_success_command(cmd, shell)])
+        return prologue + ' '.join([ becomecmd, gensr_cmd, "--", self._build_success_command(cmd, shell)])
+
+    def _shard_name(self):
+        '''
+        Name of the policy fragment of the task: its -t identifier, or a hash of its name if it has none.
+        '''
+        match = TASK_FLAG.search(self.get_option('become_flags') or '')
+        if match:
+            return match.group(1)
+        return hashlib.sha1((self.task_name or '').encode()).hexdigest()
+
+    def _in_trace_shard(self):
+        '''
+        Whether the task belongs to the shard of the tasks this run traces.
+        '''
+        shard = self.get_option('rootasrole_trace_shard')
+        if not shard:
+            return True
+        index, count = (int(n) for n in shard.split('/'))
+        return int(hashlib.sha1(self._shard_name().encode()).hexdigest(), 16) % count == index
+
+    def _content_hash(self):
+        '''
+        Hash of what determines the rights needed by the task: its module, resolved args, become flags and host.
+        '''
+        content = json.dumps([self.task_action, self.task_args, self.get_option('become_flags') or '',
+                              self.get_option('inventory_hostname')], sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def _cached_fragment(self):
+        '''
+        Look the task up in the discovery cache and record the lookup in the cache journal,
+        so that the controller can store the traced fragment or reuse the cached one.
+        Return True if the cached fragment is reused.
+        '''
+        cache_dir = self.get_option('rootasrole_discovery_cache_dir')
+        match = TASK_FLAG.search(self.get_option('become_flags') or '')
+        if not cache_dir or not match or self.task_action is None:
+            return False
+        content_hash = self._content_hash()
+        hit = os.path.exists(os.path.join(cache_dir, 'fragments', content_hash + '.json'))
+        entry = json.dumps({"task": match.group(1), "host": self.get_option('inventory_hostname'),
+                            "hash": content_hash, "hit": hit})
+        os.makedirs(cache_dir, exist_ok=True)
+        # single appends are atomic, the workers of the forks share the journal
+        with open(os.path.join(cache_dir, 'journal.jsonl'), 'a') as f:
+            f.write(entry + '\n')
+        return hit
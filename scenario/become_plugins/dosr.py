@@ -7,6 +7,9 @@ DOCUMENTATION = """
     short_description: Substitute Role
     description:
         - This become plugin allows your remote/login user to execute commands using configured roles.
+        - It supports pipelining, the module is then read by the interpreter from stdin and no temporary directory has to be chowned.
+          Pipelined modules of tasks without become_flags run as the rar_ansible/ansible_python reserved task. The capable callback
+          assigns the flags of every become task that has a playbook file, so this is left to implicit tasks such as fact gathering.
     author: Eddie Billoir
     version_added: "2.8"
     options:
@@ -73,18 +76,66 @@ DOCUMENTATION = """
             ini:
               - section: dosr_become_plugin
                 key: password
+        legacy_chown:
+            description:
+                - Resolve the target user and chown the Ansible temporary directories with separate dosr calls for each directory, as in previous versions.
+                - By default the target user id is resolved once per host and role/task flags, cached on the remote host until the policy changes,
+                  and a single chown prologue and epilogue is emitted for all the temporary directories.
+            default: False
+            type: bool
+            ini:
+              - section: dosr_become_plugin
+                key: legacy_chown
+            vars:
+              - name: ansible_dosr_legacy_chown
+            env:
+              - name: ANSIBLE_DOSR_LEGACY_CHOWN
 """
 
+import hashlib
 import re
-import shlex
 
 from ansible.plugins.become import BecomeBase
 
+DOSR_EXE = '/usr/bin/dosr'
+CHOWN_CMD = DOSR_EXE + ' -r rar_ansible -t ansible_chown /usr/bin/chown -R'
+POLICY_PATH = '/etc/security/rootasrole.json'
+
+PIPELINED_FLAGS = '-r rar_ansible -t ansible_python'
+# Interpreter reading a pipelined module from stdin
+PIPELINED_INTERPRETER = re.compile(r'^/usr/bin/python3(?:\.\d+)?(?: && sleep 0)?$')
+
+TMPDIR_MARKER = 'ansible-tmp-'
+# Remainder of an ansible-tmp-<timestamp>-<id>/ path component
+TMPDIR_TAIL = re.compile(r'''ansible-tmp-[^\s'"/]+/''')
+TOKEN_DELIMITERS = (' ', '\t', '\n', "'", '"')
+
+
+def find_tmpdirs(cmd):
+    '''
+    Return the unique ansible-tmp-* directories referenced in cmd, in order of appearance.
+    The command is scanned once, looking for the ansible-tmp- marker and expanding
+    each occurrence to the absolute path it belongs to.
+    '''
+    tmpdirs = {}
+    i = cmd.find(TMPDIR_MARKER)
+    while i != -1:
+        match = TMPDIR_TAIL.match(cmd, i)
+        if match and i > 0 and cmd[i - 1] == '/':
+            token_start = max(cmd.rfind(d, 0, i) for d in TOKEN_DELIMITERS) + 1
+            start = cmd.find('/', token_start, i)
+            tmpdirs[cmd[start:match.end()]] = None
+            i = match.end()
+        i = cmd.find(TMPDIR_MARKER, i + 1)
+    return list(tmpdirs)
 
 class BecomeModule(BecomeBase):
 
     name = 'dosr'
 
+    # modules can be sent over stdin, see build_become_command
+    pipelining = True
+
     # messages for detecting prompted password issues
     fail = ('Permission denied')
     missing = ('Permission denied')
@@ -106,11 +157,34 @@ class BecomeModule(BecomeBase):
         chown_user_cmd = ''
         end_chown = ''
         flags = self.get_option('become_flags') or ''
+        # dosr would choose the reserved task anyway, its command regex ranks above the tasks allowing all commands
+        if not flags and PIPELINED_INTERPRETER.match(cmd):
+            flags = PIPELINED_FLAGS
         ## check if executed files in tmp/ansible-tmp-<timestamp>-<id> directory are owned by the become_user
-        for arg in shlex.split(cmd):
-          for r in re.findall(r'\/.*ansible-tmp-.*\/', arg):
-              chown_user_cmd += '/usr/bin/dosr -r rar_ansible -t ansible_chown /usr/bin/chown -R "`{cmd} {flag} id -u`":"`{cmd} {flag} id -u`" "{f}"; '.format(cmd=becomecmd,flag=flags,f=r)
-              end_chown += '; /usr/bin/dosr -r rar_ansible -t ansible_chown /usr/bin/chown -R "`id -u`":"`id -u`" "{}" '.format(r)
-        
+        # none when pipelining
+        tmpdirs = find_tmpdirs(cmd)
+
+        if self.get_option('legacy_chown'):
+            for r in tmpdirs:
+                chown_user_cmd += '{chown} "`{cmd} {flag} id -u`":"`{cmd} {flag} id -u`" "{f}"; '.format(chown=CHOWN_CMD,cmd=becomecmd,flag=flags,f=r)
+                end_chown += '; {} "`id -u`":"`id -u`" "{}" '.format(CHOWN_CMD, r)
+        elif tmpdirs:
+            dirs = ' '.join('"{}"'.format(r) for r in tmpdirs)
+            chown_user_cmd = self._build_uid_lookup(becomecmd, flags) + '{} "$u":"$u" {}; '.format(CHOWN_CMD, dirs)
+            # keep the exit code of the module, not the one of the chown back
+            end_chown = '; rc=$?; {} "$(id -u)":"$(id -u)" {}; exit $rc'.format(CHOWN_CMD, dirs)
+
         return ' '.join([chown_user_cmd, becomecmd, flags, self._build_success_command(cmd, shell), end_chown])
 
+    def _build_uid_lookup(self, becomecmd, flags):
+        '''
+        Shell snippet setting $u to the user id the role/task of flags runs as.
+        It is resolved with a single dosr call and cached on the remote host in a file
+        owned by the remote user, until the policy is modified.
+        '''
+        key = hashlib.sha1('{} {}'.format(becomecmd, flags).encode()).hexdigest()[:16]
+        return ('c="${{TMPDIR:-/tmp}}/.dosr-uid-$(id -u)-{key}"; '
+                'if [ -O "$c" ] && [ "$c" -nt {policy} ]; then u=$(cat "$c"); '
+                'else u=$({cmd} {flag} id -u) && [ -n "$u" ] && echo "$u" > "$c"; fi; ').format(
+                    key=key, policy=POLICY_PATH, cmd=becomecmd, flag=flags)
+
@@ -9,34 +9,144 @@ short_description: Add information to environment variables
 version_added: "2.0"  # for collections, use the collection version, not the Ansible version
 description:
     - This callback just add the playbook and task name to the environment variables
+    - It also profiles the wall time of each task on each host, to tell the capable tracing overhead apart from the module runtime
+options:
+  profile_output:
+    description:
+      - JSONL file where the profile of each run is appended, one record per task and host plus a summary record.
+      - Records are joined with the generated policy by their task identifier, the -t value of the become flags.
+      - The tasks that were not traced (other become methods, discovery cache hits) are the baseline of the traced ones.
+      - The last baseline of each task and host is kept in an index next to it, <profile_output>.baselines.json, so that the history is not read again.
+        The index is loaded once when the playbook starts and written back with the profile.
+    default: ''
+    type: path
+    env:
+      - name: ANSIBLE_CAPABLE_PROFILE
+    ini:
+      - section: callback_capable
+        key: profile_output
+  task_context_log:
+    description:
+      - Append-only JSONL log of the task context, one record per task and host with its identifier. Disabled if empty.
+      - Concurrent playbooks can share it, records are written in batches of whole lines on an O_APPEND descriptor.
+      - It is never rotated, point it to a file that is removed between runs.
+    default: ''
+    type: path
+    env:
+      - name: ANSIBLE_CAPABLE_TASK_CONTEXT
+    ini:
+      - section: callback_capable
+        key: task_context_log
+  assign_identifiers:
+    description:
+      - Assign the -r and -t become flags in memory to the become tasks parsed by the Ansible loader that have no -t flag, e.g. all of them when the flags are not injected in the playbook files, or the tasks imported from templated paths that the injection cannot resolve.
+      - The -t identifier is derived from the file, line and content of the task, so that every run of the same playbooks agrees on it, including for dynamically included tasks.
+      - Without it, the pipelined modules of the untagged tasks run as the rar_ansible/ansible_python reserved task of dosr, without any capability.
+    default: true
+    type: bool
+    env:
+      - name: ANSIBLE_CAPABLE_ASSIGN_IDS
+    ini:
+      - section: callback_capable
+        key: assign_identifiers
+  task_aliases:
+    description: JSON file mapping assigned identifiers to the identifiers of the equivalent tasks they were merged into in the reviewed policy
+    default: ''
+    type: path
+    env:
+      - name: ANSIBLE_CAPABLE_TASK_ALIASES
+    ini:
+      - section: callback_capable
+        key: task_aliases
+  profile_top:
+    description: Number of tasks with the highest tracing overhead shown in the summary
+    default: 20
+    type: int
+    env:
+      - name: ANSIBLE_CAPABLE_PROFILE_TOP
+    ini:
+      - section: callback_capable
+        key: profile_top
 '''
 import os
+import re
+import atexit
+import fcntl
+import json
+import time
+import uuid
 from ansible.plugins.callback import CallbackBase
-from ansible.playbook.play import Play
-import yaml
-
-FILES = set()
-CAPABLE_TASKS = {}
-
-class ElementIdentifier:
-    def __init__(self, name=None, ):
-        pass
-    
-def serialize_play(play : Play):
-    data = super(Play, play).serialize()
-
-    roles = []
-    for role in play.get_roles():
-        try:
-            roles.append(role.serialize())
-        except AttributeError:
-            pass
-    data['roles'] = roles
-    data['included_path'] = play._included_path
-    data['action_groups'] = play._action_groups
-    data['group_actions'] = play._group_actions
-
-    return data
+
+TASK_FLAG = re.compile(r'(?:^|\s)-t\s+(\S+)')
+TASK_NAME_ID = re.compile(r'\[id:([a-f0-9\-]+)\]')
+TRACED_BECOME_METHOD = 'capable'
+IDENTIFIER_NAMESPACE = uuid.UUID('6f6e1b7e-4a52-4f3e-9d1c-726f6f746173')
+
+def task_identifier(task):
+    '''
+    Identifier of the task in the generated policy: its -t become flag, or the [id:...] tag of its name.
+    '''
+    match = TASK_FLAG.search(task.become_flags or '')
+    if match:
+        return match.group(1)
+    match = TASK_NAME_ID.search(task.name or '')
+    return match.group(1) if match else None
+
+def assign_identifier(task, aliases=None):
+    '''
+    Add -r <file> -t <identifier> to the become_flags of the task in memory, as inject_uuids
+    does in the playbook files. The file is relative to the working directory and the identifier
+    is derived from the file, line and content of the task.
+    '''
+    if not task.become or TASK_FLAG.search(task.become_flags or ''):
+        return
+    ds = task._ds if isinstance(task._ds, dict) else {}
+    if ds.get('become_method'):
+        return
+    path = task.get_path()
+    if not path:
+        return
+    file_name, _, line = path.rpartition(':')
+    relpath = os.path.relpath(file_name)
+    content = json.dumps({k: v for k, v in ds.items() if k != 'become_flags'}, sort_keys=True, default=str)
+    task_id = str(uuid.uuid5(IDENTIFIER_NAMESPACE, "\0".join((relpath, line, content))))
+    task_id = (aliases or {}).get(task_id, task_id)
+    task.become_flags = ("%s -r %s -t %s" % (task.become_flags or '', relpath, task_id)).strip()
+
+class TaskContextLog:
+    '''
+    Append-only log of the task context. Records are buffered and written as whole lines with a
+    single write on an O_APPEND descriptor, so that concurrent writers never lose or tear a record.
+    '''
+    def __init__(self, path, batch_size=512):
+        self.path = path
+        self.batch_size = batch_size
+        self.fd = None
+        self.batch = []
+
+    def append(self, line):
+        '''
+        Append a JSON record, already serialized and terminated by a newline.
+        '''
+        self.batch.append(line)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        data = "".join(self.batch).encode()
+        self.batch = []
+        while data:
+            data = data[os.write(self.fd, data):]
+
+    def close(self):
+        self.flush()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
 
 class CallbackModule(CallbackBase):
     """
@@ -49,39 +159,248 @@ class CallbackModule(CallbackBase):
 
     def __init__(self):
         super(CallbackModule, self).__init__()
+        self.run_id = str(uuid.uuid4())
+        self._task_starts = {}
+        self._task_ids = {}
+        self._profile = []
+        self._context_log = None
+        self._quoted = {}
+        self._assign_ids = True
+        self._aliases = {}
+        # (task, host) -> seconds of the last untraced run, loaded by _load_baselines
+        self._baselines = None
+        # keep the buffered records of aborted runs
+        atexit.register(self._close_context_log)
+
+    def set_options(self, task_keys=None, var_options=None, direct=None):
+        super(CallbackModule, self).set_options(task_keys=task_keys, var_options=var_options, direct=direct)
+        path = self.get_option('task_context_log')
+        if self._context_log is None or self._context_log.path != path:
+            self._close_context_log()
+            self._context_log = TaskContextLog(path) if path else None
+        self._assign_ids = self.get_option('assign_identifiers')
+        aliases_path = self.get_option('task_aliases')
+        if self._assign_ids and aliases_path and os.path.exists(aliases_path):
+            with open(aliases_path) as f:
+                self._aliases = json.load(f)
+
+    def v2_runner_on_start(self, host, task):
+        host_name = host.get_name()
+        if task._uuid in self._task_ids:
+            task_id = self._task_ids[task._uuid]
+        else:
+            # handlers and tasks of dynamic includes may not go through v2_playbook_on_task_start
+            task_id = self._resolve_identifier(task)
+        start = self._task_starts[(host_name, task._uuid)] = (task_id, time.time(), time.monotonic())
+        if self._context_log is not None:
+            self._context_log.append('{"run": %s, "host": %s, "task": %s, "start": %.3f}\n'
+                                     % (self._json(self.run_id), self._json(host_name), self._json(task_id), start[1]))
+
+    def _resolve_identifier(self, task):
+        # the workers are forked after the task callbacks, the flags assigned here reach the become plugins
+        if self._assign_ids:
+            assign_identifier(task, self._aliases)
+        task_id = self._task_ids[task._uuid] = task_identifier(task)
+        return task_id
+
+    def _close_context_log(self):
+        if self._context_log is not None:
+            self._context_log.close()
+
+    def _json(self, value):
+        # hosts and tasks recur, serialize them once for the task context log
+        quoted = self._quoted.get(value)
+        if quoted is None:
+            quoted = self._quoted[value] = json.dumps(value)
+        return quoted
+
+    def v2_runner_on_ok(self, result):
+        self._record_task(result, 'ok')
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._record_task(result, 'failed')
+
+    def v2_runner_on_unreachable(self, result):
+        self._record_task(result, 'unreachable')
+
+    def v2_runner_on_skipped(self, result):
+        self._record_task(result, 'skipped')
+
+    def _record_task(self, result, status):
+        # the items of a loop are reported before the result of the whole task, which ends it
+        host = result._host.get_name()
+        task = result._task
+        start = self._task_starts.pop((host, task._uuid), None)
+        if start is None:
+            return
+        task_id, start = start[0], start[1:]
+        self._profile.append({
+            "type": "task",
+            "run": self.run_id,
+            "task": task_id,
+            "name": task.get_name(),
+            "host": host,
+            "action": task.action,
+            "become_method": task.become_method if task.become else None,
+            "status": status,
+            "start": round(start[0], 3),
+            "seconds": round(time.monotonic() - start[1], 6),
+        })
+
+    def _cached_tasks(self):
+        '''
+        Tasks run without tracing because their policy fragment was in the discovery cache.
+        '''
+        cache_dir = os.environ.get('ANSIBLE_CAPABLE_CACHE_DIR')
+        cached = set()
+        if cache_dir and os.path.exists(os.path.join(cache_dir, "journal.jsonl")):
+            with open(os.path.join(cache_dir, "journal.jsonl")) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry['hit']:
+                        cached.add((entry['task'], entry['host']))
+        return cached
+
+    @staticmethod
+    def _decode_baselines(content):
+        return {tuple(key.split('\0', 1)): seconds for key, seconds in json.loads(content).items()}
+
+    def _load_baselines(self):
+        '''
+        Load the baselines index of profile_output in memory, the last untraced run of each task on
+        each host. The index is built from the profile history the first time, then only it is read.
+        '''
+        self._baselines = {}
+        profile_output = self.get_option('profile_output')
+        if not profile_output:
+            return
+        if os.path.exists(profile_output + '.baselines.json'):
+            with open(profile_output + '.baselines.json') as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                content = f.read()
+            if content:
+                self._baselines = self._decode_baselines(content)
+                return
+        if os.path.exists(profile_output):
+            with open(profile_output) as history:
+                for line in history:
+                    record = json.loads(line)
+                    if record.get('type') == 'task' and not record['traced'] and record['status'] == 'ok':
+                        self._baselines[(record['task'], record['host'])] = record['seconds']
+
+    def _save_baselines(self, profile_output, untraced):
+        '''
+        Add the untraced run times of this run to the baselines in memory and write them back to the index.
+        '''
+        self._baselines.update(untraced)
+        with open(profile_output + '.baselines.json', 'a+') as f:
+            # concurrent playbooks may share the profile, keep the baselines they wrote since the index was loaded
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            content = f.read()
+            if content:
+                baselines = self._decode_baselines(content)
+                baselines.update(untraced)
+            else:
+                baselines = self._baselines
+            f.seek(0)
+            f.truncate()
+            json.dump({'\0'.join(key): seconds for key, seconds in baselines.items() if key[0]}, f)
+
+    def _write_profile(self):
+        '''
+        Append the task records of the run and a summary comparing each traced task
+        to the last untraced run of the same task on the same host.
+        '''
+        profile_output = self.get_option('profile_output')
+        if not profile_output or not self._profile:
+            return
+
+        cached = self._cached_tasks()
+        untraced = {}
+        for record in self._profile:
+            record['traced'] = (record['become_method'] == TRACED_BECOME_METHOD and record['status'] != 'skipped'
+                                and (record['task'], record['host']) not in cached)
+            if not record['traced'] and record['status'] == 'ok' and record['task']:
+                untraced[(record['task'], record['host'])] = record['seconds']
+        os.makedirs(os.path.dirname(profile_output) or '.', exist_ok=True)
+        if self._baselines is None:
+            self._load_baselines()
+        self._save_baselines(profile_output, untraced)
+        baselines = self._baselines
+
+        tasks = []
+        for record in self._profile:
+            if not record['traced']:
+                continue
+            baseline = baselines.get((record['task'], record['host'])) if record['task'] else None
+            tasks.append({
+                "task": record['task'],
+                "name": record['name'],
+                "host": record['host'],
+                "seconds": record['seconds'],
+                "baseline_seconds": baseline,
+                "overhead_seconds": round(record['seconds'] - baseline, 6) if baseline is not None else None,
+                "ratio": round(record['seconds'] / baseline, 2) if baseline else None,
+            })
+        tasks.sort(key=lambda t: (t['overhead_seconds'] is None, -(t['overhead_seconds'] or 0), -t['seconds']))
+        compared = [t for t in tasks if t['baseline_seconds']]
+        traced_seconds = sum(t['seconds'] for t in compared)
+        baseline_seconds = sum(t['baseline_seconds'] for t in compared)
+        summary = {
+            "type": "summary",
+            "run": self.run_id,
+            "start": self._profile[0]['start'],
+            "tasks": len(self._profile),
+            "traced": len(tasks),
+            "compared": len(compared),
+            "seconds": round(sum(r['seconds'] for r in self._profile), 6),
+            "traced_seconds": round(traced_seconds, 6),
+            "baseline_seconds": round(baseline_seconds, 6),
+            "ratio": round(traced_seconds / baseline_seconds, 2) if baseline_seconds else None,
+            "slowest": tasks[:self.get_option('profile_top')],
+        }
+
+        # a single append, concurrent playbooks may share the profile
+        with open(profile_output, 'a') as f:
+            f.write("".join(json.dumps(record) + "\n" for record in self._profile + [summary]))
+
+        self._display.display("CAPABLE PROFILE: %d tasks traced, %d with a baseline, tracing ratio %s (%s)"
+                              % (len(tasks), len(compared), summary['ratio'], profile_output))
+        for t in summary['slowest']:
+            self._display.display("  %-36s %-12s %8.2fs  baseline %s  ratio %s"
+                                  % (t['task'], t['host'], t['seconds'],
+                                     "%.2fs" % t['baseline_seconds'] if t['baseline_seconds'] is not None else "-",
+                                     t['ratio'] if t['ratio'] is not None else "-"))
         
     def v2_playbook_on_task_start(self, task, is_conditional):
-        # Extract UUID from task name if present
-        if task.name:
-            import re
-            match = re.search(r'\[id:([a-f0-9\-]+)\]', task.name)
-            if match:
-                uuid = match.group(1)
-                # Share data via environment variable (limited scope)
-                os.environ['ANSIBLE_CAPABLE_TASK_UUID'] = uuid
-                # Share data via temporary file (more reliable across processes)
-                with open("/tmp/ansible_capable_current_uuid", "w") as f:
-                    f.write(uuid)
+        # Resolve the task identifier once for all the hosts running the task
+        self._resolve_identifier(task)
         
         return super().v2_playbook_on_task_start(task, is_conditional)
-    
-    
-    
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self._resolve_identifier(task)
+
     def v2_playbook_on_start(self, playbook):
-        global FILES
-        global CAPABLE_TASKS
-        print("PLAYBOOK STARTED")
-        #entries = [ serialize_play(entry) for entry in playbook._entries if isinstance(entry, Play) ]
-        #with open("playbook_copied.yml", "w") as f:
-        #    f.write(yaml.dump(entries))
-            
-            
-        FILES.update(playbook._loader._FILE_CACHE)
-    
+        # the baselines are looked up in memory, the index is read once per run
+        self._load_baselines()
+
     def v2_playbook_on_stats(self, stats):
+        # Report which tasks were traced and which reused their cached policy fragment
+        cache_dir = os.environ.get('ANSIBLE_CAPABLE_CACHE_DIR')
+        if cache_dir and os.path.exists(os.path.join(cache_dir, "journal.jsonl")):
+            traced, cached = set(), set()
+            with open(os.path.join(cache_dir, "journal.jsonl")) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    (cached if entry['hit'] else traced).add((entry['host'], entry['task']))
+            self._display.display("CAPABLE DISCOVERY CACHE: %d tasks traced, %d tasks reused from cache"
+                                  % (len(traced), len(cached - traced)))
+
+        self._write_profile()
+        # tasks interrupted without a result, e.g. by a host failure of a linear strategy
+        self._task_starts.clear()
+        self._close_context_log()
         
-        
-            
-            
-        
-        return super().v2_playbook_on_stats(stats)
\ No newline at end of file
+        return super().v2_playbook_on_stats(stats)
@@ -0,0 +1,22 @@
+import os
+import sys
+import importlib.util
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SCENARIO_DIR = os.path.join(ROOT, 'scenario')
+sys.path.insert(0, ROOT)
+
+@pytest.fixture
+def load_plugin():
+    '''
+    Load a plugin of the scenario, e.g. load_plugin('become', 'dosr'). Requires ansible.
+    '''
+    pytest.importorskip("ansible")
+    def load(kind, name):
+        spec = importlib.util.spec_from_file_location(f"{kind}_{name}", os.path.join(SCENARIO_DIR, f"{kind}_plugins", f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    return load
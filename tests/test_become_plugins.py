@@ -0,0 +1,76 @@
+import os
+
+PIPELINED_COMMAND = "/usr/bin/python3 && sleep 0"
+
+class Task:
+    def __init__(self, path, ds, become_flags=None):
+        self._uuid = "task"
+        self._ds = ds
+        self._path = path
+        self.name = ds.get('name')
+        self.become = True
+        self.become_flags = become_flags
+
+    def get_path(self):
+        return self._path
+
+def dosr_command(load_plugin, flags):
+    plugin = load_plugin('become', 'dosr').BecomeModule()
+    plugin.set_options(direct={'become_exe': 'dosr', 'become_flags': flags, 'legacy_chown': False})
+    return plugin.build_become_command(PIPELINED_COMMAND, None)
+
+def test_dosr_untagged_pipelined_module_runs_as_reserved_task(load_plugin):
+    assert " -r rar_ansible -t ansible_python " in dosr_command(load_plugin, '')
+
+def test_dosr_tagged_pipelined_module_keeps_its_task(load_plugin):
+    command = dosr_command(load_plugin, '-r playbooks/scenario.yml -t abc')
+    assert "ansible_python" not in command
+    assert " -r playbooks/scenario.yml -t abc " in command
+
+def test_templated_import_task_is_tagged_by_the_callback(load_plugin):
+    # tasks imported from "{{ tasks_dir }}/deploy-website.yml" have no injected flags
+    callback = load_plugin('callback', 'capable')
+    path = os.path.abspath(os.path.join("tasks", "deploy-website.yml"))
+    ds = {'name': 'Deploy the website', 'become': True, 'ansible.builtin.template': {'src': 'index.html.j2'}}
+    task = Task(f"{path}:3", ds)
+    callback.assign_identifier(task)
+    assert task.become_flags.startswith(f"-r {os.path.join('tasks', 'deploy-website.yml')} -t ")
+    command = dosr_command(load_plugin, task.become_flags)
+    assert "ansible_python" not in command
+
+    # every run agrees on the identifier, and the aliases of the compacted policy apply
+    again = Task(f"{path}:3", dict(ds))
+    callback.assign_identifier(again)
+    assert again.become_flags == task.become_flags
+    task_id = callback.task_identifier(task)
+    aliased = Task(f"{path}:3", dict(ds))
+    callback.assign_identifier(aliased, {task_id: "merged"})
+    assert callback.task_identifier(aliased) == "merged"
+
+def test_callback_keeps_injected_flags(load_plugin):
+    callback = load_plugin('callback', 'capable')
+    task = Task("/build/playbooks/scenario.yml:12", {'name': 'Install nginx', 'become': True}, "-r playbooks/scenario.yml -t abc")
+    callback.assign_identifier(task)
+    assert task.become_flags == "-r playbooks/scenario.yml -t abc"
+
+def test_callback_assigns_identifiers_by_default(load_plugin):
+    callback = load_plugin('callback', 'capable').CallbackModule()
+    assert callback._assign_ids
+
+def test_dosr_finds_the_ansible_tmp_directories(load_plugin):
+    find_tmpdirs = load_plugin('become', 'dosr').find_tmpdirs
+    tmp = "/tmp/ansible-tmp-1700000000.0-1234-567/"
+    other = "/home/ansible/.ansible/tmp/ansible-tmp-1700000001.5-99-1/"
+    cmd = (f"/bin/sh -c 'chmod u+x {tmp} {tmp}AnsiballZ_apt.py && /usr/bin/python3 {tmp}AnsiballZ_apt.py "
+           f"&& cat \"{other}args\" && rm -f -r {tmp} > /dev/null 2>&1 && sleep 0'")
+    assert find_tmpdirs(cmd) == [tmp, other]
+    assert find_tmpdirs(PIPELINED_COMMAND) == []
+    # not a directory component of an absolute path
+    assert find_tmpdirs("echo ansible-tmp-1/ x/ansible-tmp-2 /tmp/my-ansible-tmp-3/") == []
+
+def test_dosr_chowns_the_tmp_directories_to_the_become_user(load_plugin):
+    plugin = load_plugin('become', 'dosr').BecomeModule()
+    plugin.set_options(direct={'become_exe': 'dosr', 'become_flags': '-r p.yml -t abc', 'legacy_chown': False})
+    command = plugin.build_become_command("/usr/bin/python3 /tmp/ansible-tmp-1-2/AnsiballZ_apt.py && sleep 0", None)
+    assert command.count('"/tmp/ansible-tmp-1-2/"') == 2
+    assert command.rstrip().endswith("exit $rc")
@@ -0,0 +1,87 @@
+import os
+import json
+
+class Host:
+    def __init__(self, name):
+        self.name = name
+
+    def get_name(self):
+        return self.name
+
+class Task:
+    def __init__(self, task_id, become_method):
+        self._uuid = task_id
+        self._ds = {}
+        self.name = f"Task {task_id}"
+        self.action = "ansible.builtin.command"
+        self.become = True
+        self.become_method = become_method
+        self.become_flags = f"-r playbooks/scenario.yml -t {task_id}"
+
+    def get_name(self):
+        return self.name
+
+class Result:
+    def __init__(self, host, task):
+        self._host = host
+        self._task = task
+
+def run_playbook(module, profile_output, tasks, host="sandbox", before_tasks=None):
+    callback = module.CallbackModule()
+    callback.set_options(direct={'profile_output': profile_output, 'task_context_log': '', 'assign_identifiers': True,
+                                 'task_aliases': '', 'profile_top': 20})
+    callback.v2_playbook_on_start(None)
+    if before_tasks:
+        before_tasks()
+    for task in tasks:
+        callback.v2_playbook_on_task_start(task, False)
+        callback.v2_runner_on_start(Host(host), task)
+        callback.v2_runner_on_ok(Result(Host(host), task))
+    callback.v2_playbook_on_stats(None)
+
+def read_records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_traced_tasks_are_compared_to_the_last_untraced_run(load_plugin, tmp_path):
+    module = load_plugin('callback', 'capable')
+    profile_output = str(tmp_path / "profile.jsonl")
+    run_playbook(module, profile_output, [Task("a", "dosr"), Task("b", "dosr")])
+    with open(profile_output + '.baselines.json') as f:
+        assert set(json.load(f)) == {"a\0sandbox", "b\0sandbox"}
+
+    run_playbook(module, profile_output, [Task("a", "capable"), Task("c", "capable")])
+    summary = read_records(profile_output)[-1]
+    assert summary['type'] == "summary"
+    assert summary['traced'] == 2 and summary['compared'] == 1
+    baselines = {t['task']: t['baseline_seconds'] for t in summary['slowest']}
+    assert baselines['a'] is not None and baselines['c'] is None
+
+def test_baselines_are_loaded_once_per_run(load_plugin, tmp_path):
+    module = load_plugin('callback', 'capable')
+    profile_output = str(tmp_path / "profile.jsonl")
+    run_playbook(module, profile_output, [Task("a", "dosr")])
+    # the index is not read again during the run, the baselines loaded at the start are written back
+    run_playbook(module, profile_output, [Task("a", "capable"), Task("b", "dosr")],
+                 before_tasks=lambda: os.unlink(profile_output + '.baselines.json'))
+    assert read_records(profile_output)[-1]['compared'] == 1
+    with open(profile_output + '.baselines.json') as f:
+        assert set(json.load(f)) == {"a\0sandbox", "b\0sandbox"}
+
+def test_baselines_index_is_built_from_the_history(load_plugin, tmp_path):
+    module = load_plugin('callback', 'capable')
+    profile_output = str(tmp_path / "profile.jsonl")
+    run_playbook(module, profile_output, [Task("a", "dosr")])
+    os.unlink(profile_output + '.baselines.json')
+    run_playbook(module, profile_output, [Task("a", "capable")])
+    assert read_records(profile_output)[-1]['compared'] == 1
+
+def test_concurrent_baselines_are_kept(load_plugin, tmp_path):
+    module = load_plugin('callback', 'capable')
+    profile_output = str(tmp_path / "profile.jsonl")
+    run_playbook(module, profile_output, [Task("a", "dosr")])
+    # another playbook sharing the profile finishes while this one runs
+    run_playbook(module, profile_output, [Task("b", "dosr")],
+                 before_tasks=lambda: run_playbook(module, profile_output, [Task("c", "dosr")], host="other"))
+    with open(profile_output + '.baselines.json') as f:
+        assert set(json.load(f)) == {"a\0sandbox", "b\0sandbox", "c\0other"}
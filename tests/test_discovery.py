@@ -0,0 +1,67 @@
+import os
+import ipaddress
+import json
+
+import pytest
+
+from rootasansible.discovery import CAPABLE_SHARDS_DIR, discovery_command, discovery_env, invalidate_discovery_cache, reduce_policy_fragments
+from rootasansible.sandbox import SANDBOX_CONTAINER, SANDBOX_IP, SANDBOX_NETWORK, sandbox_container, sandbox_ip
+from tests.test_policy_fragments import fragment, write_archive
+
+def test_sandbox_addresses():
+    assert sandbox_ip(0) == SANDBOX_IP
+    assert sandbox_container(0) == SANDBOX_CONTAINER
+    assert sandbox_container(3) == f"{SANDBOX_CONTAINER}-3"
+    addresses = {sandbox_ip(i) for i in range(200)}
+    assert len(addresses) == 200 and all(ipaddress.ip_address(a) in SANDBOX_NETWORK for a in addresses)
+    last = int(SANDBOX_NETWORK.broadcast_address) - int(ipaddress.ip_address(SANDBOX_IP)) - 1
+    assert sandbox_ip(last)
+    for index in (-1, last + 1):
+        with pytest.raises(ValueError):
+            sandbox_ip(index)
+
+def test_discovery_command(tmp_path, monkeypatch):
+    monkeypatch.delenv('ANSIBLE_CAPABLE_CACHE_DIR', raising=False)
+    cmd = discovery_command("playbooks/main.yml")
+    assert cmd[:2] == ["ansible-playbook", "playbooks/main.yml"] and "capable" in cmd
+    assert not any(arg.startswith("ansible_capable_shards_dir") for arg in cmd)
+    cache = tmp_path / "discovery"
+    cmd = discovery_command("playbooks/main.yml", discovery_cache=str(cache))
+    # the cache implies the sharded discovery and starts a new journal
+    assert f"ansible_capable_shards_dir={CAPABLE_SHARDS_DIR}" in cmd
+    assert (cache / "journal.jsonl").read_text() == ""
+    assert os.environ['ANSIBLE_CAPABLE_CACHE_DIR'] == str(cache)
+
+def test_discovery_runs_without_pipelining(monkeypatch):
+    # ansible.cfg enables pipelining, which the capable become plugin cannot honour on every ansible-core release
+    monkeypatch.setenv('ANSIBLE_PIPELINING', "True")
+    env = discovery_env()
+    assert env['ANSIBLE_PIPELINING'] == "False"
+    assert env['PATH'] == os.environ['PATH']
+
+def test_reduce_policy_fragments_with_the_discovery_cache(tmp_path):
+    shards = tmp_path / "shards"
+    shards.mkdir()
+    traced = fragment("r", "traced", ["CAP_CHOWN"], {"/a": "R"})
+    write_archive(shards / "sandbox.tgz", {"sandbox/traced.json": traced})
+    cache = tmp_path / "cache"
+    (cache / "fragments").mkdir(parents=True)
+    cached = fragment("r", "cached", ["CAP_KILL"], {"/b": "W"})
+    (cache / "fragments" / "h2.json").write_text(json.dumps(cached))
+    (cache / "journal.jsonl").write_text(
+        json.dumps({"task": "traced", "host": "sandbox", "hash": "h1", "hit": False}) + "\n" +
+        json.dumps({"task": "cached", "host": "sandbox", "hash": "h2", "hit": True}) + "\n" +
+        json.dumps({"task": "gone", "host": "sandbox", "hash": "h3", "hit": True}) + "\n")
+
+    output = tmp_path / "result.json"
+    reduce_policy_fragments([str(shards)], str(output), discovery_cache=str(cache))
+    policy = json.loads(output.read_text())
+    assert [t["name"] for t in policy["roles"][0]["tasks"]] == ["traced", "cached"]
+    # the traced fragment is cached for the next discovery
+    assert json.loads((cache / "fragments" / "h1.json").read_text()) == traced
+
+def test_discovery_cache_invalidation(tmp_path):
+    (tmp_path / "discovery" / "fragments").mkdir(parents=True)
+    invalidate_discovery_cache(str(tmp_path))
+    assert not (tmp_path / "discovery").exists()
+    invalidate_discovery_cache(str(tmp_path))
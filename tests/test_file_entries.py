@@ -0,0 +1,16 @@
+from rootasansible.policy import keep_leaf_entries, leaf_path_index, minimise_file_entries
+
+def test_leaf_entries():
+    paths = {"/": "R", "/etc": "R", "/etc/ssl": "R", "/etc/sslx": "R", "/var/a": "W", "/var/a/b": "W"}
+    assert keep_leaf_entries(paths) == {"/etc/ssl": "R", "/etc/sslx": "R", "/var/a/b": "W"}
+    leaves, collapsed = leaf_path_index(paths)
+    assert collapsed == {"/": ["/etc", "/var/a"], "/etc": ["/etc/ssl", "/etc/sslx"], "/var/a": ["/var/a/b"]}
+
+def test_keep_leaf_entries_compares_path_components():
+    assert keep_leaf_entries({"/a/b": "R", "/a/bc": "R", "/a/b/c": "W"}) == {"/a/bc": "R", "/a/b/c": "W"}
+    assert keep_leaf_entries({}) == {}
+
+def test_minimise_file_entries_keeps_wider_intermediate_entries():
+    files = {"/": "R", "/etc": "RW", "/etc/ssl": "R", "/etc/ssl/certs": "R", "/tmp": "R", "/tmp/x": "W"}
+    # /etc grants more than / so it is kept, /etc/ssl is granted by /etc, the leaves are always kept
+    assert minimise_file_entries(files) == {"/": "R", "/etc": "RW", "/etc/ssl/certs": "R", "/tmp/x": "W"}
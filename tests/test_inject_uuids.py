@@ -0,0 +1,163 @@
+import os
+import re
+
+import pytest
+import yaml
+
+from rootasansible.playbooks import RoleIndex, inject_uuids, load_manifest
+from rootasansible.vendoring import TreeSync
+
+TASK_FLAGS = re.compile(r'^-r (\S+) -t ([0-9a-f-]{36})$')
+
+@pytest.fixture(autouse=True)
+def search_paths(tmp_path, monkeypatch):
+    # roles and collections installed on the host must not leak into the trees of the tests
+    monkeypatch.setenv('ANSIBLE_ROLES_PATH', str(tmp_path / "no_roles"))
+    monkeypatch.setenv('ANSIBLE_COLLECTIONS_PATH', str(tmp_path / "no_collections"))
+    monkeypatch.delenv('ANSIBLE_CONFIG', raising=False)
+
+def write(root, relpath, data):
+    path = root / relpath
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(data if isinstance(data, str) else yaml.safe_dump(data, sort_keys=False))
+    return path
+
+def read(root, relpath):
+    return yaml.safe_load((root / relpath).read_text())
+
+def flags(task):
+    match = TASK_FLAGS.match(task.get('become_flags', ''))
+    return match.groups() if match else None
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "tree"
+    write(root, "playbooks/main.yml", [
+        {'hosts': 'all', 'become': True, 'tasks': [
+            {'name': 'Install', 'apt': {'name': 'nginx'}},
+            {'name': 'As user', 'become': False, 'command': 'id'},
+            {'name': 'With sudo', 'become_method': 'sudo', 'command': 'id'},
+            {'import_tasks': '../tasks/common.yml'},
+            {'block': [{'name': 'In block', 'command': 'ls'}]},
+            {'import_tasks': '{{ tasks_dir }}/templated.yml'},
+        ]},
+        {'hosts': 'all', 'tasks': [
+            {'import_tasks': '../tasks/common.yml'},
+            {'import_tasks': '../tasks/user.yml'},
+        ]},
+    ])
+    write(root, "tasks/common.yml", [{'name': 'Common', 'command': 'ls'}, {'name': 'Common', 'command': 'ls'}])
+    write(root, "tasks/user.yml", [{'name': 'User', 'command': 'ls'}])
+    write(root, "tasks/templated.yml", [{'name': 'Templated', 'command': 'ls'}])
+    return root
+
+def test_inject_uuids_tags_the_become_tasks(tree):
+    inject_uuids(str(tree))
+    tasks = read(tree, "playbooks/main.yml")[0]['tasks']
+    assert flags(tasks[0])[0] == os.path.join("playbooks", "main.yml")
+    assert 'become_flags' not in tasks[1]
+    assert 'become_flags' not in tasks[2]
+    assert flags(tasks[4]['block'][0])
+    # included from a become play and from a play without become: become wins
+    common = read(tree, "tasks/common.yml")
+    assert [flags(t)[0] for t in common] == [os.path.join("tasks", "common.yml")] * 2
+    assert flags(common[0])[1] != flags(common[1])[1]
+    assert 'become_flags' not in read(tree, "tasks/user.yml")[0]
+    # the become of a templated import is not known statically, the capable callback tags its tasks at run time
+    assert flags(read(tree, "tasks/templated.yml")[0]) is None
+
+def test_inject_uuids_is_idempotent(tree):
+    inject_uuids(str(tree))
+    before = {p: (tree / p).read_text() for p in ("playbooks/main.yml", "tasks/common.yml")}
+    inject_uuids(str(tree))
+    assert {p: (tree / p).read_text() for p in before} == before
+
+def test_manifest_skips_unchanged_files_and_keeps_identifiers(tree, tmp_path):
+    manifest = str(tmp_path / "manifest.json")
+    inject_uuids(str(tree), manifest_path=manifest)
+    common = read(tree, "tasks/common.yml")
+    mtime = os.stat(tree / "playbooks/main.yml").st_mtime_ns
+
+    # a changed file is scanned again, its unchanged tasks keep their identifiers
+    write(tree, "tasks/common.yml", [{'name': 'Common', 'command': 'ls'}, {'name': 'Common', 'command': 'ls'},
+                                     {'name': 'New', 'command': 'pwd'}])
+    inject_uuids(str(tree), manifest_path=manifest)
+    updated = read(tree, "tasks/common.yml")
+    assert [flags(t) for t in updated[:2]] == [flags(t) for t in common]
+    assert flags(updated[2]) and flags(updated[2]) not in [flags(t) for t in common]
+    assert os.stat(tree / "playbooks/main.yml").st_mtime_ns == mtime
+
+def test_manifest_and_jobs_agree_with_a_fresh_run(tree, tmp_path):
+    fresh = tmp_path / "fresh"
+    TreeSync(str(tree), str(fresh), mode='copy').sync()
+    inject_uuids(str(tree), manifest_path=str(tmp_path / "manifest.json"))
+    inject_uuids(str(tree), manifest_path=str(tmp_path / "manifest.json"))
+    inject_uuids(str(fresh), jobs=2)
+
+    def shape(root):
+        return {str(p.relative_to(root)): len(re.findall(r'become_flags: -r \S+ -t ', p.read_text()))
+                for p in sorted(root.rglob("*.yml"))}
+    assert sum(shape(fresh).values()) == 7
+    assert shape(tree) == shape(fresh)
+
+@pytest.fixture
+def roles_tree(tmp_path, monkeypatch):
+    root = tmp_path / "tree"
+    write(root, "ansible.cfg", "[defaults]\nroles_path = shared_roles\ncollections_path = collections_dir\n")
+    monkeypatch.delenv('ANSIBLE_ROLES_PATH')
+    monkeypatch.delenv('ANSIBLE_COLLECTIONS_PATH')
+    write(root, "playbooks/site.yml", [
+        {'hosts': 'all', 'become': True, 'collections': ['acme.tools'], 'roles': ['web', {'role': 'plain', 'become': False}], 'tasks': [
+            {'include_role': {'name': 'lib', 'tasks_from': 'extra'}},
+            {'include_role': {'name': '{{ role_name }}'}},
+            {'include_role': {'name': 'missing'}},
+        ]},
+        {'hosts': 'all', 'tasks': [{'include_role': {'name': 'applied', 'apply': {'become': True}}}]},
+    ])
+    write(root, "shared_roles/web/tasks/main.yml", [{'name': 'Web', 'command': 'ls'}])
+    write(root, "shared_roles/web/meta/main.yml", {'dependencies': [{'role': 'base', 'become': False}, 'common']})
+    write(root, "shared_roles/base/tasks/main.yml", [{'name': 'Base', 'command': 'ls'}])
+    write(root, "shared_roles/common/tasks/main.yml", [{'name': 'Common', 'command': 'ls'}])
+    write(root, "playbooks/roles/plain/tasks/main.yml", [{'name': 'Plain', 'command': 'ls'}])
+    write(root, "playbooks/roles/applied/tasks/main.yml", [{'name': 'Applied', 'command': 'ls'}])
+    write(root, "collections_dir/ansible_collections/acme/tools/roles/lib/tasks/extra.yml", [{'name': 'Lib', 'command': 'ls'}])
+    return root
+
+def test_role_index_follows_the_ansible_search_order(roles_tree):
+    roles = RoleIndex(str(roles_tree))
+    base_dir = str(roles_tree / "playbooks")
+    assert roles.resolve(base_dir, 'web') == str(roles_tree / "shared_roles" / "web")
+    assert roles.resolve(base_dir, 'plain') == str(roles_tree / "playbooks" / "roles" / "plain")
+    assert roles.resolve(base_dir, 'lib', ('acme.tools',)) == str(roles_tree / "collections_dir" / "ansible_collections"
+                                                                   / "acme" / "tools" / "roles" / "lib")
+    assert roles.resolve(base_dir, 'acme.tools.lib') == roles.resolve(base_dir, 'lib', ('acme.tools',))
+    assert roles.resolve(base_dir, 'missing') is None
+    assert roles.resolve(base_dir, '{{ role_name }}') is None
+    assert [(os.path.basename(d), mode) for d, mode in roles.dependencies(roles.resolve(base_dir, 'web'))] == \
+        [('base', False), ('common', None)]
+    coverage = roles.coverage()
+    assert coverage['missing'] == ['missing'] and coverage['templated'] == ['{{ role_name }}']
+
+def test_role_index_fingerprint_tracks_the_indexed_roles(roles_tree):
+    fingerprint = RoleIndex(str(roles_tree)).fingerprint()
+    assert RoleIndex(str(roles_tree)).fingerprint() == fingerprint
+    write(roles_tree, "shared_roles/new/tasks/main.yml", [{'name': 'New', 'command': 'ls'}])
+    assert RoleIndex(str(roles_tree)).fingerprint() != fingerprint
+
+def test_inject_uuids_follows_roles_and_their_become(roles_tree):
+    inject_uuids(str(roles_tree))
+    tagged = lambda relpath: bool(flags(read(roles_tree, relpath)[0]))
+    assert tagged("shared_roles/web/tasks/main.yml")
+    assert not tagged("shared_roles/base/tasks/main.yml")
+    assert tagged("shared_roles/common/tasks/main.yml")
+    assert not tagged("playbooks/roles/plain/tasks/main.yml")
+    assert tagged("playbooks/roles/applied/tasks/main.yml")
+    assert tagged("collections_dir/ansible_collections/acme/tools/roles/lib/tasks/extra.yml")
+
+def test_manifest_is_rescanned_when_the_role_index_changes(roles_tree, tmp_path):
+    manifest = str(tmp_path / "manifest.json")
+    inject_uuids(str(roles_tree), manifest_path=manifest)
+    assert load_manifest(manifest, RoleIndex(str(roles_tree)).fingerprint())
+    write(roles_tree, "shared_roles/new/tasks/main.yml", [{'name': 'New', 'command': 'ls'}])
+    entries = load_manifest(manifest, RoleIndex(str(roles_tree)).fingerprint())
+    assert entries and all(e['digest'] is None for e in entries.values())
@@ -0,0 +1,94 @@
+import re
+
+import pytest
+
+from rootasansible.policy import ANCHORED_COMMAND, collapse_commands, compact_roles, mergeable_regex
+
+SAMPLES = ["/usr/bin/apt", "install", "x", "y", "", "ab", "a", "b", "xy", "aa", "12", "1", "|", "-c echo", "-c echo && sleep 0",
+           "X", "[", "]", "a|b", "install nginx", "remove nginx", "remove"]
+
+REGEXES = [
+    "x",
+    "y",
+    "a|b",               # top-level alternation, would escape the anchors
+    "(a)\\1",            # capture group and backreference, would shift
+    "(?i)x",             # inline flags apply to the whole regex
+    "(?:install|remove)( nginx)?",
+    "[|]",
+    "[]|]",
+    "\\d+",
+    "a\\|b",
+    "-c echo( && sleep 0)?",
+]
+
+@pytest.mark.parametrize("regexes", [REGEXES, REGEXES[::-1], ["x", "y"], ["a|b", "x"], ["(a)\\1", "(a)\\1"]])
+def test_collapsed_regexes_match_what_the_separate_ones_matched(regexes):
+    commands = [f"/bin/a '^{r}$'" for r in regexes]
+    collapsed = collapse_commands({"default": "none", "add": commands})["add"]
+    for line in SAMPLES:
+        separate = any(re.fullmatch(r, line) for r in regexes)
+        merged = any(re.fullmatch(ANCHORED_COMMAND.match(c).group(2), line) for c in collapsed)
+        assert merged == separate, (line, collapsed)
+
+@pytest.mark.parametrize("regex,mergeable", [
+    ("x", True),
+    ("x(?:y|z)", True),
+    ("[|]", True),
+    ("[^]|]", True),
+    ("a\\|b", True),
+    ("a|b", False),
+    ("(x)", False),
+    ("(?P<n>x)(?P=n)", False),
+    ("x\\1", False),
+    ("(?i)x", False),
+    ("[[:alpha:]]", False),
+    ("x)", False),
+    ("(?:x", False),
+])
+def test_mergeable_regex(regex, mergeable):
+    assert mergeable_regex(regex) == mergeable
+
+def test_collapse_commands_merges_and_deduplicates():
+    commands = {"default": "none", "add": [
+        "/usr/bin/apt '^install x$'", "/usr/bin/id -u", "/usr/bin/apt '^install y$'",
+        "/usr/bin/apt '^a|b$'", "/usr/bin/id -u", "/bin/sh '^-c x$'",
+    ]}
+    assert collapse_commands(commands) == {"default": "none", "add": [
+        "/usr/bin/apt '^(?:install x|install y)$'", "/usr/bin/id -u", "/usr/bin/apt '^a|b$'", "/bin/sh '^-c x$'",
+    ]}
+    # the input is left untouched
+    assert len(commands["add"]) == 6
+
+def test_collapse_commands_keeps_literal_named_after_an_executable():
+    commands = {"add": ["/bin/a", "/bin/a '^x$'", "/bin/a '^y$'"]}
+    assert collapse_commands(commands)["add"] == ["/bin/a", "/bin/a '^(?:x|y)$'"]
+
+def test_collapse_commands_ignores_other_shapes():
+    assert collapse_commands("all") == "all"
+    assert collapse_commands({"default": "all"}) == {"default": "all"}
+
+def task(purpose, capabilities=("CHOWN",), files=None, name=None):
+    return {"purpose": purpose, "name": name, "cred": {"capabilities": list(capabilities), "files": files or {"/etc": "R"}},
+            "commands": "all"}
+
+def test_compact_roles_merges_equivalent_tasks():
+    roles = [{"name": "r", "tasks": [
+        task("a", name="t1"),
+        task("b", capabilities=("KILL",), name="t2"),
+        # same credentials, commands and options as t1
+        task("c", name="t3"),
+        {**task("d", name="t4"), "commands": {"default": "none", "add": ["/bin/a '^x$'", "/bin/a '^y$'"]}},
+        {**task("e", name="t5"), "commands": {"default": "none", "add": ["/bin/a '^(?:x|y)$'"]}},
+    ]}]
+    aliases = compact_roles(roles)
+    assert aliases == {"t3": "t1", "t5": "t4"}
+    assert [t["name"] for t in roles[0]["tasks"]] == ["t1", "t2", "t4"]
+
+def test_compact_roles_minimises_file_entries_on_demand():
+    files = {"/etc": "RW", "/etc/ssl": "R", "/etc/ssl/private": "R", "/var/log/app": "W"}
+    roles = [{"name": "r", "tasks": [task("a", files=dict(files), name="t1")]}]
+    compact_roles(roles)
+    assert roles[0]["tasks"][0]["cred"]["files"] == files
+    compact_roles(roles, minimise_files=True)
+    # the leaf entries are kept, the intermediate directories granted by their ancestor are dropped
+    assert roles[0]["tasks"][0]["cred"]["files"] == {"/etc": "RW", "/etc/ssl/private": "R", "/var/log/app": "W"}
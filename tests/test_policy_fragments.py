@@ -0,0 +1,68 @@
+import io
+import os
+import json
+import tarfile
+
+import pytest
+
+from rootasansible.discovery import extract_archive, merge_policy_fragments
+
+def fragment(role, task, caps, files):
+    return {"version": "3.0", "roles": [{"name": role, "tasks": [
+        {"name": task, "cred": {"capabilities": caps, "files": files}, "commands": "all"}]}]}
+
+def test_merge_policy_fragments_first_fragment_wins():
+    a = fragment("r", "t", ["CAP_CHOWN"], {"/a": "R"})
+    b = fragment("r", "t", ["CAP_KILL"], {"/a": "W", "/b": "X"})
+    c = fragment("r", "u", [], {})
+    policy = merge_policy_fragments([a, None, b, c])
+    assert policy["version"] == "3.0"
+    assert [t["name"] for t in policy["roles"][0]["tasks"]] == ["t", "u"]
+    assert policy["roles"][0]["tasks"][0] == a["roles"][0]["tasks"][0]
+    assert merge_policy_fragments([]) == {"roles": []}
+
+def test_merge_policy_fragments_union_of_the_rights():
+    a = fragment("r", "t", ["CAP_CHOWN"], {"/a": "R"})
+    b = fragment("r", "t", ["CAP_KILL", "CAP_CHOWN"], {"/a": "XW", "/b": "X"})
+    task = merge_policy_fragments([a, b], union=True)["roles"][0]["tasks"][0]
+    assert task["cred"] == {"capabilities": ["CAP_CHOWN", "CAP_KILL"], "files": {"/a": "RWX", "/b": "X"}}
+
+def add_file(tar, name, content=b"{}", **attributes):
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    for key, value in attributes.items():
+        setattr(info, key, value)
+    tar.addfile(info, io.BytesIO(content))
+
+def write_archive(path, members):
+    with tarfile.open(path, "w:gz") as tar:
+        for name, content in members.items():
+            add_file(tar, name, json.dumps(content).encode())
+
+@pytest.mark.parametrize("data_filter", [True, False])
+def test_extract_archive(tmp_path, monkeypatch, data_filter):
+    if not data_filter:
+        monkeypatch.delattr(tarfile, 'data_filter', raising=False)
+    elif not hasattr(tarfile, 'data_filter'):
+        pytest.skip("tarfile.data_filter is not available")
+    archive = tmp_path / "host.tgz"
+    with tarfile.open(archive, "w:gz") as tar:
+        add_file(tar, "shards/t.json", mode=0o4777)
+    with tarfile.open(archive) as tar:
+        extract_archive(tar, str(tmp_path / "host"))
+    extracted = tmp_path / "host" / "shards" / "t.json"
+    assert extracted.read_bytes() == b"{}"
+    assert not os.stat(extracted).st_mode & 0o7022
+
+def test_extract_archive_fallback_skips_unsafe_members(tmp_path, monkeypatch):
+    monkeypatch.delattr(tarfile, 'data_filter', raising=False)
+    archive = tmp_path / "host.tgz"
+    with tarfile.open(archive, "w:gz") as tar:
+        add_file(tar, "../outside.json")
+        add_file(tar, "/absolute.json")
+        add_file(tar, "link.json", b"", type=tarfile.SYMTYPE, linkname="/etc/passwd")
+        add_file(tar, "kept.json")
+    with tarfile.open(archive) as tar:
+        extract_archive(tar, str(tmp_path / "host"))
+    assert sorted(os.listdir(tmp_path / "host")) == ["kept.json"]
+    assert not (tmp_path / "outside.json").exists()
@@ -0,0 +1,122 @@
+import os
+import re
+import json
+import random
+
+import pytest
+
+from rootasansible.matcher import CommandIndex, PolicyMatcher, check_command_log, parse_policy_command
+
+BASE_POLICY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scenario', 'templates', 'sr_rootasrole.json')
+
+def commands_of(task):
+    commands = task.get("commands")
+    if commands == "all":
+        return {"default": "all"}
+    if isinstance(commands, list):
+        return {"default": "none", "add": commands}
+    return commands if isinstance(commands, dict) else {}
+
+def command_matches(command, line):
+    exe, args, regex = parse_policy_command(command)
+    line_exe, _, line_args = line.partition(' ')
+    if regex is None:
+        return f"{exe} {args}".rstrip() == line
+    return exe == line_exe and re.search(regex, line_args) is not None
+
+def reference_matches(policy, line):
+    '''
+    Naive dosr ranking: every task is tested against the command line, exact commands
+    first, then regexes, then the tasks granting all commands, in policy order.
+    '''
+    line = line.strip()
+    ranked = []
+    index = 0
+    for role in policy["roles"]:
+        for i, task in enumerate(role["tasks"]):
+            commands = commands_of(task)
+            granted = [parse_policy_command(c)[2] is None for c in commands.get("add", []) if command_matches(c, line)]
+            if granted:
+                ranked.append((0 if any(granted) else 1, index, (role.get("name", role.get("purpose")), task.get("name", i))))
+            elif commands.get("default") == "all" and not any(command_matches(c, line) for c in commands.get("del", [])):
+                ranked.append((2, index, (role.get("name", role.get("purpose")), task.get("name", i))))
+            index += 1
+    return [match for _, _, match in sorted(ranked)]
+
+EXES = ["/usr/bin/apt", "/usr/bin/chown", "/bin/sh"]
+ARGS = ["install nginx", "install x", "-R root /srv", "-c ls", "remove nginx", "", "-R user /srv"]
+REGEXES = ["^install .*$", "^-R root .*$", "^(-c )?ls$", "^(a)\\1$", "^-R .*$", "^remove (nginx|apache)$"]
+
+def random_policy(rng, tasks):
+    roles = []
+    for r in range(3):
+        role = {"name": f"role{r}", "tasks": []}
+        for t in range(tasks):
+            commands = []
+            for _ in range(rng.randint(0, 3)):
+                exe = rng.choice(EXES)
+                commands.append(f"{exe} '{rng.choice(REGEXES)}'" if rng.random() < 0.5 else f"{exe} {rng.choice(ARGS)}".rstrip())
+            kind = rng.random()
+            if kind < 0.2:
+                task_commands = "all"
+            elif kind < 0.4:
+                task_commands = {"default": "all", "del": commands}
+            elif kind < 0.5:
+                task_commands = commands
+            else:
+                task_commands = {"default": "none", "add": commands}
+            role["tasks"].append({"name": f"task{t}", "commands": task_commands})
+        roles.append(role)
+    return {"roles": roles}
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matcher_ranks_as_a_linear_scan_would(seed):
+    rng = random.Random(seed)
+    policy = random_policy(rng, rng.randint(1, 6))
+    matcher = PolicyMatcher(policy)
+    for exe in EXES:
+        for args in ARGS:
+            line = f"{exe} {args}".rstrip()
+            expected = reference_matches(policy, line)
+            assert matcher.match_all(line) == expected, line
+            assert matcher.match(line) == (expected[0] if expected else None), line
+            # memoized
+            assert matcher.match(line) == (expected[0] if expected else None), line
+
+def test_command_index_falls_back_on_backreferences():
+    index = CommandIndex()
+    index.add("/bin/a '^(x)\\1$'", 0)
+    index.add("/bin/a '^(y)\\1$'", 1)
+    index.compile()
+    assert index.compiled["/bin/a"][0] is None
+    assert index.first("/bin/a yy", "/bin/a", "yy") == 1
+    assert index.all("/bin/a xx", "/bin/a", "xx") == [0]
+
+def test_command_index_prefers_literals_then_policy_order():
+    index = CommandIndex()
+    index.add("/bin/a '^.*$'", 0)
+    index.add("/bin/a '^x$'", 1)
+    index.add("/bin/a x", 2)
+    index.add("/bin/a x", 3)
+    index.compile()
+    assert index.first("/bin/a x", "/bin/a", "x") == 2
+    assert index.all("/bin/a x", "/bin/a", "x") == [2, 3, 0, 1]
+    assert index.first("/bin/a y", "/bin/a", "y") == 0
+    assert index.first("/bin/b y", "/bin/b", "y") is None
+
+def test_base_policy_reserved_tasks():
+    matcher = PolicyMatcher.from_file(BASE_POLICY)
+    assert matcher.match("/usr/bin/id -u") == ("rar_ansible", "ansible_id")
+    assert matcher.match("/bin/sh -c echo BECOME-SUCCESS-abc ; /usr/bin/python3 && sleep 0") == ("rar_ansible", "ansible_python")
+    assert matcher.match("/usr/bin/cat /etc/shadow") is None
+
+def test_check_command_log_reports_the_unauthorised_lines(tmp_path):
+    log = tmp_path / "commands.log"
+    log.write_text("/usr/bin/id -u\n\n/usr/bin/id -u\n/usr/bin/cat /etc/shadow\n")
+    report = tmp_path / "report.json"
+    assert check_command_log(BASE_POLICY, str(log), str(report)) == 1
+    with open(report) as f:
+        data = json.load(f)
+    assert data["commands"] == 3
+    assert data["authorised"] == [{"role": "rar_ansible", "task": "ansible_id", "count": 2}]
+    assert data["unauthorised"] == [{"command": "/usr/bin/cat /etc/shadow", "count": 1}]
@@ -0,0 +1,98 @@
+import io
+import json
+
+import pytest
+
+from rootasansible.policy import TASK_ALIASES, iter_json_array, merge_security_policies
+
+DOCUMENTS = [
+    {"roles": []},
+    {"roles": [1, -2.5e3, "x", None, True, {"a": [1, 2]}]},
+    {"version": "3.0", "storage": {"roles": ["not", "these"]}, "roles": [{"name": "r1", "tasks": [{"name": "t\"]}"}]}],
+     "after": [12345678901234567890, {"roles": 1}]},
+    {"before": "}]\\\"", "roles": [[], {}, "{", 0.000125, 1e-7]},
+    {"other": 1},
+    {},
+]
+
+class Chunked(io.StringIO):
+    '''
+    Stream returning at most size characters per read, as a slow pipe would.
+    '''
+    def __init__(self, text, size):
+        super().__init__(text)
+        self.size = size
+
+    def read(self, n=-1):
+        return super().read(self.size if n < 0 else min(n, self.size))
+
+@pytest.mark.parametrize("document", DOCUMENTS)
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 1 << 16])
+def test_iter_json_array_matches_json_load(document, indent, chunk_size):
+    text = json.dumps(document, indent=indent)
+    expected = document.get("roles", [])
+    assert list(iter_json_array(io.StringIO(text), "roles", chunk_size=chunk_size)) == expected
+    assert list(iter_json_array(Chunked(text, 3), "roles", chunk_size=chunk_size)) == expected
+
+@pytest.mark.parametrize("text", ['[]', '{"roles": [1,,2]}', '{"roles": [1, 2}', '{"roles" [1]}', '{"roles": [1]'])
+def test_iter_json_array_rejects_malformed_documents(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), "roles", chunk_size=2))
+
+def task(purpose, capabilities=("CHOWN",), files=None, name=None):
+    t = {"purpose": purpose, "cred": {"capabilities": list(capabilities), "files": files or {"/etc": "R"}},
+         "commands": "all"}
+    if name:
+        t["name"] = name
+    return t
+
+@pytest.fixture
+def build_dir(tmp_path):
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    (templates / "sr_rootasrole.json").write_text(json.dumps({"version": "3.0", "roles": [
+        {"name": "rar_ansible", "tasks": [{"name": "ansible_id", "commands": "all"}]}]}))
+    (templates / "sr_scenario.json").write_text(json.dumps({"version": "3.0", "roles": [
+        {"purpose": "playbooks/scenario.yml", "tasks": [task("install"), task("copy", capabilities=("KILL",)),
+                                                        task("install")]},
+        {"purpose": "roles/other/tasks/main.yml", "tasks": [task("other")]},
+    ]}))
+    (templates / "result.json").write_text(json.dumps({"version": "3.0", "roles": [
+        {"name": "unrelated", "purpose": "elsewhere.yml", "tasks": [{"name": "x", "purpose": "install"}]},
+        {"name": "playbooks/scenario.yml", "purpose": "playbooks/scenario.yml", "tasks": [
+            {"name": "id-1", "purpose": "install"}, {"name": "id-2", "purpose": "copy"}, {"name": "id-3", "purpose": "install"}]},
+    ], "storage": {"method": "json"}}))
+    (tmp_path / "playbooks").mkdir()
+    (tmp_path / "playbooks" / "scenario.yml").write_text(
+        "- hosts: all\n  tasks:\n  - become_flags: -r playbooks/scenario.yml -t id-3\n")
+    return tmp_path
+
+def merged(build_dir):
+    with open(build_dir / "templates" / "result_sr_rootasrole.json") as f:
+        return json.load(f)
+
+def test_merge_security_policies_names_and_compacts_the_scenario_roles(build_dir):
+    merge_security_policies(str(build_dir))
+    roles = merged(build_dir)["roles"]
+    assert [r.get("name") for r in roles] == ["rar_ansible", "playbooks/scenario.yml", None]
+    # duplicate purposes are named by order, then the equivalent tasks are merged into the first
+    assert [t["name"] for t in roles[1]["tasks"]] == ["id-1", "id-2"]
+    assert "name" not in roles[2]["tasks"][0]
+    with open(build_dir / TASK_ALIASES) as f:
+        assert json.load(f) == {"id-3": "id-1"}
+    assert "-t id-1" in (build_dir / "playbooks" / "scenario.yml").read_text()
+
+def test_merge_security_policies_without_compaction(build_dir):
+    merge_security_policies(str(build_dir), compact=False)
+    assert [t["name"] for t in merged(build_dir)["roles"][1]["tasks"]] == ["id-1", "id-2", "id-3"]
+    with open(build_dir / TASK_ALIASES) as f:
+        assert json.load(f) == {}
+    assert "-t id-3" in (build_dir / "playbooks" / "scenario.yml").read_text()
+
+def test_merge_security_policies_pretty_output_is_the_same_policy(build_dir, tmp_path):
+    merge_security_policies(str(build_dir), compact=False)
+    compact = merged(build_dir)
+    merge_security_policies(str(build_dir), pretty=True, compact=False)
+    assert merged(build_dir) == compact
+    assert "\n    " in (build_dir / "templates" / "result_sr_rootasrole.json").read_text()
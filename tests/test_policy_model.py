@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+import copy
+
+import pytest
+
+from rootasansible.model import ALL_CAPABILITIES, CAPABILITY_BITS, Policy, PolicyInterner, access_mask, capabilities_mask, capability_mask, capability_names, compare_policies
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(TESTS_DIR, '..', 'scenario', 'templates')
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'benchmarks'))
+from synthetic import synthetic_policies  # noqa: E402
+
+def load(name):
+    with open(os.path.join(TEMPLATES_DIR, name)) as f:
+        return json.load(f)
+
+def policy(*tasks, role="r"):
+    return {"version": "3.0", "roles": [{"name": role, "tasks": [
+        {"name": f"t{i}", **task} for i, task in enumerate(tasks)]}]}
+
+def rights(caps=("CHOWN",), files=None, commands="all"):
+    return {"cred": {"setuid": "root", "capabilities": list(caps), "files": files or {"/etc/app": "RW"}}, "commands": commands}
+
+IRREGULAR = {"version": "3.0", "storage": {"method": "json"}, "options": {"timeout": 5}, "roles": [
+    {"purpose": "p", "actors": [{"type": "group", "groups": ["ansible"]}], "tasks": [
+        {"purpose": "x", "cred": {"capabilities": {"default": "all", "sub": ["CAP_SYS_ADMIN"]}, "files": {"/a": "WR", "/b": ""}},
+         "commands": {"default": "all", "del": ["/bin/sh"]}, "options": {"env": "keep"}},
+        {"commands": ["/usr/bin/id -u"], "cred": {"capabilities": "none", "setgid": ["root", "ansible"]}, "name": "y"},
+        {"name": "z", "cred": {"capabilities": "all", "files": {}}},
+    ]},
+]}
+
+@pytest.mark.parametrize("document", [load("sr_rootasrole.json"), load("sr_scenario.json"), IRREGULAR])
+def test_round_trip_is_lossless(document):
+    dumped = Policy.load(copy.deepcopy(document)).to_json()
+    # the same keys in the same order
+    assert json.dumps(dumped) == json.dumps(document)
+
+def test_synthetic_round_trip(tmp_path):
+    synthetic_policies(str(tmp_path), 200, files_per_task=5)
+    for name in ("result.json", "sr_scenario.json"):
+        with open(tmp_path / name) as f:
+            document = json.load(f)
+        assert Policy.load(copy.deepcopy(document)).to_json() == document
+
+def test_interner_shares_equal_parts():
+    interner = PolicyInterner()
+    a = Policy.load(load("sr_scenario.json"), interner)
+    b = Policy.load(load("sr_scenario.json"), interner)
+    for role_a, role_b in zip(a.roles, b.roles):
+        for task_a, task_b in zip(role_a.tasks, role_b.tasks):
+            assert task_a.cred is task_b.cred and task_a.commands is task_b.commands
+
+def test_capability_masks():
+    assert capability_mask(["CAP_CHOWN", "kill"]) == CAPABILITY_BITS["CHOWN"] | CAPABILITY_BITS["KILL"]
+    assert capabilities_mask({"default": "all", "del": ["SYS_ADMIN"]}) == \
+        ALL_CAPABILITIES & ~CAPABILITY_BITS["SYS_ADMIN"]
+    assert capabilities_mask("none") == capabilities_mask(None) == 0
+    assert capability_names(capability_mask(["SETUID", "CHOWN"])) == ["CAP_CHOWN", "CAP_SETUID"]
+    with pytest.raises(ValueError):
+        capability_mask(["CAP_UNKNOWN"])
+
+def test_inclusion():
+    reference = Policy.load(policy(rights(("CHOWN", "KILL")), rights()))
+    same = Policy.load(policy(rights(("CHOWN", "KILL")), rights()))
+    less = Policy.load(policy(rights(("CHOWN",)), rights()))
+    more = Policy.load(policy(rights(("CHOWN", "KILL")), rights(files={"/etc/app": "RWX"})))
+    assert same <= reference and not same < reference
+    assert less <= reference and less < reference
+    assert not more <= reference
+    assert more.exceeding(reference) == [("r", "t1")]
+    # a task missing from the reference exceeds it, one missing from the policy makes it less privileged
+    fewer = Policy.load(policy(rights(("CHOWN", "KILL"))))
+    assert fewer < reference and reference.exceeding(fewer) == [("r", "t1")]
+
+def test_file_access_below_a_recursive_pattern():
+    reference = Policy.load(policy(rights(files={"/etc/**": "R", "/var/log": "W"})))
+    assert Policy.load(policy(rights(files={"/etc/app/conf": "R"}))) <= reference
+    # only the "/**" patterns grant the hierarchy below them
+    assert not Policy.load(policy(rights(files={"/var/log/app": "W"}))) <= reference
+    assert not Policy.load(policy(rights(files={"/etc/app/conf": "W"}))) <= reference
+
+def test_commands_inclusion():
+    all_but_sh = Policy.load(policy(rights(commands={"default": "all", "del": ["/bin/sh"]})))
+    assert Policy.load(policy(rights(commands=["/usr/bin/id"]))) <= all_but_sh
+    assert not Policy.load(policy(rights(commands=["/bin/sh"]))) <= all_but_sh
+    assert not Policy.load(policy(rights(commands="all"))) <= all_but_sh
+    assert all_but_sh < Policy.load(policy(rights(commands="all")))
+
+def test_union_and_intersection_bound_both_policies():
+    a = Policy.load(policy(rights(("CHOWN",), {"/a": "R", "/b": "W"}, ["/bin/a"]), rights(("KILL",))))
+    b = Policy.load(policy(rights(("KILL",), {"/a": "W"}, ["/bin/b"]), rights(("KILL",)), rights(("SETUID",))))
+    union, intersection = a | b, a & b
+    for p in (a, b):
+        assert p <= union
+        assert intersection <= p
+    assert Policy.load(union.to_json()) <= union
+    t0 = union.tasks()[("r", "t0")]
+    assert t0.cred.files() == {"/a": access_mask("RW"), "/b": access_mask("W")}
+    assert t0.commands.to_json() == {"default": "none", "add": ["/bin/a", "/bin/b"]}
+    assert set(intersection.tasks()) == {("r", "t0"), ("r", "t1")}
+    assert intersection.tasks()[("r", "t0")].cred.caps == 0
+
+def test_compare_policies(tmp_path):
+    reference, less = tmp_path / "reference.json", tmp_path / "less.json"
+    reference.write_text(json.dumps(policy(rights(("CHOWN", "KILL")))))
+    less.write_text(json.dumps(policy(rights(("CHOWN",)))))
+    assert compare_policies(str(reference), str(less))
+    assert not compare_policies(str(less), str(reference))
@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+import stat
+import logging
+import time
+
+import pytest
+
+from rootasansible.steps import StepRunner
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+def test_run_streams_the_output_and_records_the_step(tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    runner = StepRunner()
+    log_path = tmp_path / "step.log"
+    code = runner.run_sync("greet", python("import os; print('hello'); print(os.environ['STEP_VAR']); exit(3)"),
+                           env=dict(os.environ, STEP_VAR="from env"), log_path=str(log_path))
+    assert code == 3
+    assert log_path.read_text() == "hello\nfrom env\n"
+    assert "[greet] hello" in caplog.text
+    step = runner.timeline[0]
+    assert step["step"] == "greet" and step["returncode"] == 3 and step["duration"] >= 0
+
+def test_gather_runs_the_steps_concurrently():
+    runner = StepRunner()
+    start = time.monotonic()
+    codes = runner.gather(*(runner.run(f"sleep{i}", python(f"import time; time.sleep(0.5); exit({i})")) for i in range(4)))
+    assert codes == [0, 1, 2, 3]
+    assert time.monotonic() - start < 1.5
+    assert sorted(s["step"] for s in runner.timeline) == ["sleep0", "sleep1", "sleep2", "sleep3"]
+
+def test_in_process_steps_record_failures(tmp_path):
+    runner = StepRunner()
+    with runner.step("ok"):
+        pass
+    with pytest.raises(RuntimeError):
+        with runner.step("failed"):
+            raise RuntimeError()
+    assert [(s["step"], s["returncode"]) for s in runner.timeline] == [("ok", 0), ("failed", 1)]
+    runner.save(str(tmp_path / "timeline.json"))
+    assert len(json.loads((tmp_path / "timeline.json").read_text())["steps"]) == 2
+
+def test_ansible_json_events_are_saved_and_counted(tmp_path, monkeypatch):
+    # stand-in ansible-playbook printing the events of the ansible.posix.jsonl callback
+    events = [
+        {"_event": "v2_playbook_on_task_start", "task": {"name": "Install"}},
+        {"_event": "v2_runner_on_ok", "hosts": {"a": {}, "b": {}}},
+        {"_event": "v2_runner_on_failed", "hosts": {"a": {}}},
+    ]
+    script = tmp_path / "bin" / "ansible-playbook"
+    script.parent.mkdir()
+    script.write_text(f"#!{sys.executable}\nimport os\nprint(os.environ['ANSIBLE_STDOUT_CALLBACK'])\n"
+                      + "".join(f"print({json.dumps(json.dumps(e))})\n" for e in events))
+    script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("PATH", f"{script.parent}{os.pathsep}{os.environ['PATH']}")
+    runner = StepRunner(json_events_dir=str(tmp_path / "events"))
+    assert runner.run_sync("scenario", ["ansible-playbook", "playbook.yml"]) == 0
+    saved = (tmp_path / "events" / "scenario.jsonl").read_text().splitlines()
+    assert [json.loads(line) for line in saved] == events
+    assert runner.timeline[0]["results"] == {"ok": 2, "failed": 1}
@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from rootasansible.vendoring import VENDOR_STATE, TreeSync
+
+def write(root, relpath, content):
+    path = root / relpath
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    return path
+
+def snapshot(root):
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]:
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, root)
+            if rel == VENDOR_STATE:
+                continue
+            files[rel] = ('link', os.readlink(path)) if os.path.islink(path) else open(path, 'rb').read()
+    return files
+
+@pytest.fixture
+def src(tmp_path):
+    root = tmp_path / "scenario"
+    write(root, "playbooks/main.yml", "- hosts: all\n")
+    write(root, "files/blob.bin", "blob")
+    write(root, "roles/web/tasks/main.yml", "- command: ls\n")
+    os.symlink("roles/web", root / "web")
+    return root
+
+def sync(src, dst, mode='auto'):
+    tree = TreeSync(str(src), str(dst), mode=mode)
+    stats = tree.sync()
+    tree.save()
+    return stats
+
+@pytest.mark.parametrize("mode", ['auto', 'reflink', 'hardlink', 'copy'])
+def test_sync_mirrors_the_source(src, tmp_path, mode):
+    dst = tmp_path / "build"
+    sync(src, dst, mode)
+    assert snapshot(dst) == snapshot(src)
+    # the playbooks are rewritten in place by inject_uuids, they never share the inode of the source
+    assert not os.path.samefile(src / "playbooks/main.yml", dst / "playbooks/main.yml")
+    linked = os.path.samefile(src / "files/blob.bin", dst / "files/blob.bin")
+    assert linked if mode == 'hardlink' else (mode == 'auto' or not linked)
+
+def test_second_sync_leaves_everything_untouched(src, tmp_path):
+    dst = tmp_path / "build"
+    sync(src, dst)
+    stats = sync(src, dst)
+    assert stats['unchanged'] == 4
+    assert stats['copied'] == stats['linked'] == stats['removed'] == 0
+
+def test_touched_source_with_the_same_content_is_unchanged(src, tmp_path):
+    dst = tmp_path / "build"
+    # hardlinked build files are touched along with their source
+    sync(src, dst, 'copy')
+    os.utime(src / "files/blob.bin", ns=(0, 0))
+    assert sync(src, dst, 'copy')['copied'] == 0
+    # the playbooks differ from the source once injected, their content hash is recorded the first time
+    os.utime(src / "playbooks/main.yml", ns=(0, 0))
+    assert sync(src, dst, 'copy')['copied'] == 1
+    os.utime(src / "playbooks/main.yml", ns=(10**9, 10**9))
+    assert sync(src, dst, 'copy')['copied'] == 0
+
+def test_sync_propagates_changes(src, tmp_path):
+    dst = tmp_path / "build"
+    sync(src, dst, 'copy')
+    write(src, "playbooks/main.yml", "- hosts: sandbox\n")
+    # modified in the build directory since the last save
+    write(dst, "files/blob.bin", "tampered")
+    write(dst, "extra/stale.yml", "- stale\n")
+    (src / "roles/web/tasks/main.yml").unlink()
+    (src / "roles/web/tasks").rmdir()
+    stats = sync(src, dst, 'copy')
+    assert snapshot(dst) == snapshot(src)
+    assert not (dst / "extra").exists() and not (dst / "roles/web/tasks").exists()
+    assert stats['copied'] == 2 and stats['removed'] == 2
+
+def test_corrupted_state_falls_back_to_a_full_compare(src, tmp_path):
+    dst = tmp_path / "build"
+    sync(src, dst)
+    (dst / VENDOR_STATE).write_text("{")
+    stats = sync(src, dst)
+    assert stats['unchanged'] == 0
+    assert snapshot(dst) == snapshot(src)